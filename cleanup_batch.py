@@ -0,0 +1,381 @@
+# Batch processing of several files, workbook sheets and zip archives.
+#
+# Inputs are expanded into items: each sheet of each Excel workbook, each other
+# supported file, and likewise for the files inside zip archives. Items are
+# grouped by schema (their column names in order), so one column mapping covers
+# every sheet laid out the same way. Items run in parallel, one per worker
+# process, each streamed chunk by chunk into its own output file; the outputs
+# can then be combined into a single file with the source file and sheet of
+# each row. An item that fails is reported and doesn't stop the others.
+import multiprocessing
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pandas as pd
+
+from cleanup_engine import CacheStats, active_tasks
+from cleanup_formats import INPUT_EXTENSIONS
+from cleanup_io import (
+    DEFAULT_CHUNK_ROWS,
+    ChunkWriter,
+    iter_chunks,
+    read_preview,
+    sheet_names,
+    stream_process,
+)
+from cleanup_profile import WRITE_STAGE, Profiler
+
+# Files or sheets processed at the same time
+DEFAULT_FILE_WORKERS = 2
+
+# Columns added in front of the combined output
+SOURCE_FILE_COLUMN = 'Source File'
+SOURCE_SHEET_COLUMN = 'Source Sheet'
+
+# Seconds between checks on running items for progress
+POLL_SECONDS = 0.2
+
+_UNSAFE_NAME = re.compile(r'[^\w.\- ]+')
+
+
+class BatchItem:
+    # Fields reported for each item (see to_dict)
+    FIELDS = ['name', 'sheet', 'schema', 'status', 'rows', 'seconds', 'error', 'output']
+
+    def __init__(self, path, name, sheet=None, columns=()):
+        # File on disk, and the name shown for it, e.g. "exports.zip/acme.xlsx"
+        self.path = path
+        self.name = name
+        self.sheet = sheet
+        self.columns = [str(column) for column in columns]
+        # Index of the item's schema in the batch, set by group_by_schema
+        self.schema = None
+        # 'queued', 'running', 'done', 'failed', 'skipped' (no mapping for its schema)
+        # or 'cancelled'
+        self.status = 'queued'
+        self.rows = 0
+        self.seconds = None
+        self.error = ''
+        self.output_path = None
+
+    @property
+    def label(self):
+        return f"{self.name} [{self.sheet}]" if self.sheet is not None else self.name
+
+    @property
+    def columns_key(self):
+        return tuple(self.columns)
+
+    def to_dict(self):
+        return {
+            'name': self.name, 'sheet': self.sheet, 'schema': self.schema, 'status': self.status,
+            'rows': self.rows, 'seconds': self.seconds, 'error': self.error,
+            'output': os.path.basename(self.output_path) if self.output_path else None,
+        }
+
+
+def _is_input(name):
+    base = os.path.basename(name)
+    extension = os.path.splitext(base)[1].lower().lstrip('.')
+    # Skip Office lock files and macOS metadata
+    return extension in INPUT_EXTENSIONS and not base.startswith(('~$', '._'))
+
+
+# Extract the supported files of a zip archive into directory, flattening
+# folders; returns [(path, name shown)]. Members are never written outside
+# directory, whatever their names.
+def _extract_zip(path, name, directory):
+    extracted = []
+    with zipfile.ZipFile(path) as archive:
+        for index, member in enumerate(archive.infolist()):
+            if member.is_dir() or '__MACOSX/' in member.filename or not _is_input(member.filename):
+                continue
+            base = _UNSAFE_NAME.sub('_', os.path.basename(member.filename))
+            target = os.path.join(directory, f"{index}-{base}")
+            with archive.open(member) as source, open(target, 'wb') as output:
+                while True:
+                    block = source.read(1 << 20)
+                    if not block:
+                        break
+                    output.write(block)
+            extracted.append((target, f"{name}/{member.filename}"))
+    return extracted
+
+
+# Expand (path, name) pairs into BatchItems: zip archives are extracted into
+# directory, and every sheet of a workbook becomes an item (only the first one
+# without all_sheets). Files that can't be read become failed items, so they
+# show up in the report.
+def expand_inputs(inputs, directory, all_sheets=True):
+    items = []
+    for path, name in inputs:
+        if os.path.splitext(str(name))[1].lower() == '.zip':
+            try:
+                members = _extract_zip(path, name, directory)
+            except (zipfile.BadZipFile, OSError) as e:
+                item = BatchItem(path, name)
+                item.status, item.error = 'failed', f"Can't open the zip archive: {e}"
+                items.append(item)
+                continue
+            items.extend(expand_inputs(members, directory, all_sheets))
+            continue
+
+        try:
+            sheets = sheet_names(path, name)
+            if not all_sheets:
+                sheets = sheets[:1]
+        except Exception as e:
+            item = BatchItem(path, name)
+            item.status, item.error = 'failed', str(e)
+            items.append(item)
+            continue
+        for sheet in sheets:
+            try:
+                columns = read_preview(path, name, rows=1, sheet=sheet).columns
+            except Exception as e:
+                item = BatchItem(path, name, sheet)
+                item.status, item.error = 'failed', str(e)
+            else:
+                item = BatchItem(path, name, sheet, columns)
+            items.append(item)
+    return items
+
+
+# {columns: [items]} for the items that could be read, in the order each schema
+# first appears; numbers each item's schema as it goes
+def group_by_schema(items):
+    groups = {}
+    for item in items:
+        if item.status == 'failed':
+            continue
+        group = groups.setdefault(item.columns_key, [])
+        group.append(item)
+    for index, group in enumerate(groups.values()):
+        for item in group:
+            item.schema = index
+    return groups
+
+
+# Output file names for the items, unique within the batch
+def assign_outputs(items, output_dir, output_format):
+    used = set()
+    for item in items:
+        stem = os.path.splitext(os.path.basename(item.name))[0]
+        if item.sheet is not None:
+            stem = f"{stem} - {item.sheet}"
+        stem = _UNSAFE_NAME.sub('_', stem).strip() or 'output'
+        candidate, number = stem, 2
+        while candidate.lower() in used:
+            candidate = f"{stem} ({number})"
+            number += 1
+        used.add(candidate.lower())
+        item.output_path = os.path.join(output_dir, f"{candidate}.{output_format}")
+
+
+# Runs in a worker process: stream one item into its output file. Progress goes
+# back through queue as (index, rows); cancelled, if set, stops the item.
+def _process_item(index, path, name, sheet, output_path, column_mappings, output_format, options,
+                  queue=None, cancelled=None):
+    started = time.perf_counter()
+    stats = CacheStats()
+    profiler = Profiler()
+
+    def progress(rows, message):
+        if cancelled is not None and cancelled.is_set():
+            raise InterruptedError("Cancelled")
+        if queue is not None:
+            queue.put((index, rows))
+
+    progress(0, "Starting...")
+    rows = stream_process(
+        path, name, output_path, column_mappings, output_format, progress_callback=progress,
+        stats=stats, profiler=profiler, sheet=sheet, **options
+    )
+    return rows, stats.counts, profiler.stages, time.perf_counter() - started
+
+
+# Raised from the progress callback of an item to stop the whole batch
+class _Stopped(Exception):
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error = error
+
+
+# Process every queued item with the mapping for its schema. mappings is
+# {columns: column mappings}; items whose schema has none are skipped. Outputs
+# go to output_dir (see assign_outputs). With file_workers > 1 items run in
+# that many worker processes at once. progress_callback, if given, is called as
+# progress_callback(items) whenever an item starts, moves on or finishes; it may
+# raise to cancel the batch. stats (a CacheStats) and profiler (a Profiler)
+# collect the totals over all items; options go to stream_process. executor,
+# from make_executor, is used for items run one at a time in this process.
+def run_batch(items, mappings, output_dir, output_format='csv', file_workers=DEFAULT_FILE_WORKERS,
+              progress_callback=None, stats=None, profiler=None, executor=None, **options):
+    os.makedirs(output_dir, exist_ok=True)
+    stats = stats if stats is not None else CacheStats()
+    profiler = profiler if profiler is not None else Profiler()
+    todo = []
+    for item in items:
+        if item.status != 'queued':
+            continue
+        if not active_tasks(mappings.get(item.columns_key, {})):
+            item.status, item.error = 'skipped', "No columns mapped for this layout"
+            continue
+        todo.append(item)
+    assign_outputs(todo, output_dir, output_format)
+
+    def report():
+        if progress_callback:
+            progress_callback(items)
+
+    def finish(item, seconds, result=None, error=None):
+        item.seconds = round(seconds, 3) if seconds is not None else None
+        if error is None:
+            item.rows, counts, timings = result
+            stats.merge(counts)
+            profiler.merge(timings)
+            item.status = 'done'
+        else:
+            item.status, item.error = 'failed', str(error) or type(error).__name__
+            if item.output_path and os.path.exists(item.output_path):
+                os.remove(item.output_path)
+        report()
+
+    report()
+    if file_workers <= 1 or len(todo) <= 1:
+        try:
+            for item in todo:
+                item.status = 'running'
+                report()
+                started = time.perf_counter()
+
+                def progress(rows, message, item=item):
+                    item.rows = rows
+                    try:
+                        report()
+                    except Exception as e:
+                        raise _Stopped(e) from e
+
+                try:
+                    rows = stream_process(
+                        item.path, item.name, item.output_path, mappings[item.columns_key], output_format,
+                        progress_callback=progress, stats=stats, profiler=profiler, sheet=item.sheet,
+                        executor=executor, **options
+                    )
+                except _Stopped as stopped:
+                    # The callback stopped the batch; anything else only fails this item
+                    raise stopped.error
+                except Exception as e:
+                    finish(item, time.perf_counter() - started, error=e)
+                else:
+                    finish(item, time.perf_counter() - started, (rows, {}, {}))
+        except BaseException:
+            _cancel_unfinished(todo)
+            raise
+        return items
+
+    context = multiprocessing.get_context('spawn')
+    try:
+        with context.Manager() as manager, ProcessPoolExecutor(
+            max_workers=min(file_workers, len(todo)), mp_context=context
+        ) as pool:
+            queue = manager.Queue()
+            cancelled = manager.Event()
+            futures = {
+                pool.submit(
+                    _process_item, index, item.path, item.name, item.sheet, item.output_path,
+                    mappings[item.columns_key], output_format, options, queue, cancelled
+                ): item
+                for index, item in enumerate(todo)
+            }
+            try:
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(pending, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+                    moved = False
+                    while not queue.empty():
+                        index, rows = queue.get()
+                        if todo[index].status in ('queued', 'running'):
+                            todo[index].status, todo[index].rows = 'running', rows
+                            moved = True
+                    for future in done:
+                        error = future.exception()
+                        if error is None:
+                            rows, counts, timings, seconds = future.result()
+                            finish(futures[future], seconds, (rows, counts, timings))
+                        else:
+                            finish(futures[future], None, error=error)
+                    if moved and not done:
+                        report()
+            except BaseException:
+                # Cancelled by the callback: drop queued items and ask running ones to stop
+                cancelled.set()
+                for future in futures:
+                    future.cancel()
+                raise
+    except BaseException:
+        # The pool has shut down by now, so no worker writes to the outputs any more
+        _cancel_unfinished(todo)
+        raise
+    return items
+
+
+def _cancel_unfinished(items):
+    for item in items:
+        if item.status in ('queued', 'running'):
+            item.status = 'cancelled'
+            if item.output_path and os.path.exists(item.output_path):
+                os.remove(item.output_path)
+
+
+# Write the outputs of the finished items into one file, with the source file
+# and sheet of each row in front. Columns missing from some items are left
+# empty; every value is written as text so items of different types line up.
+# Returns the number of rows written.
+def combine_outputs(items, output_path, output_format='csv', chunk_size=DEFAULT_CHUNK_ROWS, profiler=None):
+    finished = [item for item in items if item.status == 'done']
+    columns = [SOURCE_FILE_COLUMN, SOURCE_SHEET_COLUMN]
+    for item in finished:
+        for column in read_preview(item.output_path, item.output_path, rows=1).columns:
+            if column not in columns:
+                columns.append(column)
+
+    profiler = profiler if profiler is not None else Profiler()
+    with profiler.stage(WRITE_STAGE, calls=0):
+        writer = ChunkWriter(output_path, output_format)
+    try:
+        for item in finished:
+            for chunk in iter_chunks(item.output_path, item.output_path, chunk_size):
+                chunk = chunk.astype(object).where(chunk.notna(), None)
+                chunk.insert(0, SOURCE_FILE_COLUMN, item.name)
+                chunk.insert(1, SOURCE_SHEET_COLUMN, item.sheet if item.sheet is not None else '')
+                chunk = chunk.reindex(columns=columns).astype(object)
+                with profiler.stage(WRITE_STAGE, len(chunk)):
+                    writer.write(chunk)
+        if not writer.rows:
+            writer.write(pd.DataFrame(columns=columns, dtype=object))
+    finally:
+        with profiler.stage(WRITE_STAGE, calls=0):
+            writer.close()
+    return writer.rows
+
+
+# Zip the outputs of the finished items into one archive for download
+def zip_outputs(items, zip_path):
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for item in items:
+            if item.status == 'done':
+                archive.write(item.output_path, os.path.basename(item.output_path))
+    return zip_path
+
+
+# One-line summary of a batch, e.g. "3 done, 1 failed, 1 skipped"
+def summarize(items):
+    counts = {}
+    for item in items:
+        counts[item.status] = counts.get(item.status, 0) + 1
+    order = ['done', 'running', 'queued', 'failed', 'skipped', 'cancelled']
+    return ', '.join(f"{counts[status]} {status}" for status in order if counts.get(status))
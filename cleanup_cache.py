@@ -0,0 +1,144 @@
+# Persistent result cache shared across sessions, processes and runs.
+#
+# Results of the expensive cleanup steps are stored in a SQLite file keyed by
+# step, ruleset version and input value, so contact lists that overlap with
+# earlier ones don't redo the work. SQLite's WAL mode and busy timeout make it
+# safe for several Streamlit sessions and batch workers to share one file.
+# When the cache grows past max_entries the least recently used entries are
+# dropped. Writes keep a running count of the entries, an upper bound, so the
+# table is only counted when that count passes max_entries; other processes
+# writing to the same file are picked up at that count.
+import os
+import sqlite3
+import threading
+import time
+
+# Default location, overridden by DATACLEANUP_CACHE
+DEFAULT_CACHE_PATH = os.environ.get(
+    'DATACLEANUP_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'datacleanup', 'results.sqlite')
+)
+
+DEFAULT_MAX_ENTRIES = 2_000_000
+
+# Seconds to wait for another process holding the write lock
+BUSY_TIMEOUT = 30
+
+# SQLite limits the number of parameters per statement
+_BATCH = 500
+
+
+class ResultCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        # Streamlit runs each script rerun on its own thread, so one connection
+        # is shared between threads and guarded by a lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            ' step TEXT NOT NULL, version TEXT NOT NULL, key TEXT NOT NULL,'
+            ' value TEXT, used REAL NOT NULL,'
+            ' PRIMARY KEY (step, version, key)) WITHOUT ROWID'
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+        self._entries = self._count()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._count()
+
+    def _count(self):
+        self._entries = self._connection.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        return self._entries
+
+    # Look up keys for a step; returns {key: value} for the ones found and
+    # marks them as recently used
+    def get_many(self, step, version, keys):
+        with self._lock:
+            return self._get_many(step, version, keys)
+
+    def _get_many(self, step, version, keys):
+        found = {}
+        for start in range(0, len(keys), _BATCH):
+            batch = keys[start:start + _BATCH]
+            placeholders = ','.join('?' * len(batch))
+            rows = self._connection.execute(
+                f'SELECT key, value FROM results WHERE step = ? AND version = ? AND key IN ({placeholders})',
+                [step, version, *batch]
+            )
+            found.update(rows)
+
+        if found:
+            now = time.time()
+            with self._connection:
+                self._connection.executemany(
+                    'UPDATE results SET used = ? WHERE step = ? AND version = ? AND key = ?',
+                    [(now, step, version, key) for key in found]
+                )
+        return found
+
+    # Store {key: value} results for a step, then trim the cache if it is too big
+    def put_many(self, step, version, items):
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(
+                    'INSERT OR REPLACE INTO results (step, version, key, value, used) VALUES (?, ?, ?, ?, ?)',
+                    [(step, version, key, value, now) for key, value in items.items()]
+                )
+            # Replaced entries are counted too, so this can only overestimate
+            self._entries += len(items)
+            if self._entries > self.max_entries:
+                self._evict()
+
+    # Drop least recently used entries beyond max_entries. Trims to 90% so the
+    # next few writes don't each trigger another eviction.
+    def evict(self):
+        with self._lock:
+            return self._evict()
+
+    def _evict(self):
+        excess = self._count() - self.max_entries
+        if excess <= 0:
+            return 0
+        excess += self.max_entries // 10
+        with self._connection:
+            deleted = self._connection.execute(
+                'DELETE FROM results WHERE (step, version, key) IN '
+                '(SELECT step, version, key FROM results ORDER BY used LIMIT ?)',
+                [excess]
+            ).rowcount
+        self._entries -= deleted
+        return deleted
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM results')
+            self._entries = 0
+
+
+# One open cache per path in each process, so worker processes open their own
+# connection instead of inheriting one
+_open_caches = {}
+_open_lock = threading.Lock()
+
+
+def open_cache(path, max_entries=DEFAULT_MAX_ENTRIES):
+    key = (os.getpid(), os.path.abspath(path))
+    with _open_lock:
+        cache = _open_caches.get(key)
+        if cache is None:
+            cache = _open_caches[key] = ResultCache(path, max_entries)
+    return cache
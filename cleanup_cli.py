@@ -0,0 +1,224 @@
+# Command-line entry point for running the cleanup without Streamlit.
+#
+# Examples:
+#   python cleanup_cli.py contacts.xlsx -o cleaned.csv --email Email --website Website
+#   python cleanup_cli.py exports/ -o cleaned/ --format xlsx --address Address --city City --country Country
+#   python cleanup_cli.py vendors.zip -o vendors.csv --combine --all-sheets --file-workers 4 --email Email
+#   python cleanup_cli.py contacts.csv -o cleaned.csv --website Website --address Address --dedupe merged.csv
+#
+# A directory as input processes every supported file in it into an output
+# directory. Files are streamed a chunk at a time, so memory use stays flat.
+# Zip archives, --all-sheets, --combine and --file-workers go through batch
+# mode (see cleanup_batch).
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from cleanup_batch import combine_outputs, expand_inputs, run_batch, summarize
+from cleanup_cache import DEFAULT_CACHE_PATH
+from cleanup_dedupe import dedupe_file
+from cleanup_engine import CacheStats
+from cleanup_formats import BATCH_EXTENSIONS, OUTPUT_FORMATS
+from cleanup_io import DEFAULT_CHUNK_ROWS, stream_process
+from cleanup_profile import Profiler
+
+MAPPING_FIELDS = ['email', 'website', 'address', 'city', 'country', 'logo']
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Clean up email, address, city and logo columns in CSV, Excel, Parquet or Feather files."
+    )
+    parser.add_argument('inputs', nargs='+', help="Input files or directories")
+    parser.add_argument('-o', '--output', required=True,
+                        help="Output file, or output directory when there are several inputs")
+    parser.add_argument('-f', '--format', choices=OUTPUT_FORMATS,
+                        help="Output format (default: from the output file name, else csv)")
+    for field in MAPPING_FIELDS:
+        parser.add_argument(f'--{field}', default='', metavar='COLUMN', help=f"{field.capitalize()} column")
+    parser.add_argument('--keep', metavar='COLUMNS',
+                        help="Only read the mapped columns plus these comma-separated ones (default: all columns)")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes (default: 1)")
+    parser.add_argument('--all-sheets', action='store_true',
+                        help="Process every sheet of Excel workbooks, not only the first one")
+    parser.add_argument('--combine', action='store_true',
+                        help="Write every input into the one output file, with the source file and sheet of each row")
+    parser.add_argument('--file-workers', type=int, default=1,
+                        help="Files or sheets processed at the same time (default: 1)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help=f"Rows read and written at a time (default: {DEFAULT_CHUNK_ROWS})")
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_CACHE_PATH, metavar='PATH',
+                        help=f"Reuse results stored by earlier runs in an on-disk cache (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument('--discover-logos', action='store_true',
+                        help="Look for logos on the company websites instead of using Clearbit URLs")
+    parser.add_argument('--dedupe', metavar='PATH',
+                        help="Add a cluster ID of duplicate companies to the output and write one merged row per "
+                             "company here, in the format its name gives (needs a single output file)")
+    parser.add_argument('--profile', metavar='PATH',
+                        help="Write time, rows and calls per stage and task as a JSON report")
+    parser.add_argument('--cprofile', metavar='PATH', help="Record the run with cProfile and save the stats here")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Only report errors")
+    return parser.parse_args(argv)
+
+
+# Expand directories into the CSV/Excel files (and zip archives) they contain
+def collect_inputs(inputs):
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                extension = os.path.splitext(name)[1].lower().lstrip('.')
+                if extension in BATCH_EXTENSIONS and not name.startswith('~$'):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
+
+# Format of a single output file: the one asked for, else from its name, else csv
+def single_output_format(output, output_format):
+    if output_format:
+        return output_format
+    extension = os.path.splitext(output)[1].lower().lstrip('.')
+    return extension if extension in OUTPUT_FORMATS else 'csv'
+
+
+# Work out where each input goes: (input, output, format). Inputs that share
+# a name stem keep their extension ("a.csv" and "a.xlsx" give a.csv.csv and
+# a.xlsx.csv), and names still taken, by files of the same name in different
+# directories, are numbered like batch outputs: "a (2).csv".
+def plan_outputs(files, output, output_format, several):
+    if not several:
+        return [(files[0], output, single_output_format(output, output_format))]
+
+    output_format = output_format or 'csv'
+    os.makedirs(output, exist_ok=True)
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in files]
+    shared = Counter(stem.lower() for stem in stems)
+    plan = []
+    used = set()
+    for path, stem in zip(files, stems):
+        if shared[stem.lower()] > 1:
+            stem = os.path.basename(path)
+        candidate, number = stem, 2
+        while candidate.lower() in used:
+            candidate = f"{stem} ({number})"
+            number += 1
+        used.add(candidate.lower())
+        plan.append((path, os.path.join(output, f"{candidate}.{output_format}"), output_format))
+    return plan
+
+
+# Batch mode: every file and sheet with the same mappings, file_workers at a
+# time, into an output directory or (with --combine) one output file
+def run_batch_mode(args, files, column_mappings, usecols, profiler):
+    output_format = single_output_format(args.output, args.format) if args.combine else args.format or 'csv'
+
+    with tempfile.TemporaryDirectory() as staging:
+        items = expand_inputs([(path, path) for path in files], staging, args.all_sheets)
+        mappings = {item.columns_key: column_mappings for item in items}
+        stats = CacheStats()
+        run_batch(
+            items, mappings, os.path.join(staging, 'results') if args.combine else args.output, output_format,
+            file_workers=args.file_workers, stats=stats, profiler=profiler, chunk_size=args.chunk_size,
+            workers=args.workers, cache_path=args.cache, discover_logos=args.discover_logos, usecols=usecols
+        )
+        if args.combine and any(item.status == 'done' for item in items):
+            rows = combine_outputs(items, args.output, output_format, args.chunk_size, profiler)
+            if not args.quiet:
+                print(f"{rows} rows from {summarize(items)} -> {args.output}")
+
+    files_report = []
+    for item in items:
+        files_report.append(dict(item.to_dict(), input=item.label))
+        if item.status == 'failed':
+            print(f"{item.label}: error: {item.error}", file=sys.stderr)
+        elif not args.quiet and not args.combine:
+            print(f"{item.label}: {item.rows} rows -> {item.output_path} ({item.seconds:.1f}s)")
+    if not args.quiet:
+        print(f"{summarize(items)}, {stats.hit_ratio():.0%} repeated values reused")
+    failures = sum(item.status == 'failed' for item in items)
+    return failures, files_report
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    column_mappings = {field: getattr(args, field) for field in MAPPING_FIELDS}
+    if not any(column_mappings.values()):
+        print("error: map at least one column (--email, --website, --address, --city, --country, --logo)",
+              file=sys.stderr)
+        return 2
+
+    files = collect_inputs(args.inputs)
+    if not files:
+        print("error: no input files found", file=sys.stderr)
+        return 2
+    several = len(files) > 1 or os.path.isdir(args.inputs[0])
+
+    # Read just the columns that are needed when --keep is given
+    usecols = None
+    if args.keep is not None:
+        wanted = [column for column in column_mappings.values() if column]
+        wanted += [column.strip() for column in args.keep.split(',') if column.strip()]
+        usecols = list(dict.fromkeys(wanted))
+
+    batch = args.all_sheets or args.combine or args.file_workers > 1 or any(
+        path.lower().endswith('.zip') for path in files
+    )
+    if args.dedupe and (several or batch) and not args.combine:
+        print("error: --dedupe needs a single output file (one input, or --combine)", file=sys.stderr)
+        return 2
+
+    failures = 0
+    files_report = []
+    profiler = Profiler(cprofile=bool(args.cprofile))
+    with profiler.run():
+        if batch:
+            failures, files_report = run_batch_mode(args, files, column_mappings, usecols, profiler)
+        for path, output_path, output_format in [] if batch else plan_outputs(
+            files, args.output, args.format, several
+        ):
+            started = time.perf_counter()
+            stats = CacheStats()
+            try:
+                rows = stream_process(
+                    path, path, output_path, column_mappings, output_format,
+                    chunk_size=args.chunk_size, workers=args.workers, stats=stats, cache_path=args.cache,
+                    discover_logos=args.discover_logos, profiler=profiler, usecols=usecols
+                )
+            except Exception as e:
+                failures += 1
+                print(f"{path}: error: {e}", file=sys.stderr)
+                files_report.append({'input': path, 'error': str(e)})
+                continue
+            seconds = time.perf_counter() - started
+            files_report.append({'input': path, 'output': output_path, 'rows': rows, 'seconds': round(seconds, 6),
+                                 'cache': stats.summary()})
+            if not args.quiet:
+                print(f"{path}: {rows} rows -> {output_path} ({seconds:.1f}s, "
+                      f"{stats.hit_ratio():.0%} repeated values reused)")
+
+        # Duplicates are found over the finished output file
+        if args.dedupe and os.path.exists(args.output) and (not failures or args.combine):
+            duplicates = dedupe_file(args.output, column_mappings, args.output, args.dedupe,
+                                     single_output_format(args.output, args.format), args.chunk_size,
+                                     profiler=profiler, merged_format=single_output_format(args.dedupe, None))
+            if not args.quiet:
+                print(f"{duplicates['rows']} rows in {duplicates['clusters']} clusters, "
+                      f"{duplicates['duplicate_rows']} duplicates -> {args.dedupe}")
+
+    if args.profile:
+        with open(args.profile, 'w', encoding='utf-8') as report_file:
+            json.dump(dict(profiler.report(), files=files_report), report_file, indent=2)
+    if args.cprofile:
+        profiler.dump_cprofile(args.cprofile)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
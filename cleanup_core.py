@@ -0,0 +1,640 @@
+# Core cleanup functions shared by the Streamlit app and the processing engine.
+# Kept free of Streamlit so it can be imported without launching the UI.
+import logging
+import os
+import re
+from functools import lru_cache
+from types import MappingProxyType
+from urllib.parse import urlparse
+
+from cleanup_gazetteer import Gazetteer, name_words
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a cleanup rule changes, so results cached on disk by earlier
+# rules are not reused
+RULESET_VERSION = '4'
+
+# All lookup tables and patterns below are built once and are read-only, so
+# each call only has to run the matches. The ones that take a while to build
+# (the address and city patterns, the gazetteer and the country index) are
+# built on first use rather than at import, so tools that don't clean
+# addresses or cities start without paying for them; see address_patterns()
+# and the functions after it.
+
+# Fallback email domains by country, used when neither the website nor the email has one
+COUNTRY_TLDS = MappingProxyType({
+    'Chile': 'domain.cl',
+    'Brazil': 'domain.br',
+    'Argentina': 'domain.ar',
+    'Colombia': 'domain.co',
+    'Mexico': 'domain.mx',
+    'Peru': 'domain.pe',
+    'Ecuador': 'domain.ec',
+    'Venezuela': 'domain.ve',
+    'Uruguay': 'domain.uy',
+    'Paraguay': 'domain.py',
+    'Bolivia': 'domain.bo',
+    'Costa Rica': 'domain.cr',
+    'Panama': 'domain.pa',
+    'Guatemala': 'domain.gt',
+    'El Salvador': 'domain.sv',
+    'Honduras': 'domain.hn',
+    'Nicaragua': 'domain.ni',
+    'Dominican Republic': 'domain.do',
+    'Jamaica': 'domain.jm',
+    'Trinidad and Tobago': 'domain.tt',
+    'Canada': 'domain.ca',
+    'United Kingdom': 'domain.uk',
+    'Australia': 'domain.au',
+    'New Zealand': 'domain.nz',
+    'Singapore': 'domain.sg',
+    'South Korea': 'domain.kr',
+    'Japan': 'domain.jp',
+    'Israel': 'domain.il',
+    'South Africa': 'domain.za',
+    'Morocco': 'domain.ma',
+    'Egypt': 'domain.eg',
+    'Turkey': 'domain.tr',
+    'United Arab Emirates': 'domain.ae',
+    'Saudi Arabia': 'domain.sa',
+    'Qatar': 'domain.qa',
+    'Kuwait': 'domain.kw',
+    'Bahrain': 'domain.bh',
+    'Oman': 'domain.om',
+    'Jordan': 'domain.jo',
+})
+
+# ISO 3166 two- and three-letter codes of the countries the cleanup knows
+COUNTRY_CODES = MappingProxyType({
+    'Chile': ('CL', 'CHL'),
+    'Brazil': ('BR', 'BRA'),
+    'Argentina': ('AR', 'ARG'),
+    'Colombia': ('CO', 'COL'),
+    'Mexico': ('MX', 'MEX'),
+    'Peru': ('PE', 'PER'),
+    'Ecuador': ('EC', 'ECU'),
+    'Venezuela': ('VE', 'VEN'),
+    'Uruguay': ('UY', 'URY'),
+    'Paraguay': ('PY', 'PRY'),
+    'Bolivia': ('BO', 'BOL'),
+    'Costa Rica': ('CR', 'CRI'),
+    'Panama': ('PA', 'PAN'),
+    'Guatemala': ('GT', 'GTM'),
+    'El Salvador': ('SV', 'SLV'),
+    'Honduras': ('HN', 'HND'),
+    'Nicaragua': ('NI', 'NIC'),
+    'Dominican Republic': ('DO', 'DOM'),
+    'Jamaica': ('JM', 'JAM'),
+    'Trinidad and Tobago': ('TT', 'TTO'),
+    'Canada': ('CA', 'CAN'),
+    'United Kingdom': ('GB', 'GBR'),
+    'Australia': ('AU', 'AUS'),
+    'New Zealand': ('NZ', 'NZL'),
+    'Singapore': ('SG', 'SGP'),
+    'South Korea': ('KR', 'KOR'),
+    'Japan': ('JP', 'JPN'),
+    'Israel': ('IL', 'ISR'),
+    'South Africa': ('ZA', 'ZAF'),
+    'Morocco': ('MA', 'MAR'),
+    'Egypt': ('EG', 'EGY'),
+    'Turkey': ('TR', 'TUR'),
+    'United Arab Emirates': ('AE', 'ARE'),
+    'Saudi Arabia': ('SA', 'SAU'),
+    'Qatar': ('QA', 'QAT'),
+    'Kuwait': ('KW', 'KWT'),
+    'Bahrain': ('BH', 'BHR'),
+    'Oman': ('OM', 'OMN'),
+    'Jordan': ('JO', 'JOR'),
+})
+
+# Other ways the countries get written: short forms, older names, and the
+# Spanish and Portuguese names. Accents, case and dots don't matter here.
+COUNTRY_ALIASES = MappingProxyType({
+    'UK': 'United Kingdom',
+    'Great Britain': 'United Kingdom',
+    'Britain': 'United Kingdom',
+    'England': 'United Kingdom',
+    'Scotland': 'United Kingdom',
+    'Wales': 'United Kingdom',
+    'Northern Ireland': 'United Kingdom',
+    'Reino Unido': 'United Kingdom',
+    'Brasil': 'Brazil',
+    'Mejico': 'Mexico',
+    'Republica Dominicana': 'Dominican Republic',
+    'Trinidad': 'Trinidad and Tobago',
+    'Trinidad & Tobago': 'Trinidad and Tobago',
+    'Trinidad y Tobago': 'Trinidad and Tobago',
+    'Nueva Zelanda': 'New Zealand',
+    'Singapur': 'Singapore',
+    'Korea': 'South Korea',
+    'Republic of Korea': 'South Korea',
+    'Korea, Republic of': 'South Korea',
+    'Corea del Sur': 'South Korea',
+    'Coreia do Sul': 'South Korea',
+    'Japon': 'Japan',
+    'Japao': 'Japan',
+    'Sudafrica': 'South Africa',
+    'Africa do Sul': 'South Africa',
+    'Marruecos': 'Morocco',
+    'Marrocos': 'Morocco',
+    'Egipto': 'Egypt',
+    'Egito': 'Egypt',
+    'Turkiye': 'Turkey',
+    'Turquia': 'Turkey',
+    'UAE': 'United Arab Emirates',
+    'Emirates': 'United Arab Emirates',
+    'Emiratos Arabes Unidos': 'United Arab Emirates',
+    'Emirados Arabes Unidos': 'United Arab Emirates',
+    'KSA': 'Saudi Arabia',
+    'Arabia Saudita': 'Saudi Arabia',
+    'Arabia Saudi': 'Saudi Arabia',
+    'Jordania': 'Jordan',
+    'Barein': 'Bahrain',
+    'Catar': 'Qatar',
+    'Oma': 'Oman',
+})
+
+# Address text beyond this many characters is not searched. Matching is linear
+# in the length of the text, so this bounds the time any one cell can take;
+# real addresses are far shorter, only free-text dumps get cut.
+MAX_ADDRESS_LENGTH = 1000
+
+# Common address patterns for various countries, tried in order (compiled by
+# address_patterns())
+_ADDRESS_PATTERNS = [
+    # Street number followed by street name. One space, then letters and spaces:
+    # the same matches as \s+[A-Za-z\s]+, without trying every way of splitting
+    # a run of spaces between the two (quadratic on long runs of spaces)
+    r'\b\d+\s[A-Za-z\s]+\b(?:\s+(?:street|st|avenue|ave|road|rd|boulevard|blvd|lane|ln|drive|dr|way|court|ct|plaza|plz|square|sq|highway|hwy|route|rt))?',
+
+    # Latin American address format (Calle, Carrera, Avenida, etc.)
+    r'\b(?:Calle|Cl|Carrera|Cr|Cra|Avenida|Av|Autopista|Diagonal|Transversal|Trans)\s+\d+\s*[A-Za-z0-9\s#\-°\.]+',
+
+    # Building number or unit number
+    r'\b(?:Apt|Apartment|Unit|Suite|Ste|Building|Bldg|Floor|Fl|Room|Rm)\s+\d+[A-Za-z]?\b',
+
+    # Hispanic style with # (e.g., "Calle 50 # 20-15")
+    r'\b(?:Calle|Cl|Carrera|Cr|Cra|Avenida|Av)\s+\d+\s*#\s*\d+(?:\s*-\s*\d+)?',
+
+    # Hispanic styles for other countries
+    r'\b(?:Paseo|Rua|Avenida|Av|Calle|Cl|Carrer|Jalan|Jln|Via|Viale|Estrada|Ruta)\s+[A-Za-z0-9\s#\-°\.]+',
+
+    # Asian address styles
+    r'\b\d+\s+(?:Jalan|Jln|Soi)\s+[A-Za-z0-9\s]+',
+
+    # Middle Eastern address styles
+    r'\b(?:Al|El)\s+[A-Za-z]+\s+(?:Street|Road|Avenue)',
+
+    # PO Box
+    r'\bP\.?O\.?\s*Box\s+\d+\b',
+
+    # Generic number + word pattern (might catch some addresses)
+    r'\b\d+\s+[A-Za-z]{3,}\b'
+]
+
+# Dictionary of major cities by country (expanded for Central/South America and FTA countries)
+CITIES_BY_COUNTRY = MappingProxyType({country: tuple(cities) for country, cities in {
+    'Colombia': ['Bogota', 'Medellin', 'Cali', 'Barranquilla', 'Cartagena', 'Cucuta', 'Bucaramanga', 
+                 'Pereira', 'Santa Marta', 'Manizales', 'Ibague', 'Pasto', 'Neiva', 'Villavicencio', 
+                 'Armenia', 'Valledupar', 'Monteria', 'Sincelejo', 'Popayan', 'Palmira', 'Buenaventura', 
+                 'Floridablanca', 'Barrancabermeja', 'Tunja', 'Tulua'],
+
+    'Mexico': ['Mexico City', 'Guadalajara', 'Monterrey', 'Puebla', 'Tijuana', 'Leon', 'Juarez', 
+               'Merida', 'Chihuahua', 'Cancun', 'Queretaro', 'San Luis Potosi', 'Hermosillo', 
+               'Aguascalientes', 'Morelia', 'Veracruz', 'Mexicali', 'Culiacan', 'Acapulco', 
+               'Tampico', 'Cuernavaca', 'Toluca', 'Torreon', 'Durango', 'Oaxaca'],
+
+    'Brazil': ['Sao Paulo', 'Rio de Janeiro', 'Brasilia', 'Salvador', 'Fortaleza', 'Belo Horizonte', 
+               'Manaus', 'Curitiba', 'Recife', 'Porto Alegre', 'Belem', 'Goiania', 'Guarulhos', 
+               'Campinas', 'Sao Luis', 'Maceio', 'Duque de Caxias', 'Natal', 'Campo Grande', 
+               'Teresina', 'Sao Bernardo do Campo', 'Nova Iguacu', 'Joao Pessoa', 'Santo Andre', 
+               'Osasco', 'Ribeirao Preto', 'Jaboatao dos Guararapes', 'Uberlandia'],
+
+    'Chile': ['Santiago', 'Valparaiso', 'Concepcion', 'La Serena', 'Antofagasta', 'Temuco', 
+              'Rancagua', 'Talca', 'Arica', 'Iquique', 'Puerto Montt', 'Coquimbo', 'Osorno', 
+              'Quillota', 'Calama', 'Chillan', 'Valdivia', 'Punta Arenas', 'Copiapo', 'Curico', 
+              'Los Angeles', 'Melipilla', 'San Antonio', 'Linares', 'Ovalle'],
+
+    'Argentina': ['Buenos Aires', 'Cordoba', 'Rosario', 'Mendoza', 'San Miguel de Tucuman', 
+                 'La Plata', 'Mar del Plata', 'Salta', 'Santa Fe', 'San Juan', 'Resistencia', 
+                 'Santiago del Estero', 'Corrientes', 'Posadas', 'San Salvador de Jujuy', 
+                 'Bahia Blanca', 'Parana', 'Neuquen', 'Formosa', 'La Rioja', 'Rio Cuarto', 
+                 'Comodoro Rivadavia', 'San Luis', 'Tandil', 'San Rafael'],
+
+    'Peru': ['Lima', 'Arequipa', 'Trujillo', 'Chiclayo', 'Piura', 'Iquitos', 'Cusco', 'Huancayo', 
+             'Tacna', 'Juliaca', 'Ica', 'Pucallpa', 'Chimbote', 'Sullana', 'Ayacucho', 'Chincha Alta', 
+             'Huanuco', 'Cajamarca', 'Puno', 'Tumbes', 'Tarapoto', 'Huacho', 'Huaraz', 'Pisco', 'Moyobamba'],
+
+    'Ecuador': ['Quito', 'Guayaquil', 'Cuenca', 'Santo Domingo', 'Machala', 'Duran', 'Manta', 
+               'Portoviejo', 'Loja', 'Ambato', 'Esmeraldas', 'Quevedo', 'Riobamba', 'Milagro', 
+               'Ibarra', 'Babahoyo', 'Sangolqui', 'Santa Elena', 'La Libertad', 'Latacunga'],
+
+    'Venezuela': ['Caracas', 'Maracaibo', 'Valencia', 'Barquisimeto', 'Maracay', 'Ciudad Guayana', 
+                 'Barcelona', 'Maturin', 'Puerto La Cruz', 'Petare', 'Turmero', 'Baruta', 'Barinas', 
+                 'Mérida', 'Cumana', 'Cabimas', 'San Cristobal', 'Ciudad Bolivar', 'Guatire', 
+                 'Punto Fijo', 'Acarigua', 'Carupano', 'Los Teques', 'Coro', 'El Tigre'],
+
+    'Uruguay': ['Montevideo', 'Salto', 'Ciudad de la Costa', 'Paysandu', 'Las Piedras', 'Rivera', 
+               'Maldonado', 'Tacuarembo', 'Melo', 'Mercedes', 'Artigas', 'Minas', 'San Jose de Mayo', 
+               'Durazno', 'Florida', 'Treinta y Tres', 'Rocha', 'Fray Bentos', 'Trinidad', 'Colonia del Sacramento'],
+
+    'Paraguay': ['Asuncion', 'Ciudad del Este', 'San Lorenzo', 'Luque', 'Capiata', 'Lambare', 
+                'Fernando de la Mora', 'Limpio', 'Nemby', 'Encarnacion', 'Mariano Roque Alonso', 
+                'Pedro Juan Caballero', 'Villa Elisa', 'Ita', 'Villarrica', 'Caaguazu', 'Coronel Oviedo', 
+                'Concepcion', 'Presidente Franco', 'Pilar'],
+
+    'Bolivia': ['La Paz', 'Santa Cruz de la Sierra', 'Cochabamba', 'El Alto', 'Oruro', 'Sucre', 
+               'Tarija', 'Potosi', 'Sacaba', 'Montero', 'Trinidad', 'Quillacollo', 'Riberalta', 
+               'Warnes', 'Yacuiba', 'Camiri', 'Tupiza', 'Villa Montes', 'Villazon', 'Guayaramerin'],
+
+    'Costa Rica': ['San Jose', 'Alajuela', 'Cartago', 'Heredia', 'Liberia', 'Puntarenas', 'Limon', 
+                  'Perez Zeledon', 'Santa Cruz', 'Nicoya', 'Turrialba', 'Ciudad Quesada', 'Siquirres', 
+                  'Canas', 'Grecia', 'Guapiles', 'San Isidro', 'Atenas', 'Esparza', 'Puriscal'],
+
+    'Panama': ['Panama City', 'San Miguelito', 'Juan Diaz', 'David', 'Arraijan', 'Colon', 'La Chorrera', 
+              'Santiago', 'Chitre', 'Penonome', 'Bocas del Toro', 'Aguadulce', 'Changuinola', 'La Concepcion', 
+              'Las Tablas', 'Puerto Armuelles', 'Boquete', 'El Porvenir', 'Los Santos', 'Rio Abajo'],
+
+    'Guatemala': ['Guatemala City', 'Mixco', 'Villa Nueva', 'Quetzaltenango', 'Escuintla', 'Chinautla', 
+                 'Villa Canales', 'San Juan Sacatepequez', 'Chimaltenango', 'Coban', 'Huehuetenango', 
+                 'Mazatenango', 'Retalhuleu', 'Totonicapan', 'Jalapa', 'Puerto Barrios', 'Antigua Guatemala', 
+                 'Santa Lucia Cotzumalguapa', 'Solola', 'San Pedro Sacatepequez'],
+
+    'El Salvador': ['San Salvador', 'Santa Ana', 'Soyapango', 'San Miguel', 'Mejicanos', 'Santa Tecla', 
+                   'Apopa', 'Delgado', 'Ahuachapan', 'Ilopango', 'Zacatecoluca', 'Cojutepeque', 'Usulutan', 
+                   'San Vicente', 'San Marcos', 'Chalatenango', 'La Union', 'Sensuntepeque', 'Metapan', 'Acajutla'],
+
+    'Honduras': ['Tegucigalpa', 'San Pedro Sula', 'La Ceiba', 'Choloma', 'El Progreso', 'Choluteca', 
+                'Comayagua', 'Puerto Cortes', 'Danli', 'Juticalpa', 'Siguatepeque', 'Santa Rosa de Copan', 
+                'Tela', 'Villanueva', 'Potrerillos', 'La Lima', 'La Paz', 'Olanchito', 'Nacaome', 'Santa Barbara'],
+
+    'Nicaragua': ['Managua', 'Leon', 'Masaya', 'Tipitapa', 'Chinandega', 'Matagalpa', 'Esteli', 'Granada', 
+                 'Ciudad Sandino', 'Juigalpa', 'Jinotega', 'El Viejo', 'Nueva Guinea', 'Diriamba', 'Chichigalpa', 
+                 'Rivas', 'Jalapa', 'Jinotepe', 'Ocotal', 'Somoto'],
+
+    'Dominican Republic': ['Santo Domingo', 'Santiago de los Caballeros', 'Los Alcarrizos', 'Santo Domingo Este', 
+                         'Santo Domingo Norte', 'Santo Domingo Oeste', 'San Pedro de Macoris', 'La Romana', 
+                         'San Francisco de Macoris', 'San Cristobal', 'Puerto Plata', 'La Vega', 'Moca', 
+                         'Bani', 'Bonao', 'Higuey', 'Barahona', 'Cotui', 'Nagua', 'Azua'],
+
+    'Jamaica': ['Kingston', 'Montego Bay', 'Portmore', 'Spanish Town', 'Mandeville', 'May Pen', 'Old Harbour', 
+               'Savanna-la-Mar', 'Port Antonio', 'St. Anns Bay', 'Linstead', 'Black River', 'Ocho Rios', 
+               'Falmouth', 'Lucea', 'Negril', 'Morant Bay', 'Chapelton', 'Port Maria', 'Yallahs'],
+
+    'Trinidad and Tobago': ['Port of Spain', 'San Fernando', 'Chaguanas', 'Mon Repos', 'Arima', 'Tunapuna', 
+                           'Sangre Grande', 'Point Fortin', 'Couva', 'Siparia', 'Rio Claro', 'Scarborough', 
+                           'Penal', 'Gasparillo', 'Princess Town', 'San Juan', 'Diego Martin', 'Fyzabad', 
+                           'Arouca', 'Valencia'],
+
+    'Canada': ['Toronto', 'Montreal', 'Vancouver', 'Calgary', 'Edmonton', 'Ottawa', 'Winnipeg', 
+              'Quebec City', 'Hamilton', 'Kitchener', 'London', 'Victoria', 'Halifax', 'Oshawa', 
+              'Windsor', 'Saskatoon', 'Regina', 'St. Catharines', 'Sherbrooke', 'Barrie', 'Kelowna', 
+              'Kingston', 'Abbotsford', 'Trois-Rivieres', 'Saint John'],
+
+    'Australia': ['Sydney', 'Melbourne', 'Brisbane', 'Perth', 'Adelaide', 'Gold Coast', 'Canberra', 
+                 'Newcastle', 'Wollongong', 'Logan City', 'Geelong', 'Hobart', 'Townsville', 'Cairns', 
+                 'Darwin', 'Toowoomba', 'Ballarat', 'Bendigo', 'Launceston', 'Mackay', 'Rockhampton', 
+                 'Bundaberg', 'Bunbury', 'Hervey Bay', 'Wagga Wagga'],
+
+    'New Zealand': ['Auckland', 'Wellington', 'Christchurch', 'Hamilton', 'Tauranga', 'Napier-Hastings', 
+                   'Dunedin', 'Palmerston North', 'Nelson', 'Rotorua', 'New Plymouth', 'Whangarei', 
+                   'Invercargill', 'Whanganui', 'Gisborne', 'Blenheim', 'Pukekohe', 'Timaru', 
+                   'Taupo', 'Masterton'],
+
+    'Singapore': ['Singapore'],
+
+    'South Korea': ['Seoul', 'Busan', 'Incheon', 'Daegu', 'Daejeon', 'Gwangju', 'Suwon', 'Ulsan', 
+                  'Seongnam', 'Goyang', 'Bucheon', 'Ansan', 'Anyang', 'Changwon', 'Jeonju', 
+                  'Cheongju', 'Pohang', 'Uijeongbu', 'Hwaseong', 'Yongin'],
+
+    'Japan': ['Tokyo', 'Yokohama', 'Osaka', 'Nagoya', 'Sapporo', 'Kobe', 'Kyoto', 'Fukuoka', 
+             'Kawasaki', 'Saitama', 'Hiroshima', 'Sendai', 'Kitakyushu', 'Chiba', 'Sakai', 
+             'Kumamoto', 'Niigata', 'Okayama', 'Hamamatsu', 'Sagamihara'],
+
+    'Israel': ['Jerusalem', 'Tel Aviv', 'Haifa', 'Rishon LeZion', 'Petah Tikva', 'Ashdod', 'Netanya', 
+              'Beer Sheva', 'Holon', 'Bnei Brak', 'Ramat Gan', 'Rehovot', 'Herzliya', 'Kfar Saba', 
+              'Modiin', 'Ashkelon', 'Bat Yam', 'Nahariya', 'Lod', 'Nazareth'],
+
+    'South Africa': ['Johannesburg', 'Cape Town', 'Durban', 'Pretoria', 'Port Elizabeth', 'Bloemfontein', 
+                    'Nelspruit', 'Kimberley', 'Polokwane', 'Pietermaritzburg', 'East London', 'Rustenburg', 
+                    'Vereeniging', 'Potchefstroom', 'Welkom', 'Newcastle', 'Krugersdorp', 'Witbank', 
+                    'Centurion', 'Stellenbosch'],
+
+    'Morocco': ['Casablanca', 'Rabat', 'Fes', 'Marrakech', 'Agadir', 'Tangier', 'Meknes', 'Oujda', 
+               'Kenitra', 'Tetouan', 'Safi', 'Mohammedia', 'El Jadida', 'Taza', 'Beni Mellal', 
+               'Nador', 'Settat', 'Berrechid', 'Khouribga', 'Larache'],
+
+    'Egypt': ['Cairo', 'Alexandria', 'Giza', 'Shubra El-Kheima', 'Port Said', 'Suez', 'Luxor', 
+             'Aswan', 'Ismailia', 'Faiyum', 'Zagazig', 'Damietta', 'Asyut', 'Tanta', 'Sohag', 
+             'Mansoura', 'Hurghada', 'Beni Suef', 'Minya', 'Qena'],
+
+    'Turkey': ['Istanbul', 'Ankara', 'Izmir', 'Bursa', 'Adana', 'Gaziantep', 'Konya', 'Antalya', 
+              'Mersin', 'Diyarbakir', 'Kayseri', 'Eskisehir', 'Samsun', 'Denizli', 'Kahramanmaras', 
+              'Ordu', 'Erzurum', 'Malatya', 'Trabzon', 'Elazig'],
+
+    'United Arab Emirates': ['Dubai', 'Abu Dhabi', 'Sharjah', 'Al Ain', 'Ajman', 'Ras Al-Khaimah', 
+                           'Fujairah', 'Umm Al-Quwain'],
+
+    'Saudi Arabia': ['Riyadh', 'Jeddah', 'Mecca', 'Medina', 'Dammam', 'Taif', 'Tabuk', 'Buraidah', 
+                   'Khamis Mushait', 'Abha', 'Najran', 'Yanbu', 'Khobar', 'Sakaka', 'Al Bahah', 
+                   'Jubail', 'Jizan', 'Hafar Al-Batin', 'Dhahran', 'Qatif'],
+
+    'Qatar': ['Doha', 'Al Rayyan', 'Al Wakrah', 'Al Khor', 'Mesaieed', 'Dukhan', 'Al Shamal', 
+             'Madinat ash Shamal', 'Umm Salal Muhammad', 'Al Wukair'],
+
+    'Kuwait': ['Kuwait City', 'Hawalli', 'Salmiya', 'Al Ahmadi', 'Sabah Al-Salem', 'Al Farwaniyah', 
+              'Al Jahra', 'Mangaf', 'Fahaheel', 'Ar Rumaithiya'],
+
+    'Bahrain': ['Manama', 'Riffa', 'Muharraq', 'Hamad Town', 'A\'Ali', 'Isa Town', 'Sitra', 
+               'Budaiya', 'Jidhafs', 'Sanabis'],
+
+    'Oman': ['Muscat', 'Seeb', 'Salalah', 'Sohar', 'Nizwa', 'Sur', 'Ibri', 'Saham', 'Barka', 'Rustaq'],
+
+    'Jordan': ['Amman', 'Zarqa', 'Irbid', 'Russeifa', 'Aqaba', 'Madaba', 'Mafraq', 'Jerash', 
+              'Salt', 'Karak', 'Tafilah', 'Ma\'an', 'Ajloun', 'Ramtha'],
+
+    'United Kingdom': ['London', 'Birmingham', 'Manchester', 'Glasgow', 'Liverpool', 'Bristol', 'Sheffield', 
+                      'Leeds', 'Edinburgh', 'Leicester', 'Coventry', 'Bradford', 'Belfast', 'Nottingham', 
+                      'Kingston upon Hull', 'Newcastle upon Tyne', 'Southampton', 'Reading', 'Derby', 'Aberdeen']
+}.items()})
+
+
+# Lookup key for a country value: accents, case, dots and other punctuation
+# dropped and whitespace collapsed ("  Perú " -> "peru", "U.K." -> "uk")
+def country_key(country):
+    return ' '.join(name_words(country.replace('.', '')))
+
+
+# Word-level city matcher for every country. Set DATACLEANUP_GAZETTEER to a
+# tab-separated "country<TAB>city" file to add more place names to it; its
+# countries may be written any way the country index knows them.
+GAZETTEER_PATH = os.environ.get('DATACLEANUP_GAZETTEER', '')
+
+
+# The gazetteer and the country index, built together since each needs the
+# other: the canonical country name by lookup key, for the names themselves,
+# their ISO codes and their aliases, then the gazetteer's own countries. Names
+# come first, so an alias never hides one.
+@lru_cache(maxsize=None)
+def _places():
+    index = {}
+    for name in [*COUNTRY_TLDS, *CITIES_BY_COUNTRY]:
+        index.setdefault(country_key(name), name)
+    for name, codes in COUNTRY_CODES.items():
+        for code in codes:
+            index.setdefault(country_key(code), name)
+    for alias, name in COUNTRY_ALIASES.items():
+        index.setdefault(country_key(alias), name)
+    gazetteer = Gazetteer.from_mapping(CITIES_BY_COUNTRY)
+    if GAZETTEER_PATH:
+        gazetteer.load(GAZETTEER_PATH, country_name=lambda name: index.get(country_key(name), name))
+        for name in gazetteer.countries():
+            index.setdefault(country_key(name), name)
+    return gazetteer, MappingProxyType(index)
+
+
+def city_gazetteer():
+    return _places()[0]
+
+
+def country_index():
+    return _places()[1]
+
+
+# Canonical name of a country value, the one COUNTRY_TLDS and the gazetteer
+# use: "CO", "COL", " colombia" and "Colombia" all give "Colombia". Values
+# that aren't a known country are returned as they are.
+@lru_cache(maxsize=4096)
+def canonical_country(country):
+    return country_index().get(country_key(country), country) if country else country
+
+
+# Version that cached results are stored under. A different gazetteer gives
+# different cities, even one of the same size, so its content is part of it.
+def results_version():
+    return f"{RULESET_VERSION}/{city_gazetteer().digest()}"
+
+# Run of letters and spaces, entered only at its first word: a city candidate
+# runs to the end of the run, so a later word of the same run can't match where
+# the first one didn't. Trying every word would rescan the run once per word.
+# A lookahead that captures, then a backreference to what it captured, never
+# gives back any of it, like an atomic group but on every Python 3 version.
+_RUN_START = r'(?<![a-zA-Z\s])(?=(?P<run>[a-zA-Z\s]*?\b(?=[A-Z])))(?P=run)'
+
+# Patterns like "City: X" or "X, City" or "City of X"; the city group holds the
+# city. Matching takes time linear in the length of the text.
+_CITY_INDICATOR_PATTERNS = [
+    r'\bCity:\s*(?P<city>[A-Z][a-zA-Z\s]+)(?=[\s,;]|$)',
+    _RUN_START + r'(?P<city>[A-Z](?=(?P<rest>[a-zA-Z\s]+))(?P=rest)),\s*(?:City|Town|Village|Municipality)(?=[\s,;]|$)',
+    r'\b(?:City|Town|Village|Municipality)\s+of\s+(?P<city>[A-Z][a-zA-Z\s]+)(?=[\s,;]|$)',
+    # The city runs up to the spaces before the dash; they are stripped off
+    _RUN_START + r'(?P<city>[A-Z](?=(?P<rest>[a-zA-Z\s]{2,}))(?P=rest)(?<=\s))(?=-\s*(?:Colombia|Mexico|Brazil|Chile|Argentina|Peru|Ecuador|Venezuela|Uruguay|Paraguay|Bolivia|Panama|Guatemala|El Salvador|Honduras|Nicaragua|Dominican Republic|Jamaica|Trinidad|Canada|Australia|New Zealand|Singapore|South Korea|Japan|Israel|South Africa|Morocco|Egypt|Turkey|UAE|Saudi Arabia|Qatar|Kuwait|Bahrain|Oman|Jordan|UK))'
+]
+
+# Special case for the "Medellin - Colombia" pattern; the city group holds the city
+_CITY_DASH_PATTERN = r'\b(?P<city>[A-Z][a-zA-Z]+)\s*-\s*[A-Za-z]+\b'
+
+
+# Compiled address patterns. Each is wrapped in a group so the batch engine can
+# extract the whole match.
+@lru_cache(maxsize=None)
+def address_patterns():
+    return tuple(re.compile('(' + pattern + ')', re.I) for pattern in _ADDRESS_PATTERNS)
+
+
+@lru_cache(maxsize=None)
+def city_indicator_patterns():
+    return tuple(re.compile(pattern, re.I) for pattern in _CITY_INDICATOR_PATTERNS)
+
+
+@lru_cache(maxsize=None)
+def city_dash_pattern():
+    return re.compile(_CITY_DASH_PATTERN, re.I)
+
+
+# The tables built on first use are also module attributes under their old
+# names (from cleanup_core import CITY_GAZETTEER), built when first read
+_LAZY_ATTRIBUTES = {
+    'ADDRESS_PATTERNS': address_patterns,
+    'CITY_INDICATOR_PATTERNS': city_indicator_patterns,
+    'CITY_DASH_PATTERN': city_dash_pattern,
+    'CITY_GAZETTEER': city_gazetteer,
+    'COUNTRY_INDEX': country_index,
+    'RESULTS_VERSION': results_version,
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Street types and directions that are never city candidates
+STREET_WORD_PATTERN = re.compile(r'^(St|Ave|Rd|Blvd|Ln|Dr|Ct|Plz|Sq|Hwy|Rt|North|South|East|West|NE|NW|SE|SW)$', re.I)
+
+# Smaller helpers used by the functions below
+SCHEME_PATTERN = re.compile(r'^https?://', re.I)
+WWW_PATTERN = re.compile(r'^www\.', re.I)
+ADDRESS_SEGMENT_SPLIT = re.compile(r'[,;\n]+')
+CITY_PART_SPLIT = re.compile(r'[\s,;:\-\/]+')
+DIGITS_PATTERN = re.compile(r'^\d+$')
+_DIGIT = re.compile(r'\d')
+_ASCII_LETTER = re.compile(r'[A-Za-z]')
+_WHITESPACE = re.compile(r'\s+')
+
+# Function to validate and correct email addresses
+def validate_and_correct_email(email, country, website):
+    if not email and not website:
+        return ""
+    
+    # Extract username part (before @)
+    username = ""
+    if email:
+        # If email contains @, get the part before it
+        if "@" in email:
+            username = email.split("@")[0].strip().lower()
+        else:
+            # If no @, assume the entire string is the username
+            username = email.strip().lower()
+    
+    # If no username was found, return empty
+    if not username:
+        return ""
+    
+    # Get domain from website
+    domain = ""
+    if website:
+        try:
+            # Clean up the website URL
+            website_url = website.strip()
+            if not SCHEME_PATTERN.match(website_url):
+                website_url = 'https://' + website_url
+            
+            # Parse the URL and extract domain
+            parsed_url = urlparse(website_url)
+            domain = parsed_url.netloc.lower()
+            
+            # Remove 'www.' prefix if present
+            domain = WWW_PATTERN.sub('', domain)
+        except Exception:
+            # If website parsing fails, try basic extraction
+            domain = website.strip().lower()
+            domain = SCHEME_PATTERN.sub('', domain)
+            domain = WWW_PATTERN.sub('', domain)
+            domain = domain.split('/')[0]
+    
+    # If still no domain, try to extract from email
+    if not domain and email and "@" in email and "." in email:
+        domain = email.split("@")[1].strip().lower()
+    
+    # If still no domain, use country TLD or default
+    if not domain:
+        domain = COUNTRY_TLDS.get(canonical_country(country), 'domain.com') if country else 'domain.com'
+    
+    # Construct the email
+    return f"{username}@{domain}"
+
+# Function to cleanup address
+def cleanup_address(address_text):
+    if not address_text:
+        return ""
+    address_text = address_text[:MAX_ADDRESS_LENGTH]
+    
+    # Try to find address patterns in the text
+    for pattern in address_patterns():
+        match = pattern.search(address_text)
+        if match:
+            # Found a potential address
+            return match.group(0).strip()
+    
+    return _address_fallback(address_text)
+
+# Used by cleanup_address when none of the address patterns match
+def _address_fallback(address_text):
+    # Look for any segment with numbers and letters that might be an address
+    segments = ADDRESS_SEGMENT_SPLIT.split(address_text)
+    
+    for segment in segments:
+        # Look for segments that have both numbers and letters (typical for addresses)
+        if _DIGIT.search(segment) and _ASCII_LETTER.search(segment) and len(segment) > 5:
+            return segment.strip().replace(r'\s+', ' ')
+    
+    # If still nothing found, return the first part of the text (limited to 50 chars)
+    first_part = address_text.strip().split(r'[,;\n]')[0]
+    if len(first_part) > 50:
+        first_part = first_part[:50]
+    return _WHITESPACE.sub(' ', first_part)
+
+# Function to extract city from address
+def extract_city(address_text, country):
+    if not address_text:
+        return ""
+    address_text = address_text[:MAX_ADDRESS_LENGTH]
+    
+    # First look for known cities (whole words, ignoring case and accents)
+    country = canonical_country(country)
+    gazetteer = city_gazetteer()
+    if country and country in gazetteer:
+        city = gazetteer.find(address_text, country)
+        if city:
+            return city
+    
+    # If no match with known cities, try some heuristics
+    
+    # Look for patterns like "City: X" or "X, City" or "City of X"
+    for pattern in city_indicator_patterns():
+        match = pattern.search(address_text)
+        if match and match.group('city'):
+            return match.group('city').strip()
+    
+    # Special case for "Medellin - Colombia" pattern as in the example
+    special_match = city_dash_pattern().search(address_text)
+    if special_match:
+        return special_match.group('city').strip()
+    
+    # Split by common delimiters and look for capitalized words that might be cities
+    parts = CITY_PART_SPLIT.split(address_text)
+    candidates = []
+    
+    for part in parts:
+        # Skip empty or very short parts
+        if not part or len(part) < 3:
+            continue
+        
+        # Check if it's capitalized and not a street type or direction
+        if (part[0].isupper() and
+            not STREET_WORD_PATTERN.match(part) and
+            not DIGITS_PATTERN.match(part)):  # Not just numbers
+            candidates.append(part)
+    
+    # Return the best candidate (preferring longer words, as they're more likely to be city names)
+    if candidates:
+        candidates.sort(key=len, reverse=True)
+        return candidates[0]
+    
+    return ""
+
+# Function to extract logo from website using Clearbit API, or by looking at
+# the website itself when a LogoFinder is given
+def extract_logo_from_website(website, finder=None):
+    if not website:
+        return ""
+    
+    try:
+        # Clean up the website URL to get just the domain
+        domain = website.strip().lower()
+        domain = SCHEME_PATTERN.sub('', domain)
+        domain = WWW_PATTERN.sub('', domain)
+        domain = domain.split('/')[0]
+        
+        # Look for the logo on the website itself (see cleanup_logos.LogoFinder)
+        if finder is not None:
+            return finder.find(domain)
+        
+        # Use Clearbit's logo API - this is a free service with generous limits
+        return f"https://logo.clearbit.com/{domain}"
+    
+    except Exception as e:
+        logger.warning(f"Error extracting logo: {str(e)}")
+        return f"https://via.placeholder.com/150?text=Error"
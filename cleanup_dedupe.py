@@ -0,0 +1,304 @@
+# Approximate duplicate detection over cleaned contacts.
+#
+# Rows are linked when they share a company domain (the website's, else the
+# email's, leaving out free mail providers and the placeholder domains the email
+# cleanup falls back to) or when their addresses are the same or nearly the same
+# within the same country and city, unless that would join two domains. Addresses are only compared inside these
+# (country, city) blocks, and inside a block only with their nearest neighbours
+# in sorted order (sorted neighbourhood), sorting once by the address and once
+# by its words reversed. The work grows with rows times the window rather than
+# with the square of the rows. Linked rows form clusters through union-find;
+# every row gets a cluster ID and every cluster one merged row.
+import os
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from cleanup_engine import _text, _website_domains, map_unique
+from cleanup_io import DEFAULT_CHUNK_ROWS, ChunkWriter, iter_chunks, sheet_names
+
+# Addresses compared with each one in sorted order
+DEFAULT_WINDOW = 5
+
+# Share of address words two addresses must have in common (Jaccard) to match
+DEFAULT_THRESHOLD = 0.8
+
+# Addresses with fewer words are not matched on
+MIN_ADDRESS_WORDS = 2
+
+CLUSTER_COLUMN = 'Cluster ID'
+ROWS_COLUMN = 'Rows'
+
+DEDUPE_STAGE = 'dedupe'
+
+# Email domains that say nothing about the company
+FREE_MAIL_DOMAINS = frozenset([
+    'gmail.com', 'googlemail.com', 'hotmail.com', 'hotmail.es', 'outlook.com', 'outlook.es', 'live.com',
+    'msn.com', 'yahoo.com', 'yahoo.es', 'yahoo.com.br', 'ymail.com', 'aol.com', 'icloud.com', 'me.com',
+    'protonmail.com', 'proton.me', 'gmx.com', 'gmx.de', 'mail.com', 'yandex.com', 'qq.com', '163.com',
+])
+
+# Spellings of common address words, reduced to one form before comparing
+ADDRESS_WORDS = {
+    'street': 'st', 'avenue': 'ave', 'av': 'ave', 'avenida': 'ave', 'road': 'rd', 'boulevard': 'blvd',
+    'drive': 'dr', 'lane': 'ln', 'calle': 'cl', 'carrera': 'cra', 'kr': 'cra', 'cr': 'cra',
+    'diagonal': 'dg', 'transversal': 'tv', 'suite': 'ste', 'number': 'no', 'numero': 'no', 'nro': 'no',
+}
+
+
+# Lowercase ASCII words of a text, accents removed
+def _fold(text):
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(char if char.isalnum() else ' ' for char in text if not unicodedata.combining(char))
+
+
+# Comparable form of each distinct address: folded words, common spellings unified
+def _address_keys(address):
+    def key(text):
+        return ' '.join(ADDRESS_WORDS.get(word, word) for word in _fold(text).split())
+
+    return address.map(key).astype(object)
+
+
+def _folded(values):
+    return values.map(lambda text: ' '.join(_fold(text).split())).astype(object)
+
+
+# Company domain of each row, or "" when there is none worth matching on
+def _company_domains(data, column_mappings):
+    length = len(data)
+    website_col = column_mappings.get('website')
+    email_col = column_mappings.get('email')
+    domain = pd.Series([""] * length, dtype=object)
+    if website_col and website_col in data.columns:
+        domain = map_unique(_website_domains, [_text(data[website_col])], name='website domain').fillna("")
+    if email_col and email_col in data.columns:
+        email = _text(data[email_col])
+        from_email = email.str.rpartition('@')[2].str.strip().str.lower().where(email.str.contains('@'), "")
+        domain = domain.where(domain != "", from_email)
+    # Placeholders like domain.co come from the email cleanup, not from the data
+    ignored = domain.isin(FREE_MAIL_DOMAINS) | domain.str.startswith('domain.')
+    return domain.where(~ignored, "").astype(object)
+
+
+# Union-find where each set holds at most one domain: sets with two different
+# domains are never joined, so an address two companies share (an office
+# building, a mailbox service) doesn't merge them
+class _DisjointSet:
+    def __init__(self, size, domains):
+        self.parent = list(range(size))
+        # Domain of each set by its root, or -1
+        self.domain = list(range(domains)) + [-1] * (size - domains)
+
+    def find(self, node):
+        parent = self.parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return
+        first_domain, second_domain = self.domain[first], self.domain[second]
+        if first_domain >= 0 and second_domain >= 0:
+            return
+        root, child = min(first, second), max(first, second)
+        self.parent[child] = root
+        self.domain[root] = max(first_domain, second_domain)
+
+    def roots(self):
+        return np.array([self.find(node) for node in range(len(self.parent))], dtype=np.int64)
+
+
+# Pairs of distinct addresses (as indexes into keys) that match: neighbours
+# within window in sorted order, in the same block, with enough words in common
+def _similar_addresses(blocks, keys, window, threshold):
+    words = [frozenset(key.split()) for key in keys]
+    reversed_keys = [' '.join(reversed(key.split())) for key in keys]
+    pairs = []
+    for sort_keys in (keys, reversed_keys):
+        ranks = pd.factorize(pd.Series(sort_keys, dtype=object), sort=True)[0]
+        order = np.lexsort((ranks, blocks)).tolist()
+        for position, node in enumerate(order):
+            block, node_words = blocks[node], words[node]
+            for other in order[position + 1:position + window]:
+                if blocks[other] != block:
+                    break
+                other_words = words[other]
+                # Sets whose sizes differ too much can't reach the threshold
+                if min(len(node_words), len(other_words)) < threshold * max(len(node_words), len(other_words)):
+                    continue
+                if len(node_words & other_words) >= threshold * len(node_words | other_words):
+                    pairs.append((node, other))
+    return pairs
+
+
+# Cluster ID (1, 2, ... in order of first appearance) for every row of data,
+# as a Series with data's index. Only the mapped website, email, address, city
+# and country columns are read.
+def find_clusters(data, column_mappings, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD):
+    length = len(data)
+    if not length:
+        return pd.Series([], index=data.index, dtype=np.int64)
+
+    def column(field):
+        name = column_mappings.get(field)
+        return _text(data[name]) if name and name in data.columns else pd.Series([""] * length, dtype=object)
+
+    domain_codes, domains = pd.factorize(_company_domains(data, column_mappings))
+    domain_codes = np.where(domains[domain_codes] == "", -1, domain_codes) if len(domains) else domain_codes
+
+    # One node per distinct (country, city, address); repeats are the same node
+    address = map_unique(_address_keys, [column('address')])
+    block_codes, _ = pd.factorize(
+        map_unique(_folded, [column('country')]) + '\x1f' + map_unique(_folded, [column('city')])
+    )
+    address_codes, address_uniques = pd.factorize(pd.Series(block_codes).astype(str) + '\x1f' + address)
+    # Addresses of a single word ("Centro", "Downtown") don't identify a company
+    address_codes = np.where(address.str.count(' ').to_numpy() < MIN_ADDRESS_WORDS - 1, -1, address_codes)
+
+    # Nodes: domains first, then addresses
+    offset = len(domains)
+    nodes = _DisjointSet(offset + len(address_uniques), offset)
+    linked = pd.DataFrame({'domain': domain_codes, 'address': address_codes})
+    linked = linked[(linked['domain'] >= 0) & (linked['address'] >= 0)].drop_duplicates()
+    for domain_code, address_code in zip(linked['domain'].tolist(), linked['address'].tolist()):
+        nodes.union(domain_code, offset + address_code)
+
+    # Near-identical addresses in the same block
+    valid = np.flatnonzero(address_codes >= 0)
+    used, first_rows = np.unique(address_codes[valid], return_index=True)
+    if len(used) > 1:
+        rows = valid[first_rows]
+        node_keys = address.to_numpy()[rows].tolist()
+        for first, second in _similar_addresses(block_codes[rows], node_keys, window, threshold):
+            nodes.union(offset + int(used[first]), offset + int(used[second]))
+
+    roots = nodes.roots()
+    row_roots = np.where(
+        domain_codes >= 0, roots[np.maximum(domain_codes, 0)],
+        np.where(address_codes >= 0, roots[offset + np.maximum(address_codes, 0)], -1)
+    )
+    # Rows with neither a domain nor an address are clusters of their own
+    alone = row_roots < 0
+    row_roots[alone] = len(roots) + np.flatnonzero(alone)
+    clusters, _ = pd.factorize(row_roots)
+    return pd.Series(clusters + 1, index=data.index, dtype=np.int64)
+
+
+# One row per cluster: its ID, how many rows it has, and the first non-empty
+# value of every column in row order
+def merge_clusters(data, clusters):
+    values = data.copy(deep=False)
+    for name in values.columns:
+        if not pd.api.types.is_numeric_dtype(values[name]):
+            values[name] = values[name].astype(object).mask(values[name].astype(object) == "")
+    grouped = values.groupby(clusters.to_numpy(), sort=True)
+    merged = grouped.first()
+    merged.insert(0, ROWS_COLUMN, grouped.size().to_numpy())
+    merged.insert(0, CLUSTER_COLUMN, merged.index.to_numpy())
+    return merged.reset_index(drop=True)
+
+
+# Merge the merged views of consecutive parts of the same data
+def _combine_merged(parts):
+    merged = pd.concat(parts, ignore_index=True)
+    grouped = merged.groupby(CLUSTER_COLUMN, sort=True)
+    combined = grouped.first()
+    combined[ROWS_COLUMN] = grouped[ROWS_COLUMN].sum()
+    return combined.reset_index()
+
+
+# Add cluster IDs to data, in front, and build the merged view: (clustered data, merged)
+def deduplicate(data, column_mappings, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD):
+    clusters = find_clusters(data, column_mappings, window, threshold)
+    clustered = data.copy(deep=False)
+    clustered.insert(0, CLUSTER_COLUMN, clusters)
+    return clustered, merge_clusters(data, clusters)
+
+
+# Chunks of a results file written in output_format, every worksheet of a
+# workbook in turn (ChunkWriter starts another one when a sheet is full)
+def _iter_results(path, output_format, chunk_size, usecols=None):
+    name = f"results.{output_format}"
+    for sheet in sheet_names(path, name):
+        yield from iter_chunks(path, name, chunk_size, usecols, sheet)
+
+
+# Deduplicate a results file (in output_format) without loading all of it:
+# only the mapped columns are kept to find the clusters, then the file is
+# rewritten a chunk at a time with the cluster IDs in front (to output_path,
+# which may be path itself). The merged view is written to merged_path (in
+# merged_format, default output_format) in a last pass, each cluster's row
+# where its first row is; only the clusters with several rows are held in
+# memory until then. Returns a summary (see summarize).
+def dedupe_file(path, column_mappings, output_path, merged_path, output_format='csv', chunk_size=DEFAULT_CHUNK_ROWS,
+                window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD, profiler=None, merged_format=None):
+    started = time.perf_counter()
+    fields = ('website', 'email', 'address', 'city', 'country')
+    wanted = list(dict.fromkeys(column_mappings[field] for field in fields if column_mappings.get(field)))
+    keys = [chunk[[name for name in wanted if name in chunk.columns]]
+            for chunk in _iter_results(path, output_format, chunk_size)]
+    keys = pd.concat(keys, ignore_index=True) if keys else pd.DataFrame()
+    clusters = find_clusters(keys, column_mappings, window, threshold)
+    del keys
+
+    codes = clusters.to_numpy()
+    sizes = clusters.value_counts(sort=False)
+    repeated = clusters.isin(sizes.index[sizes > 1]).to_numpy()
+    # IDs count up in order of first appearance, so a row whose ID is above all
+    # the ones before it starts its cluster
+    first = codes > np.maximum.accumulate(np.concatenate([[0], codes[:-1]]))
+
+    temporary_path = f"{output_path}.dedupe"
+    # Each chunk's part of the clusters with several rows, combined once all are read
+    parts = []
+    start = 0
+    with ChunkWriter(temporary_path, output_format) as writer:
+        for chunk in _iter_results(path, output_format, chunk_size):
+            chunk = chunk.reset_index(drop=True)
+            rows = slice(start, start + len(chunk))
+            start += len(chunk)
+            if repeated[rows].any():
+                parts.append(merge_clusters(chunk[repeated[rows]], clusters.iloc[rows][repeated[rows]]))
+            chunk.insert(0, CLUSTER_COLUMN, codes[rows])
+            writer.write(chunk)
+
+    duplicates = _combine_merged(parts).set_index(CLUSTER_COLUMN, drop=False) if parts else None
+    written = False
+    start = 0
+    with ChunkWriter(merged_path, merged_format or output_format) as merged_writer:
+        for chunk in _iter_results(path, output_format, chunk_size):
+            chunk = chunk.reset_index(drop=True)
+            rows = slice(start, start + len(chunk))
+            start += len(chunk)
+            single = first[rows] & ~repeated[rows]
+            parts = [merge_clusters(chunk[single], clusters.iloc[rows][single])]
+            opened = codes[rows][first[rows] & repeated[rows]]
+            if len(opened):
+                parts.append(duplicates.loc[opened].reset_index(drop=True))
+            merged = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+            if len(merged):
+                merged_writer.write(merged.sort_values(CLUSTER_COLUMN, ignore_index=True))
+                written = True
+        if not written:
+            merged_writer.write(merge_clusters(pd.DataFrame(), clusters))
+    os.replace(temporary_path, output_path)
+    if profiler is not None:
+        profiler.record(DEDUPE_STAGE, time.perf_counter() - started, len(clusters))
+    return summarize(pd.DataFrame({ROWS_COLUMN: sizes.to_numpy()}))
+
+
+# Counts for a merged view: rows, clusters, and rows that duplicate another
+def summarize(merged):
+    rows = int(merged[ROWS_COLUMN].sum()) if len(merged) else 0
+    return {
+        'rows': rows,
+        'clusters': len(merged),
+        'duplicate_clusters': int((merged[ROWS_COLUMN] > 1).sum()) if len(merged) else 0,
+        'duplicate_rows': rows - len(merged),
+    }
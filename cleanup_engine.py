@@ -0,0 +1,685 @@
+# Column-at-a-time processing engine.
+#
+# Each task runs as a batch over whole columns using pandas string operations,
+# and gives the same results as the row-wise functions in cleanup_core. Tasks
+# form a small graph of stages (see STAGES), so what several of them need,
+# like the website's domain, is worked out once and shared.
+import multiprocessing
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from cleanup_core import (
+    CITY_PART_SPLIT,
+    COUNTRY_TLDS,
+    DIGITS_PATTERN,
+    MAX_ADDRESS_LENGTH,
+    SCHEME_PATTERN,
+    STREET_WORD_PATTERN,
+    WWW_PATTERN,
+    _address_fallback,
+    address_patterns,
+    canonical_country,
+    city_dash_pattern,
+    city_gazetteer,
+    city_indicator_patterns,
+    cleanup_address,
+    extract_city,
+    extract_logo_from_website,
+    results_version,
+    validate_and_correct_email,
+)
+from cleanup_cache import open_cache
+from cleanup_logos import logo_finder
+from cleanup_profile import PREPARE_STAGE, Profiler
+from cleanup_progress import ProgressReporter
+
+# Rows processed at a time; progress is reported between chunks
+DEFAULT_CHUNK_SIZE = 50_000
+
+# Processing tasks in the order they are applied to each row
+TASKS = ['email', 'address', 'city', 'logo']
+
+# Steps whose results are worth keeping in the on-disk cache between runs
+PERSISTENT_STEPS = {'address', 'city', 'website domain'}
+
+# Joins multi-column inputs into one cache key
+_KEY_SEPARATOR = '\x1f'
+
+
+# Convert a column to strings the same way the row loop did: str(value), or "" for missing values
+def _text(series):
+    values = series.to_numpy(dtype=object)
+    values = np.where(pd.isna(values), "", values)
+    return pd.Series([value if type(value) is str else str(value) for value in values], dtype=object)
+
+
+def _empty(length):
+    return pd.Series([""] * length, dtype=object)
+
+
+# Work out which tasks can run with the given column mappings
+def active_tasks(column_mappings):
+    email_col = column_mappings.get('email')
+    website_col = column_mappings.get('website')
+    address_col = column_mappings.get('address')
+    city_col = column_mappings.get('city')
+    country_col = column_mappings.get('country')
+    logo_col = column_mappings.get('logo')
+
+    tasks = []
+    if email_col and website_col:
+        tasks.append('email')
+    if address_col:
+        tasks.append('address')
+    if city_col and address_col and country_col:
+        tasks.append('city')
+    if logo_col and website_col:
+        tasks.append('logo')
+    return tasks
+
+
+# Counts how many values each memoized step saw and how many it actually computed
+class CacheStats:
+    def __init__(self):
+        self.counts = {}
+
+    def record(self, name, rows, computed):
+        total_rows, total_computed = self.counts.get(name, (0, 0))
+        self.counts[name] = (total_rows + rows, total_computed + computed)
+
+    # Add counts from another CacheStats (or its .counts), e.g. from a worker process
+    def merge(self, other):
+        for name, (rows, computed) in getattr(other, 'counts', other).items():
+            self.record(name, rows, computed)
+
+    # Share of values served from an earlier computation, for one step or overall
+    def hit_ratio(self, name=None):
+        counts = [self.counts[name]] if name else list(self.counts.values())
+        rows = sum(r for r, _ in counts)
+        computed = sum(c for _, c in counts)
+        return 1 - computed / rows if rows else 0.0
+
+    def summary(self):
+        return {
+            name: {'rows': rows, 'computed': computed, 'hit_ratio': self.hit_ratio(name)}
+            for name, (rows, computed) in self.counts.items()
+        }
+
+
+# Run fn over inputs, taking whatever results the on-disk cache already has
+# and storing the rest. Returns the results and how many had to be computed.
+# The results are stored under keys, which default to the inputs; a stage that
+# also reads other stages' results stores them under its source values instead.
+def _cached_call(fn, inputs, cache, name, keys=None):
+    keys = inputs if keys is None else keys
+    keys = keys[0] if len(keys) == 1 else keys[0].str.cat(keys[1:], sep=_KEY_SEPARATOR)
+    keys = keys.to_numpy(dtype=object)
+    found = cache.get_many(name, results_version(), keys.tolist())
+
+    missing = np.array([key not in found for key in keys], dtype=bool)
+    results = np.empty(len(keys), dtype=object)
+    results[~missing] = [found[key] for key in keys[~missing]]
+    if missing.any():
+        computed = fn(*[column[missing].reset_index(drop=True) for column in inputs]).to_numpy()
+        results[missing] = computed
+        cache.put_many(name, results_version(), dict(zip(keys[missing], computed)))
+    return results, int(missing.sum())
+
+
+# Number every distinct combination of values of some columns, given each
+# column's pd.factorize result: (codes per row, the first row of each code).
+# factorize numbers values in order of first appearance, so the first row of
+# each code, in row order, is that code's representative.
+def _group_rows(factorized):
+    codes = None
+    for column_codes, column_uniques in factorized:
+        if codes is None:
+            codes = column_codes
+        else:
+            codes, _ = pd.factorize(codes * len(column_uniques) + column_codes)
+    return codes, pd.Series(codes).drop_duplicates().index.to_numpy()
+
+
+# Run fn once per distinct combination of input values and broadcast the
+# results back to every row (factorize, compute, take). Inputs are equal-length
+# Series with a 0..n-1 index. With a ResultCache, distinct values computed in
+# earlier runs are read from it instead.
+def map_unique(fn, inputs, stats=None, name=None, cache=None):
+    length = len(inputs[0])
+    if not length:
+        return fn(*inputs)
+
+    codes, first = _group_rows([pd.factorize(column) for column in inputs])
+    if len(first) < length:
+        inputs = [column.iloc[first].reset_index(drop=True) for column in inputs]
+
+    if cache is None:
+        unique_results, computed = fn(*inputs).to_numpy(), len(first)
+    else:
+        unique_results, computed = _cached_call(fn, inputs, cache, name)
+    if stats is not None:
+        stats.record(name, length, computed)
+
+    if len(first) < length:
+        unique_results = unique_results[codes]
+    return pd.Series(unique_results, dtype=object)
+
+
+# Patterns only the batch engine needs
+_UNSAFE_URL_CHARS = re.compile(r'[\t\r\n]')
+_NETLOC = re.compile(r'^[A-Za-z]+://([^/?#]*)')
+_UNUSUAL_NETLOC = re.compile(r'[\[\]]|[^\x00-\x7f]')
+
+
+# Domain from the website, following what urlparse does for http(s) URLs.
+# None marks bracketed or non-ASCII hosts, which urlparse validates further.
+def _website_domains(website):
+    site = website.str.strip()
+    has_scheme = site.str.match(SCHEME_PATTERN)
+    url = site.where(has_scheme, 'https://' + site).str.replace(_UNSAFE_URL_CHARS, '', regex=True)
+    netloc = url.str.extract(_NETLOC, expand=False).fillna("")
+    domain = netloc.str.lower().str.replace(WWW_PATTERN, '', regex=True)
+    return domain.where(~netloc.str.contains(_UNUSUAL_NETLOC, regex=True), None).astype(object)
+
+
+# Batch version of validate_and_correct_email, for canonical country names (see
+# canonical_country). Websites repeat a lot, so their domains are parsed once
+# per distinct value, unless the website domains (see _website_domains) are
+# passed in already.
+def correct_emails(email, country, website, stats=None, cache=None, domain=None):
+    # Username is everything before the first @, or the whole value
+    username = email.str.split('@', n=1).str[0].str.strip().str.lower()
+
+    if domain is None:
+        domain = map_unique(_website_domains, [website], stats, 'website domain', cache)
+    unusual = domain.isna() & (username != "")
+    domain = domain.fillna("")
+
+    # Fall back to the domain part of the email
+    from_email = (domain == "") & email.str.contains('@', regex=False) & email.str.contains('.', regex=False)
+    # (between the first and any second @; partition keeps it text even when no value has one)
+    email_domain = email.str.partition('@')[2].str.partition('@')[0]
+    domain = domain.where(~from_email, email_domain.str.strip().str.lower())
+
+    # Then to the country TLD or the default
+    from_country = domain == ""
+    domain = domain.where(~from_country, country.map(COUNTRY_TLDS).fillna('domain.com'))
+
+    result = (username + '@' + domain).where(username != "", "")
+
+    # Leave hosts urlparse validates further to the row function
+    if unusual.any():
+        rows = unusual[unusual].index
+        result.loc[rows] = [
+            validate_and_correct_email(email[i], country[i], website[i]) for i in rows
+        ]
+
+    return result.astype(object)
+
+
+# Batch version of cleanup_address
+def cleanup_addresses(address):
+    address = address.str[:MAX_ADDRESS_LENGTH]
+    result = _empty(len(address))
+    pending = address != ""
+
+    # The first pattern that matches wins
+    for pattern in address_patterns():
+        if not pending.any():
+            break
+        found = address[pending].str.extract(pattern, expand=False)
+        found = found[found.notna()]
+        result.loc[found.index] = found.str.strip()
+        pending.loc[found.index] = False
+
+    # Rows no pattern matched are rare; use the row-wise fallback for them
+    if pending.any():
+        result.loc[pending] = address[pending].map(_address_fallback)
+
+    return result
+
+
+# Batch version of extract_city, for canonical country names (see canonical_country)
+def extract_cities(address, country):
+    address = address.str[:MAX_ADDRESS_LENGTH]
+    result = _empty(len(address))
+    pending = address != ""
+
+    # Known cities, in one pass over the rows whose country the gazetteer has
+    gazetteer = city_gazetteer()
+    known = pending & country.isin(gazetteer.countries())
+    if known.any():
+        rows = known[known].index
+        found = pd.Series(
+            [gazetteer.find(text, name) for text, name in zip(address[rows], country[rows])],
+            index=rows, dtype=object
+        )
+        found = found[found != ""]
+        result.loc[found.index] = found
+        pending.loc[found.index] = False
+
+    # Indicator patterns, then the "Medellin - Colombia" special case
+    for pattern in city_indicator_patterns() + (city_dash_pattern(),):
+        if not pending.any():
+            break
+        found = address[pending].str.extract(pattern)['city']
+        found = found[found.notna() & (found != "")]
+        result.loc[found.index] = found.str.strip()
+        pending.loc[found.index] = False
+
+    if not pending.any():
+        return result
+
+    # Longest capitalized word that isn't a street type, direction or number
+    parts = address[pending].str.split(CITY_PART_SPLIT, regex=True).explode()
+    parts = parts[parts.str.len() >= 3]
+    parts = parts[
+        parts.str[0].str.isupper()
+        & ~parts.str.match(STREET_WORD_PATTERN)
+        & ~parts.str.match(DIGITS_PATTERN)
+    ]
+    if len(parts):
+        candidates = pd.DataFrame({'row': parts.index, 'part': parts.to_numpy()})
+        candidates['length'] = candidates['part'].str.len()
+        best = candidates.groupby('row')['length'].idxmax()
+        result.loc[best.index] = candidates.loc[best.to_numpy(), 'part'].to_numpy()
+
+    return result
+
+
+# Domain part of each website, the way extract_logo_from_website cleans it
+def _logo_domains(website):
+    domain = website.str.strip().str.lower()
+    domain = domain.str.replace(SCHEME_PATTERN, '', regex=True)
+    domain = domain.str.replace(WWW_PATTERN, '', regex=True)
+    return domain.str.split('/', n=1).str[0]
+
+
+# Batch version of extract_logo_from_website
+def extract_logos(website):
+    return _clearbit_logos(website, _logo_domains(website))
+
+
+def _clearbit_logos(website, domain):
+    return ('https://logo.clearbit.com/' + domain).where(website != "", "").astype(object)
+
+
+# Batch version of extract_logo_from_website with a LogoFinder: every distinct
+# domain's home page is fetched once, concurrently
+def find_logos(website):
+    return _found_logos(website, _logo_domains(website))
+
+
+def _found_logos(website, domain):
+    domain = domain.where(website != "", "")
+    logos = logo_finder().find_many(domain.unique().tolist())
+    return domain.map(logos).astype(object)
+
+
+# Canonical name of every country value (see canonical_country)
+def _canonical_countries(country):
+    return country.map(canonical_country).astype(object)
+
+
+def _email_stage(email, website, country, domain):
+    return correct_emails(email, country, website, domain=domain)
+
+
+# The tasks as a graph of stages: name -> (source fields, stages, function).
+# The function takes the fields' text followed by the other stages' results.
+# Intermediates several tasks need (the website domain, the logo domain, the
+# country) are stages of their own, so each is worked out once per chunk and
+# shared. Every stage but the per-row ones runs once per distinct combination
+# of the source fields it depends on, directly or through other stages. Each
+# field's values, and each combination of fields, are numbered once per chunk
+# for all the stages that use them.
+STAGES = {
+    'website domain': (('website',), (), _website_domains),
+    'logo domain': (('website',), (), _logo_domains),
+    'country name': (('country',), (), _canonical_countries),
+    'email': (('email', 'website'), ('country name', 'website domain'), _email_stage),
+    'address': (('address',), (), cleanup_addresses),
+    'city': (('address',), ('country name',), extract_cities),
+    'logo': (('website',), ('logo domain',), _clearbit_logos),
+}
+
+# Stages that run over every row: emails are mostly distinct
+ROW_STAGES = {'email'}
+
+# The cleanup_core function for each task's stage and the source fields it
+# takes. Every pandas string operation has a fixed cost of its own, so a stage
+# with fewer than ROW_FUNCTION_VALUES values to work out calls the function
+# once per value instead, which gives the same results; small batches, like
+# the service's, then cost little more than the functions themselves.
+ROW_FUNCTIONS = {
+    'email': (('email', 'country', 'website'), validate_and_correct_email),
+    'address': (('address',), cleanup_address),
+    'city': (('address', 'country'), extract_city),
+    'logo': (('website',), extract_logo_from_website),
+}
+ROW_FUNCTION_VALUES = 2_000
+
+# Source fields each task reads, in the order task_sources lists them
+TASK_FIELDS = {
+    'email': ('email', 'country', 'website'),
+    'address': ('address',),
+    'city': ('address', 'country'),
+    'logo': ('website',),
+}
+
+
+# Source columns each task reads. None stands for a column that isn't mapped
+# and reads as empty strings.
+def task_sources(task, column_mappings):
+    return [column_mappings.get(field) or None for field in TASK_FIELDS[task]]
+
+
+# Runs the stages over one chunk, each at most once, keeping every stage's
+# results and every numbering of distinct values for the stages after it
+class _ChunkPipeline:
+    def __init__(self, fields, stages, stats, cache, row_functions=ROW_FUNCTIONS):
+        # field -> text Series, for the mapped fields
+        self.fields = fields
+        self.stages = stages
+        self.row_functions = row_functions
+        self.stats = stats
+        self.cache = cache
+        self.length = len(next(iter(fields.values())))
+        # field -> factorize result; key fields -> (codes, first rows);
+        # stage -> results per row
+        self.factorized = {}
+        self.groups = {}
+        self.results = {}
+        # stage -> (seconds, rows, values computed), not counting the stages it reads
+        self.timings = {}
+
+    def field(self, name):
+        return self.fields[name] if name in self.fields else _empty(self.length)
+
+    # Source fields a stage's results depend on
+    def key_fields(self, name):
+        fields, needs, _ = self.stages[name]
+        return tuple(sorted(set(fields).union(*[self.key_fields(need) for need in needs])))
+
+    def group(self, key_fields):
+        if key_fields not in self.groups:
+            for name in key_fields:
+                if name not in self.factorized:
+                    self.factorized[name] = pd.factorize(self.field(name))
+            self.groups[key_fields] = _group_rows([self.factorized[name] for name in key_fields])
+        return self.groups[key_fields]
+
+    # Values a stage works out: one per row, or per distinct combination of its key fields
+    def values_needed(self, name):
+        if name in ROW_STAGES or not self.length:
+            return self.length
+        return len(self.group(self.key_fields(name))[1])
+
+    def run(self, name):
+        if name in self.results:
+            return self.results[name]
+        fields, needs, fn = self.stages[name]
+        if name in self.row_functions and self.values_needed(name) < ROW_FUNCTION_VALUES:
+            fields, function = self.row_functions[name]
+            fn = _row_wise(function)
+            needed = []
+        else:
+            needed = [self.run(need) for need in needs]
+        started = time.perf_counter()
+        inputs = [self.field(field) for field in fields] + needed
+
+        if name in ROW_STAGES or not self.length:
+            values, computed = fn(*inputs), self.length
+        else:
+            key_fields = self.key_fields(name)
+            codes, first = self.group(key_fields)
+            repeated = len(first) < self.length
+            if repeated:
+                inputs = [column.iloc[first].reset_index(drop=True) for column in inputs]
+            if self.cache is not None and name in PERSISTENT_STEPS:
+                keys = [self.field(field) for field in key_fields]
+                if repeated:
+                    keys = [column.iloc[first].reset_index(drop=True) for column in keys]
+                unique_results, computed = _cached_call(fn, inputs, self.cache, name, keys)
+            else:
+                unique_results, computed = fn(*inputs).to_numpy(), len(first)
+            self.stats.record(name, self.length, computed)
+            values = pd.Series(unique_results[codes] if repeated else unique_results, dtype=object)
+
+        self.results[name] = values
+        self.timings[name] = (time.perf_counter() - started, self.length, computed)
+        return values
+
+
+# A stage function that calls a row function on each row of its columns
+def _row_wise(function):
+    def run(*columns):
+        return pd.Series([function(*values) for values in zip(*columns)], dtype=object)
+    return run
+
+
+# Run the tasks over one chunk of text columns, sharing the stages they have in
+# common and computing each distinct input once. This is also what worker
+# processes run, so it only takes and returns picklable values: the results
+# per task, the cache counts and the stage timings as
+# {stage: (seconds, rows, values computed)}.
+# sources maps each source field the tasks read to its column in columns.
+# cache_path names an optional on-disk ResultCache; with discover_logos the
+# logo task looks for logos on the websites instead of using Clearbit.
+def _process_chunk(tasks, sources, columns, cache_path=None, discover_logos=False):
+    stats = CacheStats()
+    cache = open_cache(cache_path) if cache_path else None
+    stages = STAGES
+    row_functions = ROW_FUNCTIONS
+    if discover_logos:
+        stages = dict(STAGES, logo=(('website',), ('logo domain',), _found_logos))
+        row_functions = {name: row for name, row in ROW_FUNCTIONS.items() if name != 'logo'}
+    fields = {field: columns[source] for field, source in sources.items() if source}
+    pipeline = _ChunkPipeline(fields, stages, stats, cache, row_functions)
+    results = [pipeline.run(task).to_numpy() for task in tasks]
+    return results, stats.counts, pipeline.timings
+
+
+# Process pool for process_dataframe. Spawned workers only import the engine,
+# never the Streamlit app.
+def make_executor(workers):
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+# Run every task the column mappings allow and return a processed copy of the data.
+# progress_callback, if given, is called as progress_callback(done, total, message),
+# at most a few times per second; see cleanup_progress.ProgressReporter.
+# With workers > 1 the rows are split into chunks that run in a process pool;
+# results are put back in the original row order. Pass an executor from
+# make_executor to reuse one pool across calls. Pass a CacheStats as stats to
+# collect how many repeated values were served without recomputing them, and a
+# cache_path to reuse results stored on disk by earlier runs (see cleanup_cache).
+# With discover_logos, logos are looked up on the websites themselves (see
+# cleanup_logos) instead of pointing at Clearbit. Pass a cleanup_profile.Profiler
+# as profiler to record how long preparing the columns and each task took.
+# tasks limits the run to some of the tasks the mappings allow.
+def process_dataframe(data, column_mappings, progress_callback=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                      workers=1, executor=None, stats=None, cache_path=None, discover_logos=False,
+                      profiler=None, tasks=None):
+    # Output columns are replaced wholesale, so a shallow copy leaves the input untouched
+    processed = data.copy(deep=False)
+    tasks = [task for task in active_tasks(column_mappings) if tasks is None or task in tasks]
+    reporter = ProgressReporter(progress_callback, len(data) * len(tasks))
+    if not tasks:
+        reporter.finish()
+        return processed
+
+    # Source column of every field the tasks read
+    sources = {field: column_mappings.get(field) or None for task in tasks for field in TASK_FIELDS[task]}
+    missing = sorted({source for source in sources.values() if source and source not in data.columns})
+    if missing:
+        raise ValueError(f"Mapped column not found in the data: {', '.join(missing)}")
+
+    if profiler is None:
+        profiler = Profiler()
+
+    # Every task reads the original values, so convert each source column once
+    columns = {}
+    with profiler.stage(PREPARE_STAGE, len(data)):
+        for source in sources.values():
+            if source and source not in columns:
+                columns[source] = _text(data[source])
+
+    # Give each worker several chunks so slow chunks don't leave cores idle
+    total_rows = len(data)
+    if workers > 1:
+        chunk_size = max(1, min(chunk_size, -(-total_rows // (workers * 4))))
+    bounds = [(start, min(start + chunk_size, total_rows)) for start in range(0, total_rows, chunk_size)]
+
+    def chunk(start, stop):
+        return {name: column.iloc[start:stop].reset_index(drop=True) for name, column in columns.items()}
+
+    results = [None] * len(bounds)
+    rows_done = 0
+
+    def chunk_done(index):
+        nonlocal rows_done
+        results[index], counts, timings = results[index]
+        if stats is not None:
+            stats.merge(counts)
+        profiler.merge(timings)
+        start, stop = bounds[index]
+        rows_done += stop - start
+        reporter.advance((stop - start) * len(tasks), f"Processed {rows_done} of {total_rows} rows...")
+
+    def run_in(pool):
+        futures = {
+            pool.submit(_process_chunk, tasks, sources, chunk(*bound), cache_path, discover_logos): index
+            for index, bound in enumerate(bounds)
+        }
+        try:
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                chunk_done(index)
+        except BaseException:
+            # A chunk failed or the progress callback stopped the run (a
+            # cancelled job): drop the chunks that haven't started
+            for future in futures:
+                future.cancel()
+            raise
+
+    if executor is not None and len(bounds) > 1:
+        run_in(executor)
+    elif workers > 1 and len(bounds) > 1:
+        pool = make_executor(workers)
+        try:
+            run_in(pool)
+        except BaseException:
+            # Return now rather than wait for the chunks still running
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        pool.shutdown()
+    else:
+        for index, bound in enumerate(bounds):
+            results[index] = _process_chunk(tasks, sources, chunk(*bound), cache_path, discover_logos)
+            chunk_done(index)
+
+    # Write the outputs in task order, like the row loop did
+    for position, task in enumerate(tasks):
+        target = column_mappings[task]
+        if results:
+            processed[target] = np.concatenate([result[position] for result in results])
+        else:
+            processed[target] = np.array([], dtype=object)
+
+    reporter.finish()
+    return processed
+
+
+# Task outputs kept apart from the original data they were computed from, so
+# that after the column mappings change only the tasks whose inputs changed
+# are run again. Each output is stored with the signature it was computed
+# under: the source columns, the cleanup rules and the logo mode. Edited cells
+# are reported with mark_dirty(), and only their rows are run again. The
+# original DataFrame is never modified; apply() lays the outputs over a
+# shallow copy. One instance belongs to one original DataFrame; adding or
+# removing rows needs clear().
+class DerivedColumns:
+    def __init__(self):
+        # task -> (signature, values)
+        self.outputs = {}
+        # task -> sorted positions of the rows edited since its output was computed
+        self.dirty = {}
+
+    @staticmethod
+    def signature(task, column_mappings, discover_logos=False):
+        return (tuple(task_sources(task, column_mappings)), results_version(), task == 'logo' and discover_logos)
+
+    # Tasks the mappings allow whose stored output is missing or out of date
+    def stale_tasks(self, column_mappings, discover_logos=False):
+        return [
+            task for task in active_tasks(column_mappings)
+            if self.outputs.get(task, (None,))[0] != self.signature(task, column_mappings, discover_logos)
+        ]
+
+    # Record edits to the original data: rows are positions in it, columns
+    # the columns edited (all of them if None). Tasks that read none of the
+    # columns keep their outputs as they are.
+    def mark_dirty(self, rows, columns=None):
+        rows = np.asarray(rows, dtype=np.intp)
+        for task, (signature, _) in self.outputs.items():
+            if columns is None or set(signature[0]) & set(columns):
+                self.dirty[task] = np.union1d(self.dirty.get(task, rows[:0]), rows)
+
+    # Run the stale tasks over data, and the other tasks over the rows marked
+    # dirty, and return the processed view of it. Other keyword arguments are
+    # passed on to process_dataframe.
+    def update(self, data, column_mappings, discover_logos=False, **options):
+        stale = self.stale_tasks(column_mappings, discover_logos)
+        patched = [task for task in active_tasks(column_mappings) if task not in stale and task in self.dirty]
+        if stale:
+            processed = process_dataframe(
+                data, column_mappings, discover_logos=discover_logos, tasks=stale, **options
+            )
+            for task in stale:
+                self.outputs[task] = (
+                    self.signature(task, column_mappings, discover_logos),
+                    processed[column_mappings[task]].to_numpy()
+                )
+                self.dirty.pop(task, None)
+        if patched:
+            # Every patched task is run over the rows any of them needs; the
+            # extra rows come out as they were
+            rows = np.unique(np.concatenate([self.dirty.pop(task) for task in patched]))
+            processed = process_dataframe(
+                data.iloc[rows], column_mappings, discover_logos=discover_logos, tasks=patched, **options
+            )
+            for task in patched:
+                signature, values = self.outputs[task]
+                values = values.copy()
+                values[rows] = processed[column_mappings[task]].to_numpy()
+                self.outputs[task] = (signature, values)
+        if not stale and not patched and options.get('progress_callback'):
+            options['progress_callback'](1, 1, "Nothing to recompute")
+        return self.apply(data, column_mappings)
+
+    # data with the stored output of every task the mappings allow written to
+    # its mapped column, in task order
+    def apply(self, data, column_mappings):
+        processed = data.copy(deep=False)
+        for task in active_tasks(column_mappings):
+            if task in self.outputs:
+                processed[column_mappings[task]] = self.outputs[task][1]
+        return processed
+
+    def clear(self):
+        self.outputs = {}
+        self.dirty = {}
+
+    # A copy that update() can run on while this one is still read: stored
+    # values are replaced, never written to in place, so they are shared
+    def copy(self):
+        derived = DerivedColumns()
+        derived.outputs = dict(self.outputs)
+        derived.dirty = dict(self.dirty)
+        return derived
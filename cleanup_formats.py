@@ -0,0 +1,31 @@
+# File formats the tools read and write.
+#
+# Kept free of pandas and the other processing modules, so the first page of the
+# app can offer the formats without importing them; cleanup_io and cleanup_batch
+# re-export these names.
+import os
+
+OUTPUT_FORMATS = ['csv', 'xlsx', 'parquet', 'feather']
+
+# Formats that need pyarrow
+ARROW_FORMATS = ('parquet', 'feather')
+
+# File extensions the upload tab and the CLI accept
+INPUT_EXTENSIONS = ['csv', 'xlsx', 'xlsm', 'xls', 'parquet', 'pq', 'feather', 'arrow']
+
+# Extensions accepted in batch mode: the usual inputs plus zip archives
+BATCH_EXTENSIONS = INPUT_EXTENSIONS + ['zip']
+
+
+# File format from a file name: 'csv', 'xlsx', 'xls', 'parquet' or 'feather'
+def file_format(name):
+    extension = os.path.splitext(str(name))[1].lower().lstrip('.')
+    if extension in ('xlsx', 'xlsm'):
+        return 'xlsx'
+    if extension == 'xls':
+        return 'xls'
+    if extension in ('parquet', 'pq'):
+        return 'parquet'
+    if extension in ('feather', 'arrow'):
+        return 'feather'
+    return 'csv'
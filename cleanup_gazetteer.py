@@ -0,0 +1,208 @@
+# City gazetteer matcher.
+#
+# Place names are split into words, folded (accents removed, case-folded) and
+# stored per country in an Aho-Corasick automaton over those words. Finding a
+# city is a single left-to-right pass over the words of the address, so the
+# cost depends on the length of the address and not on how many names the
+# gazetteer holds. Matches always cover whole words, joined by whitespace or
+# by the punctuation the name itself has ("St. Anns Bay", "Savanna-la-Mar",
+# "A'Ali"): commas, semicolons, bars, spaced dashes and the like end a run of
+# words, so "Los, Angeles" is not Los Angeles and "Santo - Domingo" is not
+# Santo Domingo. Of the names starting at the leftmost match, the one added
+# first wins, like the alternation of names the cities used to be searched
+# with. A match gives the name as the gazetteer stores it.
+import hashlib
+import re
+import unicodedata
+from functools import lru_cache
+
+_WORD = re.compile(r'[^\W_]+')
+
+# Punctuation that can join two words of a name, kept as a token of its own.
+# A "." may be followed by whitespace ("St. Anns"); the others can't have any.
+_JOINERS = {'-': '-', "'": "'", '\u2019': "'", '.': '.'}
+
+
+# Fold a word for matching: drop accents and case ("Bogotá" -> "bogota")
+@lru_cache(maxsize=65536)
+def fold_word(word):
+    if word.isascii():
+        return word.lower()
+    decomposed = unicodedata.normalize('NFKD', word)
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+# Folded words of a place name, e.g. "St. Ann's Bay" -> ('st', 'ann', 's', 'bay')
+def name_words(name):
+    return tuple(fold_word(word) for word in _WORD.findall(unicodedata.normalize('NFC', name)))
+
+
+# Runs of tokens in a text: its folded words and the joining punctuation
+# between them. A run ends where the text between two words can't be inside
+# a name.
+def _name_runs(text):
+    run = []
+    end = 0
+    for match in _WORD.finditer(text):
+        if run:
+            gap = text[end:match.start()]
+            if gap.strip():
+                joiner = _JOINERS.get(gap.rstrip() if gap[0] == '.' else gap)
+                if joiner is None:
+                    yield run
+                    run = []
+                else:
+                    run.append(joiner)
+        run.append(fold_word(match.group()))
+        end = match.end()
+    if run:
+        yield run
+
+
+# Aho-Corasick automaton over words for one country's place names
+class _Automaton:
+    def __init__(self):
+        # Node 0 is the root; nodes are stored in parallel lists
+        self.children = [{}]
+        self.fail = [0]
+        self.depth = [0]
+        # Length in words of the longest name ending at each node, 0 for none,
+        # and that name as it was added with its place in the order of adding
+        self.match_len = [0]
+        self.match_name = [None]
+        self.match_order = [0]
+        self.built = True
+
+    def add(self, words, name, order):
+        node = 0
+        for word in words:
+            child = self.children[node].get(word)
+            if child is None:
+                child = len(self.children)
+                self.children[node][word] = child
+                self.children.append({})
+                self.fail.append(0)
+                self.depth.append(self.depth[node] + 1)
+                self.match_len.append(0)
+                self.match_name.append(None)
+                self.match_order.append(0)
+            node = child
+        if not self.match_len[node]:
+            self.match_len[node] = len(words)
+            self.match_name[node] = name
+            self.match_order[node] = order
+        self.built = False
+
+    # Compute failure links breadth-first, and carry each node's longest
+    # name-suffix down so lookups never have to walk the failure chain
+    def build(self):
+        queue = list(self.children[0].values())
+        for node in queue:
+            self.fail[node] = 0
+        for node in queue:
+            for word, child in self.children[node].items():
+                fallback = self.fail[node]
+                while fallback and word not in self.children[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.children[fallback].get(word, 0)
+                self.fail[child] = target if target != child else 0
+                if not self.match_len[child]:
+                    self.match_len[child] = self.match_len[self.fail[child]]
+                    self.match_name[child] = self.match_name[self.fail[child]]
+                    self.match_order[child] = self.match_order[self.fail[child]]
+                queue.append(child)
+        self.built = True
+
+    # Return (first_word, order, name) of the leftmost match, or None; of the
+    # names starting there, the one added first
+    def search(self, words):
+        if not self.built:
+            self.build()
+
+        children, fail, depth, match_len, match_order = (
+            self.children, self.fail, self.depth, self.match_len, self.match_order
+        )
+        state = 0
+        best = None
+        for position, word in enumerate(words):
+            while state and word not in children[state]:
+                state = fail[state]
+            state = children[state].get(word, 0)
+
+            length = match_len[state]
+            if length:
+                start = position - length + 1
+                if best is None or (start, match_order[state]) < best[:2]:
+                    best = (start, match_order[state], self.match_name[state])
+
+            # No later match can start at or before the best one found so far
+            if best is not None and position - depth[state] + 1 > best[0]:
+                break
+        return best
+
+
+class Gazetteer:
+    def __init__(self):
+        self._automata = {}
+        self.size = 0
+        self._content = hashlib.sha256()
+
+    # Build a gazetteer from a {country: [city, ...]} mapping
+    @classmethod
+    def from_mapping(cls, cities_by_country):
+        gazetteer = cls()
+        for country, cities in cities_by_country.items():
+            for city in cities:
+                gazetteer.add(country, city)
+        return gazetteer
+
+    def __contains__(self, country):
+        return country in self._automata
+
+    def countries(self):
+        return list(self._automata)
+
+    def add(self, country, name):
+        words = tuple(token for run in _name_runs(unicodedata.normalize('NFC', name)) for token in run)
+        if not words:
+            return
+        automaton = self._automata.get(country)
+        if automaton is None:
+            automaton = self._automata[country] = _Automaton()
+        automaton.add(words, name, self.size)
+        self.size += 1
+        self._content.update(f"{country}\t{name}\n".encode())
+
+    # Hash of every name added and the country it is stored under, in order:
+    # two gazetteers with the same digest find the same cities
+    def digest(self):
+        return self._content.hexdigest()[:16]
+
+    # Load a tab-separated file with one "country<TAB>place name" per line.
+    # Blank lines and lines starting with # are skipped. country_name, if
+    # given, turns the countries as written into the names to store them under.
+    def load(self, path, encoding='utf-8', country_name=None):
+        with open(path, encoding=encoding) as gazetteer_file:
+            for line in gazetteer_file:
+                line = line.rstrip('\r\n')
+                if not line.strip() or line.startswith('#'):
+                    continue
+                country, _, name = line.partition('\t')
+                if name:
+                    country = country.strip()
+                    self.add(country_name(country) if country_name else country, name.strip())
+        return self
+
+    # Find the leftmost known place name for the country in the text.
+    # Returns the name as stored, or "" if none is found.
+    def find(self, text, country):
+        automaton = self._automata.get(country)
+        if automaton is None or not text:
+            return ""
+
+        # Runs are searched in order, so the first one with a match has the leftmost
+        for run in _name_runs(unicodedata.normalize('NFC', text)):
+            best = automaton.search(run)
+            if best is not None:
+                return best[2]
+        return ""
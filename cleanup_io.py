@@ -0,0 +1,492 @@
+# Streaming file input and output.
+#
+# Files are read and written a chunk of rows at a time, so cleaning a file never
+# needs more memory than a few chunks, however big the file is. CSV is read with
+# pandas' chunked reader, Excel workbooks through openpyxl's read-only mode and
+# Parquet/Feather a record batch at a time through pyarrow; output is appended
+# to CSV, written with xlsxwriter's constant-memory mode, or written as Parquet
+# row groups or Feather (Arrow IPC) record batches. Parquet and Feather keep
+# column types, so downstream jobs don't have to re-parse text.
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from cleanup_engine import make_executor, process_dataframe
+from cleanup_formats import OUTPUT_FORMATS, file_format
+from cleanup_profile import READ_STAGE, WRITE_STAGE, Profiler
+
+# Rows read, cleaned and written at a time
+DEFAULT_CHUNK_ROWS = 50_000
+
+# Rows per Excel worksheet, including the header row
+EXCEL_MAX_ROWS = 1_048_576
+
+# Parsed uploads kept in memory by ParsedFileCache
+DEFAULT_PARSED_ENTRIES = 4
+DEFAULT_PARSED_BYTES = 1 << 30
+
+# Text columns with at most this share of distinct values are stored as category
+DEFAULT_CATEGORY_RATIO = 0.1
+
+
+# pyarrow is only needed for Parquet and Feather
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet and Feather files need pyarrow: pip install pyarrow") from None
+    return pyarrow
+
+
+# Arrow table for a DataFrame. Object columns (text, or mixed values from
+# spreadsheets) are stored as strings so every chunk gets the same schema.
+def arrow_table(data, schema=None):
+    pa = _pyarrow()
+    data = data.copy(deep=False)
+    for column in data.columns:
+        if data[column].dtype == object:
+            values = data[column]
+            data[column] = values.where(values.isna(), values.astype(str)).astype(object)
+    if schema is not None:
+        return pa.Table.from_pandas(data, schema=schema, preserve_index=False)
+
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    # Columns that were empty (all null) or text become strings
+    fields = [
+        pa.field(field.name, pa.string()) if pa.types.is_null(field.type) or data[field.name].dtype == object
+        else field
+        for field in table.schema
+    ]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+# Write a whole DataFrame to a path or binary buffer in the given format
+def write_table(data, target, output_format):
+    if output_format == 'parquet':
+        _pyarrow().parquet.write_table(arrow_table(data), target)
+    elif output_format == 'feather':
+        from pyarrow import feather
+
+        feather.write_feather(arrow_table(data), target)
+    else:
+        raise ValueError(f"Unsupported format: {output_format}")
+
+
+# Smaller in-memory copy of a DataFrame: text columns use pyarrow-backed
+# strings (when pyarrow is installed), and category_columns, plus any text
+# column with few distinct values (country, state, ...), become categories
+def compact_frame(data, category_columns=(), max_category_ratio=DEFAULT_CATEGORY_RATIO):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        string_dtype = None
+    else:
+        try:
+            # The same NaN-based string dtype pandas 3 uses by default
+            string_dtype = pd.StringDtype('pyarrow', na_value=float('nan'))
+        except TypeError:
+            string_dtype = pd.StringDtype('pyarrow')
+
+    data = data.copy(deep=False)
+    for column in data.columns:
+        values = data[column]
+        if not (values.dtype == object or isinstance(values.dtype, pd.StringDtype)):
+            continue
+        present = values.dropna()
+        # Leave columns with numbers or dates mixed in as they are
+        if values.dtype == object and not present.map(type).eq(str).all():
+            continue
+        if column in category_columns or (len(present) and present.nunique() <= len(present) * max_category_ratio):
+            data[column] = values.astype('category')
+        elif string_dtype is not None and getattr(values.dtype, 'storage', None) != 'pyarrow':
+            data[column] = values.astype(string_dtype)
+    return data
+
+
+# Whole-file read, for the upload tab when not in large file mode. usecols
+# limits the columns read; with compact the result goes through compact_frame.
+# sheet picks a worksheet of an Excel workbook (default: the first one).
+def read_file(source, name, usecols=None, compact=False, category_columns=(), sheet=None):
+    _rewind(source)
+    file_type = file_format(name)
+    if file_type == 'csv':
+        data = pd.read_csv(source, usecols=usecols)
+    elif file_type == 'parquet':
+        _pyarrow()
+        data = pd.read_parquet(source, columns=usecols)
+    elif file_type == 'feather':
+        _pyarrow()
+        data = pd.read_feather(source, columns=usecols)
+    else:
+        data = pd.read_excel(source, sheet_name=sheet if sheet is not None else 0, usecols=usecols)
+    if compact:
+        data = compact_frame(data, category_columns)
+    return data
+
+
+# Hash of a file's content, for a path or an open binary file
+def content_hash(source, block_size=1 << 20):
+    digest = hashlib.blake2b(digest_size=20)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as source_file:
+            for block in iter(lambda: source_file.read(block_size), b''):
+                digest.update(block)
+    elif hasattr(source, 'getbuffer'):
+        # In-memory uploads are hashed without copying them
+        with source.getbuffer() as view:
+            digest.update(view)
+    else:
+        _rewind(source)
+        for block in iter(lambda: source.read(block_size), b''):
+            digest.update(block)
+        _rewind(source)
+    return digest.hexdigest()
+
+
+# Least recently used parsed files, keyed by content hash (and anything else
+# that changes how the file is read), so the same upload is only parsed once.
+# Bounded by entry count and by the memory the DataFrames use; the most recent
+# entry is always kept. Cached DataFrames are shared and must not be modified.
+class ParsedFileCache:
+    def __init__(self, max_entries=DEFAULT_PARSED_ENTRIES, max_bytes=DEFAULT_PARSED_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Cached DataFrame for key, or load() it and cache the result
+    def get(self, key, load):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        data = load()
+        size = int(data.memory_usage(deep=True).sum())
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (data, size)
+            self._bytes += size
+            while len(self._entries) > 1 and (
+                len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+        return data
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+# Yield a Parquet file a row group batch at a time
+def _iter_parquet_chunks(source, chunk_size, usecols=None):
+    parquet_file = _pyarrow().parquet.ParquetFile(source)
+    if usecols is not None:
+        usecols = _in_file_order(usecols, parquet_file.schema_arrow.names)
+    for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=usecols):
+        yield batch.to_pandas()
+
+
+# Yield a Feather (Arrow IPC) file in record batches of at most chunk_size rows
+def _iter_feather_chunks(source, chunk_size, usecols=None):
+    pa = _pyarrow()
+    if isinstance(source, (str, os.PathLike)):
+        source = pa.memory_map(str(source))
+    reader = pa.ipc.open_file(source)
+    for index in range(reader.num_record_batches):
+        batch = reader.get_batch(index)
+        if usecols is not None:
+            batch = batch.select(_in_file_order(usecols, batch.schema.names))
+        for start in range(0, batch.num_rows, chunk_size):
+            yield batch.slice(start, chunk_size).to_pandas()
+
+
+# The wanted columns in the order the file has them, like pandas' usecols.
+# Raises ValueError for columns the file doesn't have.
+def _in_file_order(usecols, columns):
+    missing = [column for column in usecols if column not in columns]
+    if missing:
+        raise ValueError(f"Columns not found in the file: {', '.join(map(str, missing))}")
+    return [column for column in columns if column in usecols]
+
+
+def _rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+# Names of the worksheets in an Excel workbook, or [None] for other formats,
+# which have a single table
+def sheet_names(source, name):
+    _rewind(source)
+    file_type = file_format(name)
+    if file_type == 'xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(source, read_only=True)
+        try:
+            return list(workbook.sheetnames)
+        finally:
+            workbook.close()
+    if file_type == 'xls':
+        with pd.ExcelFile(source) as workbook:
+            return list(workbook.sheet_names)
+    return [None]
+
+
+# Yield the rows of a worksheet of an .xlsx file (default: the first one) as
+# DataFrames, reading it in openpyxl's read-only mode
+def _iter_xlsx_chunks(source, chunk_size, usecols=None, sheet=None):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet is not None else workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+        positions = range(len(columns))
+        if usecols is not None:
+            keep = set(_in_file_order(usecols, columns))
+            positions = [i for i, column in enumerate(columns) if column in keep]
+            columns = [columns[i] for i in positions]
+
+        batch = []
+        for row in rows:
+            # Skip the fully empty rows read-only mode reports at the end of some sheets
+            if all(value is None for value in row):
+                continue
+            batch.append([row[i] if i < len(row) else None for i in positions])
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+# Yield the file as DataFrames of at most chunk_size rows. source is a path or
+# an open binary file, name is used to tell the format. CSV cells are read as
+# text so every chunk is written out the same way. usecols limits the columns
+# read; sheet picks a worksheet of an Excel workbook (default: the first one).
+def iter_chunks(source, name, chunk_size=DEFAULT_CHUNK_ROWS, usecols=None, sheet=None):
+    _rewind(source)
+    file_type = file_format(name)
+
+    if file_type == 'csv':
+        with pd.read_csv(source, chunksize=chunk_size, dtype=str, usecols=usecols) as reader:
+            yield from reader
+    elif file_type == 'xlsx':
+        yield from _iter_xlsx_chunks(source, chunk_size, usecols, sheet)
+    elif file_type == 'parquet':
+        yield from _iter_parquet_chunks(source, chunk_size, usecols)
+    elif file_type == 'feather':
+        yield from _iter_feather_chunks(source, chunk_size, usecols)
+    else:
+        # Legacy .xls can't be read in streaming mode
+        data = pd.read_excel(source, sheet_name=sheet if sheet is not None else 0, usecols=usecols)
+        for start in range(0, len(data), chunk_size):
+            yield data.iloc[start:start + chunk_size]
+
+
+# First rows of a file, for previews and column selection
+def read_preview(source, name, rows=5, sheet=None):
+    return next(iter_chunks(source, name, chunk_size=rows, sheet=sheet), pd.DataFrame())
+
+
+# Writes DataFrame chunks to a CSV, XLSX, Parquet or Feather file as they arrive
+class ChunkWriter:
+    def __init__(self, path, output_format='csv', sheet_name='Processed Data'):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        self.path = path
+        self.output_format = output_format
+        self.sheet_name = sheet_name
+        self.rows = 0
+        self._file = None
+        self._workbook = None
+        self._worksheet = None
+        self._sheet_rows = 0
+        self._header = None
+        self._arrow_writer = None
+        self._schema = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, chunk):
+        if self.output_format == 'csv':
+            self._write_csv(chunk)
+        elif self.output_format == 'xlsx':
+            self._write_xlsx(chunk)
+        else:
+            self._write_arrow(chunk)
+        self.rows += len(chunk)
+
+    def _write_csv(self, chunk):
+        first = self._file is None
+        if first:
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+        chunk.to_csv(self._file, header=first, index=False)
+
+    def _new_sheet(self):
+        sheets = len(self._workbook.worksheets())
+        name = self.sheet_name if not sheets else f"{self.sheet_name} {sheets + 1}"
+        self._worksheet = self._workbook.add_worksheet(name[:31])
+        self._worksheet.write_row(0, 0, self._header)
+        self._sheet_rows = 1
+
+    def _write_xlsx(self, chunk):
+        if self._workbook is None:
+            import xlsxwriter
+
+            # constant_memory flushes each row to disk as soon as it is written
+            self._workbook = xlsxwriter.Workbook(self.path, {'constant_memory': True, 'strings_to_urls': False})
+            self._header = [str(column) for column in chunk.columns]
+            self._new_sheet()
+
+        for row in chunk.itertuples(index=False, name=None):
+            # Start another worksheet when this one is full
+            if self._sheet_rows >= EXCEL_MAX_ROWS:
+                self._new_sheet()
+            self._worksheet.write_row(self._sheet_rows, 0, [_excel_value(value) for value in row])
+            self._sheet_rows += 1
+
+    # Parquet gets one row group per chunk, Feather one record batch per chunk
+    def _write_arrow(self, chunk):
+        pa = _pyarrow()
+        if self._arrow_writer is None:
+            table = arrow_table(chunk)
+            self._schema = table.schema
+            if self.output_format == 'parquet':
+                self._arrow_writer = pa.parquet.ParquetWriter(self.path, self._schema)
+            else:
+                self._arrow_writer = pa.ipc.new_file(self.path, self._schema)
+        else:
+            try:
+                table = arrow_table(chunk, self._schema)
+            except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                raise ValueError(
+                    f"Rows {self.rows + 1}-{self.rows + len(chunk)} don't match the column types "
+                    f"of the first chunk: {e}"
+                ) from e
+        self._arrow_writer.write_table(table)
+
+    def close(self):
+        if self._arrow_writer is not None:
+            self._arrow_writer.close()
+            self._arrow_writer = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        elif self.output_format == 'csv' and self.rows == 0 and not os.path.exists(self.path):
+            # Still leave an (empty) file behind
+            open(self.path, 'w').close()
+        if self._workbook is not None:
+            self._workbook.close()
+            self._workbook = None
+
+
+# xlsxwriter can't store NaN, NaT or pandas scalars
+def _excel_value(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if hasattr(value, 'item') and not isinstance(value, (str, bytes)):
+        return value.item()
+    return value
+
+
+# Write a DataFrame that is already in memory to a file, a slice at a time so
+# no second full copy of it (as text or as a workbook) is built
+def export_dataframe(data, output_path, output_format='csv', chunk_size=DEFAULT_CHUNK_ROWS):
+    with ChunkWriter(output_path, output_format) as writer:
+        for start in range(0, len(data), chunk_size):
+            writer.write(data.iloc[start:start + chunk_size])
+        if not len(data):
+            writer.write(data)
+    return output_path
+
+
+# Read, clean and write a file one chunk at a time.
+# progress_callback, if given, is called as progress_callback(rows_done, message)
+# after each chunk. stats is an optional cleanup_engine.CacheStats to fill in and
+# cache_path an optional on-disk result cache; discover_logos is passed on to
+# process_dataframe. profiler, a cleanup_profile.Profiler, records the time spent
+# reading, in each task and writing. usecols limits the columns read (and
+# written); it should include every mapped column. sheet picks the worksheet of
+# an Excel workbook. With workers > 1 the file gets a process pool of its own,
+# unless an executor from make_executor is passed, which is left running.
+# Returns the number of rows written.
+def stream_process(source, name, output_path, column_mappings, output_format='csv',
+                   chunk_size=DEFAULT_CHUNK_ROWS, progress_callback=None, workers=1, stats=None,
+                   cache_path=None, discover_logos=False, profiler=None, usecols=None, sheet=None,
+                   executor=None):
+    if profiler is None:
+        profiler = Profiler()
+    rows_done = 0
+    # One process pool for the whole file rather than one per chunk
+    own_executor = executor is None and workers > 1
+    if own_executor:
+        executor = make_executor(workers)
+    try:
+        writer = ChunkWriter(output_path, output_format)
+        try:
+            chunks = iter_chunks(source, name, chunk_size, usecols, sheet)
+            while True:
+                started = time.perf_counter()
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                profiler.record(READ_STAGE, time.perf_counter() - started, len(chunk))
+
+                processed = process_dataframe(
+                    chunk, column_mappings, workers=workers, executor=executor, stats=stats,
+                    cache_path=cache_path, discover_logos=discover_logos, profiler=profiler
+                )
+                with profiler.stage(WRITE_STAGE, len(chunk)):
+                    writer.write(processed)
+                rows_done += len(chunk)
+                if progress_callback:
+                    progress_callback(rows_done, f"Processed {rows_done} rows...")
+        finally:
+            # Finishing a file (an Excel workbook especially) is part of writing it
+            with profiler.stage(WRITE_STAGE, calls=0):
+                writer.close()
+    except BaseException:
+        # Stopped early (e.g. a cancelled job): don't wait for chunks still running
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    if own_executor:
+        executor.shutdown()
+    return rows_done
@@ -0,0 +1,392 @@
+# Background processing jobs.
+#
+# Jobs run on a small thread pool shared by every session on the server, not
+# inside the Streamlit script that submitted them, so closing the tab or
+# rerunning the script doesn't stop them. Each job gets an ID and a directory
+# holding its input, its results and a job.json with its status, so results can
+# be found again by ID later, even after a restart. Progress is polled from the
+# Job object; cancelling stops a job at the next progress update.
+import copy
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cleanup_batch import DEFAULT_FILE_WORKERS, combine_outputs, run_batch, summarize, zip_outputs
+from cleanup_dedupe import DEDUPE_STAGE, dedupe_file, deduplicate, summarize as summarize_duplicates
+from cleanup_engine import CacheStats, active_tasks, make_executor, process_dataframe
+from cleanup_io import DEFAULT_CHUNK_ROWS, export_dataframe, file_format, stream_process
+from cleanup_profile import READ_STAGE, WRITE_STAGE, Profiler
+
+logger = logging.getLogger(__name__)
+
+# Where job directories are kept, overridden by DATACLEANUP_JOBS
+DEFAULT_JOBS_DIR = os.environ.get(
+    'DATACLEANUP_JOBS', os.path.join(os.path.expanduser('~'), '.cache', 'datacleanup', 'jobs')
+)
+
+# Jobs running at the same time; later ones wait in the queue
+DEFAULT_JOB_WORKERS = 2
+
+# Seconds finished jobs are kept before their directories are removed
+DEFAULT_RETENTION = 7 * 24 * 3600
+
+# Results of jobs on in-memory data are saved as Parquet, which keeps column types
+DATAFRAME_OUTPUT_FORMAT = 'parquet'
+
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+_JOB_ID = re.compile(r'[0-9a-f]{32}')
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    # Fields saved to job.json
+    FIELDS = ['id', 'name', 'mode', 'status', 'done', 'total', 'message', 'error', 'output_path',
+              'output_format', 'column_mappings', 'tasks_run', 'cache_summary', 'profile', 'cprofile_path',
+              'files', 'merged_path', 'duplicates', 'created', 'finished']
+
+    def __init__(self, job_id, directory, name, mode):
+        self.id = job_id
+        self.directory = directory
+        self.name = name
+        # 'stream' for files processed chunk by chunk, 'dataframe' for in-memory data,
+        # 'batch' for several files and sheets
+        self.mode = mode
+        self.status = 'queued'
+        self.done = 0
+        self.total = None
+        self.message = "Waiting to start..."
+        self.error = ''
+        self.output_path = None
+        self.output_format = None
+        self.column_mappings = {}
+        # Tasks that were computed; with DerivedColumns the up-to-date ones are skipped
+        self.tasks_run = None
+        self.cache_summary = {}
+        # Stage timings (see cleanup_profile), and the cProfile listing if one was asked for
+        self.profile = {}
+        self.cprofile_path = None
+        # Status of each file and sheet of a batch (see cleanup_batch.BatchItem.to_dict)
+        self.files = []
+        # Merged view of the duplicate clusters, and their counts, when duplicates were looked for
+        self.merged_path = None
+        self.duplicates = {}
+        # The updated cleanup_engine.DerivedColumns of a job on in-memory data, not saved
+        self.derived = None
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def is_finished(self):
+        return self.status in FINISHED_STATES
+
+    # Share of the work done, or None when the total isn't known (streamed files)
+    def fraction(self):
+        return min(self.done / self.total, 1.0) if self.total else None
+
+    # Progress callback for the running job; raises JobCancelled to stop it
+    def report(self, done, total, message):
+        self.done, self.total, self.message = done, total, message
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def cancel(self):
+        self._cancel.set()
+        # Jobs still in the queue never start
+        if self.future is not None and self.future.cancel():
+            self.status = 'cancelled'
+            self.message = "Cancelled"
+            self.finished = time.time()
+            self.save()
+
+    def save(self):
+        path = os.path.join(self.directory, 'job.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as job_file:
+            json.dump({field: getattr(self, field) for field in self.FIELDS}, job_file)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, 'job.json'), encoding='utf-8') as job_file:
+            fields = json.load(job_file)
+        job = cls(fields['id'], directory, fields['name'], fields['mode'])
+        for field in cls.FIELDS:
+            setattr(job, field, fields.get(field, getattr(job, field)))
+        # A job that was running when the server stopped won't finish now
+        if not job.is_finished:
+            job.status = 'failed'
+            job.error = "Interrupted"
+        return job
+
+
+class JobRunner:
+    def __init__(self, jobs_dir=DEFAULT_JOBS_DIR, max_workers=DEFAULT_JOB_WORKERS, retention=DEFAULT_RETENTION):
+        self.jobs_dir = jobs_dir
+        self.retention = retention
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='cleanup-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        # Process pools shared by the jobs, by number of workers
+        self._pools = {}
+
+    def _new_job(self, name, mode):
+        self.purge()
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(directory)
+        job = Job(job_id, directory, name, mode)
+        job.save()
+        with self._lock:
+            self._jobs[job_id] = job
+        return job
+
+    # options with the process pool for their number of workers, which stays
+    # up for later jobs instead of being started for each one. A pool that
+    # broke (a worker process died) is replaced.
+    def _with_pool(self, options):
+        workers = options.get('workers', 1)
+        if workers <= 1:
+            return options
+        with self._lock:
+            pool = self._pools.get(workers)
+            if pool is None or pool._broken:
+                if pool is not None:
+                    pool.shutdown(wait=False)
+                pool = self._pools[workers] = make_executor(workers)
+        return dict(options, executor=pool)
+
+    def _start(self, job, work, cprofile=False):
+        job.future = self._executor.submit(self._run, job, work, cprofile)
+        return job
+
+    def _run(self, job, work, cprofile=False):
+        job.status = 'running'
+        job.message = "Starting..."
+        job.save()
+        stats = CacheStats()
+        profiler = Profiler(cprofile=cprofile)
+        try:
+            with profiler.run():
+                work(job, stats, profiler)
+            job.status = 'done'
+            job.message = "Processing complete!"
+        except JobCancelled:
+            job.status = 'cancelled'
+            job.message = "Cancelled"
+            if job.output_path and os.path.exists(job.output_path):
+                os.remove(job.output_path)
+            job.output_path = None
+            job.derived = None
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.status = 'failed'
+            job.error = str(e)
+            job.message = "Failed"
+            job.derived = None
+        finally:
+            job.cache_summary = stats.summary()
+            job.profile = profiler.report()
+            if profiler.dump_cprofile(os.path.join(job.directory, 'profile.prof')):
+                job.cprofile_path = os.path.join(job.directory, 'profile.txt')
+                with open(job.cprofile_path, 'w', encoding='utf-8') as cprofile_file:
+                    cprofile_file.write(profiler.cprofile_text())
+            job.finished = time.time()
+            job.save()
+
+    # Process a file (path or open binary file) chunk by chunk into output_format.
+    # The input is copied into the job directory first, so the job doesn't
+    # depend on the caller's file. options are passed on to stream_process. With
+    # cprofile the job is also recorded with cProfile. With dedupe the results
+    # get cluster IDs and a merged view is saved (see cleanup_dedupe).
+    def submit_file(self, source, name, column_mappings, output_format='csv', cprofile=False, dedupe=False,
+                    **options):
+        job = self._new_job(os.path.basename(name), 'stream')
+        extension = os.path.splitext(name)[1] or f".{file_format(name)}"
+        input_path = os.path.join(job.directory, f"input{extension}")
+        if isinstance(source, (str, os.PathLike)):
+            shutil.copyfile(source, input_path)
+        else:
+            source.seek(0)
+            with open(input_path, 'wb') as input_file:
+                shutil.copyfileobj(source, input_file)
+        job.output_path = os.path.join(job.directory, f"results.{output_format}")
+        job.output_format = output_format
+        column_mappings = dict(column_mappings)
+        job.column_mappings = column_mappings
+        job.tasks_run = active_tasks(column_mappings)
+
+        def work(job, stats, profiler):
+            rows = stream_process(
+                input_path, input_path, job.output_path, column_mappings, output_format,
+                progress_callback=lambda rows, message: job.report(rows, None, message),
+                stats=stats, profiler=profiler, **self._with_pool(options)
+            )
+            if dedupe:
+                job.report(rows, None, "Finding duplicates...")
+                job.merged_path = os.path.join(job.directory, f"merged.{output_format}")
+                job.duplicates = dedupe_file(
+                    job.output_path, column_mappings, job.output_path, job.merged_path, output_format,
+                    options.get('chunk_size', DEFAULT_CHUNK_ROWS), profiler=profiler
+                )
+
+        return self._start(job, work, cprofile)
+
+    # Process a DataFrame that is already in memory and save the results to disk.
+    # The DataFrame is not modified. options are passed on to process_dataframe.
+    # read_seconds is how long reading the data took, for the timings. With a
+    # cleanup_engine.DerivedColumns for data as derived, only the tasks whose
+    # stored outputs are out of date are run, on a copy of derived that is
+    # left in job.derived: derived itself is never changed, so the caller can
+    # keep reading it while the job runs and swap the copy in when it's done. With
+    # dedupe the results get cluster IDs and a merged view is saved.
+    def submit_dataframe(self, data, column_mappings, name='data', cprofile=False, read_seconds=None,
+                         derived=None, dedupe=False, **options):
+        job = self._new_job(name, 'dataframe')
+        job.output_path = os.path.join(job.directory, f"results.{DATAFRAME_OUTPUT_FORMAT}")
+        job.output_format = DATAFRAME_OUTPUT_FORMAT
+        column_mappings = dict(column_mappings)
+        job.column_mappings = column_mappings
+        if derived is not None:
+            job.derived = derived.copy()
+
+        def work(job, stats, profiler):
+            # The data was read before the job started; count it as part of the run
+            if read_seconds is not None:
+                profiler.record(READ_STAGE, read_seconds, len(data))
+                profiler.wall_seconds += read_seconds
+            if job.derived is not None:
+                job.tasks_run = job.derived.stale_tasks(column_mappings, options.get('discover_logos', False))
+                processed = job.derived.update(
+                    data, column_mappings, progress_callback=job.report, stats=stats, profiler=profiler,
+                    **self._with_pool(options)
+                )
+            else:
+                job.tasks_run = active_tasks(column_mappings)
+                processed = process_dataframe(
+                    data, column_mappings, job.report, stats=stats, profiler=profiler, **self._with_pool(options)
+                )
+            if dedupe:
+                job.report(job.total or 0, job.total, "Finding duplicates...")
+                with profiler.stage(DEDUPE_STAGE, len(processed)):
+                    processed, merged = deduplicate(processed, column_mappings)
+                job.duplicates = summarize_duplicates(merged)
+                job.merged_path = os.path.join(job.directory, f"merged.{DATAFRAME_OUTPUT_FORMAT}")
+                with profiler.stage(WRITE_STAGE, len(merged)):
+                    export_dataframe(merged, job.merged_path, DATAFRAME_OUTPUT_FORMAT)
+            job.report(job.total or 0, job.total, "Saving results...")
+            with profiler.stage(WRITE_STAGE, len(processed)):
+                export_dataframe(processed, job.output_path, DATAFRAME_OUTPUT_FORMAT)
+
+        return self._start(job, work, cprofile)
+
+    # Process the cleanup_batch.BatchItems of a batch, each with the mapping for
+    # its schema in mappings ({columns: column mappings}). The input files are
+    # copied into the job directory first and items are not modified. With combine the results go into one
+    # output_format file, otherwise each item gets its own file and they are
+    # zipped together. file_workers items run at once; options are passed on to
+    # stream_process. The job fails only if no item could be processed.
+    def submit_batch(self, items, mappings, output_format='csv', combine=False, file_workers=DEFAULT_FILE_WORKERS,
+                     name='batch', cprofile=False, **options):
+        job = self._new_job(name, 'batch')
+        # The caller's items are left as they are
+        items = [copy.copy(item) for item in items]
+        inputs_dir = os.path.join(job.directory, 'inputs')
+        os.makedirs(inputs_dir)
+        copies = {}
+        for item in items:
+            if item.status == 'failed':
+                continue
+            if item.path not in copies:
+                extension = os.path.splitext(item.path)[1] or f".{file_format(item.name)}"
+                copies[item.path] = os.path.join(inputs_dir, f"{len(copies)}{extension}")
+                shutil.copyfile(item.path, copies[item.path])
+            item.path = copies[item.path]
+        job.files = [item.to_dict() for item in items]
+        job.output_format = output_format if combine else 'zip'
+        job.output_path = os.path.join(job.directory, f"results.{job.output_format}")
+        job.column_mappings = [
+            {'columns': list(columns), 'mapping': dict(mapping)} for columns, mapping in mappings.items()
+        ]
+        job.tasks_run = sorted({task for mapping in mappings.values() for task in active_tasks(mapping)})
+
+        def progress(items):
+            job.files = [item.to_dict() for item in items]
+            finished = sum(item.status in ('done', 'failed', 'skipped') for item in items)
+            job.report(finished, len(items), summarize(items))
+
+        def work(job, stats, profiler):
+            output_dir = os.path.join(job.directory, 'results')
+            run_batch(
+                items, mappings, output_dir, output_format, file_workers, progress_callback=progress,
+                stats=stats, profiler=profiler, **self._with_pool(options)
+            )
+            if not any(item.status == 'done' for item in items):
+                raise ValueError(f"No file could be processed ({summarize(items)})")
+            job.report(job.total, job.total, "Saving results...")
+            if combine:
+                combine_outputs(items, job.output_path, output_format, profiler=profiler)
+            else:
+                with profiler.stage(WRITE_STAGE, calls=0):
+                    zip_outputs(items, job.output_path)
+            failed = [item.label for item in items if item.status == 'failed']
+            if failed:
+                job.error = f"{len(failed)} of {len(items)} files or sheets failed: {', '.join(failed)}"
+
+        return self._start(job, work, cprofile)
+
+    # The job with this ID, from memory or from its directory on disk, or None
+    def get(self, job_id):
+        job_id = str(job_id).strip().lower()
+        with self._lock:
+            if job_id in self._jobs:
+                return self._jobs[job_id]
+        if not _JOB_ID.fullmatch(job_id):
+            return None
+        directory = os.path.join(self.jobs_dir, job_id)
+        try:
+            job = Job.load(directory)
+        except (OSError, ValueError, KeyError):
+            return None
+        with self._lock:
+            return self._jobs.setdefault(job_id, job)
+
+    # Jobs started by this runner, newest first
+    def jobs(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created, reverse=True)
+
+    # Remove finished jobs older than the retention period
+    def purge(self):
+        cutoff = time.time() - self.retention
+        for job_id in os.listdir(self.jobs_dir):
+            directory = os.path.join(self.jobs_dir, job_id)
+            if not _JOB_ID.fullmatch(job_id) or os.path.getmtime(directory) >= cutoff:
+                continue
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None and not job.is_finished:
+                    continue
+                self._jobs.pop(job_id, None)
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def shutdown(self, cancel=True):
+        if cancel:
+            for job in self.jobs():
+                job.cancel()
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.shutdown()
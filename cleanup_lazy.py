@@ -0,0 +1,19 @@
+# Modules imported on first use.
+#
+# pandas and the processing modules built on it take most of the app's start
+# (about half a second), and its first page needs none of them. A LazyModule
+# is a stand-in that imports the module the first time one of its
+# attributes is read; after that a read costs a dictionary lookup. Imports go
+# through importlib, so two threads reading at once both wait for the one import.
+import importlib
+
+
+class LazyModule:
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attribute):
+        return getattr(importlib.import_module(self._name), attribute)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
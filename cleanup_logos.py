@@ -0,0 +1,274 @@
+# Logo discovery from company websites.
+#
+# Fetches each company's home page and looks for a logo in it: an <img> whose
+# class, id or alt text mentions "logo", the og:image meta tag, or the page's
+# icons. Pages are fetched concurrently on a thread pool that shares one pooled
+# HTTP session; every domain is fetched once (the latest results are kept),
+# requests to the same host are spaced out, every request has a timeout and
+# each domain a time budget for all its requests, redirects and reads
+# together, so a server that sends its page a byte at a time can't hold a
+# thread for long. Domains without a usable page or logo fall back to
+# Clearbit's logo URL, like the default mode.
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Pages fetched at the same time
+DEFAULT_WORKERS = 16
+
+# Seconds to connect and to wait for data
+DEFAULT_TIMEOUT = (5, 10)
+
+# Most seconds spent on one domain: every scheme, redirect and read included
+DEFAULT_DOMAIN_BUDGET = 20.0
+
+# Minimum seconds between two requests to the same host
+DEFAULT_HOST_INTERVAL = 1.0
+
+# Redirects followed from a home page
+MAX_REDIRECTS = 5
+
+# Domains whose logo a finder remembers; the least recently used are dropped
+DEFAULT_MAX_RESULTS = 100_000
+
+# Only the start of a page is read; logos sit near the top
+MAX_PAGE_BYTES = 512 * 1024
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
+}
+
+# Kinds of logo found in a page, best first
+LOGO_PREFERENCE = ('img', 'og:image', 'touch icon', 'icon')
+
+OG_IMAGE_PROPERTIES = ('og:image', 'og:image:url', 'og:image:secure_url')
+
+
+def clearbit_url(domain):
+    return f"https://logo.clearbit.com/{domain}"
+
+
+# Spaces out requests to the same host; safe to share between threads
+class HostRateLimiter:
+    def __init__(self, interval=DEFAULT_HOST_INTERVAL, clock=time.monotonic, sleep=time.sleep):
+        self.interval = interval
+        self._clock = clock
+        self._sleep = sleep
+        self._next = {}
+        self._lock = threading.Lock()
+
+    # Block until a request to host is allowed, reserving the next slot
+    def wait(self, host):
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            self._sleep(slot - now)
+
+
+# Collects the first logo candidate of each kind while parsing a page
+class _LogoParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.candidates = {}
+
+    def _found(self, kind, url):
+        url = (url or '').strip()
+        # Inline images would bloat the output
+        if url and not url.lower().startswith('data:'):
+            self.candidates.setdefault(kind, url)
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or '' for name, value in attrs}
+        if tag == 'img':
+            described = ' '.join([attrs.get('class', ''), attrs.get('id', ''), attrs.get('alt', '')]).lower()
+            if 'logo' in described:
+                self._found('img', attrs.get('src') or attrs.get('data-src'))
+        elif tag == 'meta':
+            if (attrs.get('property') or attrs.get('name', '')).lower() in OG_IMAGE_PROPERTIES:
+                self._found('og:image', attrs.get('content'))
+        elif tag == 'link':
+            rel = attrs.get('rel', '').lower().split()
+            if 'apple-touch-icon' in rel or 'apple-touch-icon-precomposed' in rel:
+                self._found('touch icon', attrs.get('href'))
+            elif 'icon' in rel:
+                self._found('icon', attrs.get('href'))
+
+    handle_startendtag = handle_starttag
+
+
+# Absolute URL of the best logo in an HTML page, or "" if there is none
+def find_logo_url(html, base_url):
+    parser = _LogoParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception:
+        # Keep whatever was found before the markup broke the parser
+        pass
+    for kind in LOGO_PREFERENCE:
+        if kind in parser.candidates:
+            return urljoin(base_url, parser.candidates[kind])
+    return ""
+
+
+class LogoFinder:
+    # schemes are tried in order for each domain; a domain may include a port,
+    # e.g. "127.0.0.1:8000" with schemes=('http',) for a local test server
+    def __init__(self, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, host_interval=DEFAULT_HOST_INTERVAL,
+                 schemes=('https', 'http'), session=None, domain_budget=DEFAULT_DOMAIN_BUDGET,
+                 max_results=DEFAULT_MAX_RESULTS, clock=time.monotonic):
+        import requests
+        import urllib3
+        from requests.adapters import HTTPAdapter
+
+        self.workers = workers
+        self.timeout = timeout
+        self.schemes = schemes
+        self.domain_budget = domain_budget
+        self.max_results = max_results
+        self._clock = clock
+        self.limiter = HostRateLimiter(host_interval)
+        # Reads of the body go through urllib3 directly, so its errors count too
+        self._request_errors = (requests.RequestException, urllib3.exceptions.HTTPError)
+
+        # One session with a connection pool big enough for every worker thread
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        session.headers.update(HEADERS)
+        self.session = session
+
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Request timeouts cut to the seconds left before deadline, or None when
+    # there are none left
+    def _timeouts(self, deadline):
+        left = deadline - self._clock()
+        if left <= 0:
+            return None
+        connect, read = self.timeout if isinstance(self.timeout, tuple) else (self.timeout, self.timeout)
+        return min(connect, left), min(read, left)
+
+    # (final URL, start of the page) for an HTML page, or None. Redirects are
+    # followed here rather than by requests, so each one is rate limited and
+    # counts against deadline (a clock() time) like the page itself.
+    def fetch_page(self, url, deadline=None):
+        if deadline is None:
+            deadline = self._clock() + self.domain_budget
+        for _ in range(MAX_REDIRECTS + 1):
+            self.limiter.wait(urlsplit(url).netloc)
+            timeouts = self._timeouts(deadline)
+            if timeouts is None:
+                return None
+            response = self.session.get(url, timeout=timeouts, stream=True, allow_redirects=False)
+            if not response.is_redirect:
+                break
+            url = urljoin(url, response.headers['Location'])
+            response.close()
+        else:
+            return None
+
+        with response:
+            if response.status_code != 200 or 'html' not in response.headers.get('Content-Type', 'text/html'):
+                return None
+            # read1 returns what has arrived rather than wait for a full block;
+            # urllib3 before 2.0 only has read
+            read = getattr(response.raw, 'read1', response.raw.read)
+            content = b''
+            while len(content) < MAX_PAGE_BYTES:
+                timeouts = self._timeouts(deadline)
+                if timeouts is None:
+                    return None
+                # Each read waits at most until the deadline, however slowly the data comes
+                sock = getattr(getattr(response.raw, 'connection', None), 'sock', None)
+                if sock is not None:
+                    sock.settimeout(timeouts[1])
+                block = read(64 * 1024, decode_content=True)
+                if not block:
+                    break
+                content += block
+            return url, content[:MAX_PAGE_BYTES].decode(response.encoding or 'utf-8', errors='replace')
+
+    def _remember(self, domain, logo):
+        with self._lock:
+            self._results[domain] = logo
+            self._results.move_to_end(domain)
+            while len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+
+    # Logo URL for one domain, fetching its home page
+    def find(self, domain):
+        if not domain:
+            return ""
+        with self._lock:
+            if domain in self._results:
+                self._results.move_to_end(domain)
+                return self._results[domain]
+
+        logo = ""
+        deadline = self._clock() + self.domain_budget
+        for scheme in self.schemes:
+            try:
+                page = self.fetch_page(f"{scheme}://{domain}/", deadline)
+                if page is not None:
+                    logo = find_logo_url(page[1], page[0])
+            except (*self._request_errors, OSError, UnicodeError, LookupError):
+                continue
+            except Exception as e:
+                # Anything else counts as no logo for this domain alone
+                logger.warning(f"Error finding the logo of {domain}: {e!r}")
+            # The site answered, so another scheme won't do better
+            break
+
+        logo = logo or clearbit_url(domain)
+        self._remember(domain, logo)
+        return logo
+
+    # {domain: logo URL} for many domains, fetched concurrently; each distinct
+    # domain is fetched once, and not again while this finder remembers it
+    def find_many(self, domains):
+        domains = list(dict.fromkeys(domains))
+        found = {}
+        with self._lock:
+            for domain in domains:
+                if not domain:
+                    found[domain] = ""
+                elif domain in self._results:
+                    found[domain] = self._results[domain]
+        todo = [domain for domain in domains if domain not in found]
+        if len(todo) == 1:
+            found[todo[0]] = self.find(todo[0])
+        elif todo:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(todo))) as pool:
+                found.update(zip(todo, pool.map(self.find, todo)))
+        return found
+
+    def close(self):
+        self.session.close()
+
+
+# One finder per process, so its session, rate limits and results are shared
+# by every chunk the process handles
+_finders = {}
+_finders_lock = threading.Lock()
+
+
+def logo_finder():
+    with _finders_lock:
+        finder = _finders.get(os.getpid())
+        if finder is None:
+            finder = _finders[os.getpid()] = LogoFinder()
+    return finder
@@ -0,0 +1,100 @@
+# Timing instrumentation for processing runs.
+#
+# A Profiler collects wall time, rows and call counts per stage of a run:
+# reading the input, preparing the columns, each cleanup task and writing the
+# results. For reading and writing the calls are chunks; for tasks they are the
+# values the cleanup functions actually computed, after repeats were reused.
+# Worker processes send their task timings back with their results, so in
+# parallel runs the task times add up the time spent in every worker and can
+# exceed the wall time of the run. Optionally the run is also recorded with
+# cProfile; that only covers the thread that runs it, not worker processes.
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager
+
+# Stage names used for reading and writing; tasks and the intermediate stages
+# they share (see cleanup_engine.STAGES) use their own names
+READ_STAGE = 'read'
+PREPARE_STAGE = 'prepare'
+WRITE_STAGE = 'write'
+
+
+class Profiler:
+    def __init__(self, cprofile=False, clock=time.perf_counter):
+        self._clock = clock
+        # name -> [seconds, rows, calls], in the order stages first ran
+        self.stages = {}
+        self.wall_seconds = 0.0
+        self.cprofile = cProfile.Profile() if cprofile else None
+        self.cprofile_error = ''
+
+    def record(self, name, seconds, rows=0, calls=1):
+        totals = self.stages.setdefault(name, [0.0, 0, 0])
+        totals[0] += seconds
+        totals[1] += rows
+        totals[2] += calls
+
+    # Add timings from another Profiler, or {name: (seconds, rows, calls)} from a worker
+    def merge(self, timings):
+        timings = getattr(timings, 'stages', timings)
+        for name, (seconds, rows, calls) in timings.items():
+            self.record(name, seconds, rows, calls)
+
+    # Time a block as one call of the named stage
+    @contextmanager
+    def stage(self, name, rows=0, calls=1):
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.record(name, self._clock() - started, rows, calls)
+
+    # Time a whole run, with cProfile on if it was asked for
+    @contextmanager
+    def run(self):
+        started = self._clock()
+        profiling = False
+        if self.cprofile is not None:
+            try:
+                self.cprofile.enable()
+                profiling = True
+            except ValueError as e:
+                # Only one profiler can be active at a time on newer Pythons
+                self.cprofile_error = str(e)
+        try:
+            yield self
+        finally:
+            if profiling:
+                self.cprofile.disable()
+            self.wall_seconds += self._clock() - started
+
+    # Machine-readable summary: one record per stage
+    def report(self):
+        stages = []
+        for name, (seconds, rows, calls) in self.stages.items():
+            stages.append({
+                'stage': name,
+                'seconds': round(seconds, 6),
+                'rows': rows,
+                'rows_per_sec': round(rows / seconds, 1) if seconds and rows else None,
+                'calls': calls,
+                'share': round(seconds / self.wall_seconds, 4) if self.wall_seconds else None,
+            })
+        return {'wall_seconds': round(self.wall_seconds, 6), 'stages': stages}
+
+    # Text listing of the functions that took the most time, or "" without cProfile
+    def cprofile_text(self, limit=40, sort='cumulative'):
+        if self.cprofile is None or not self.cprofile.getstats():
+            return self.cprofile_error
+        buffer = io.StringIO()
+        pstats.Stats(self.cprofile, stream=buffer).strip_dirs().sort_stats(sort).print_stats(limit)
+        return buffer.getvalue()
+
+    # Save the cProfile data for pstats, snakeviz and similar tools
+    def dump_cprofile(self, path):
+        if self.cprofile is not None and self.cprofile.getstats():
+            self.cprofile.dump_stats(path)
+            return True
+        return False
@@ -0,0 +1,51 @@
+# Throttled progress reporting shared by every processing task.
+#
+# Tasks report how many rows they have finished as often as they like; the
+# reporter only passes an update on to the UI when enough time (and, optionally,
+# enough rows) has gone by since the last one, so the browser isn't flooded with
+# websocket messages on large files.
+import time
+
+# Minimum seconds between two updates, i.e. at most 5 updates per second
+DEFAULT_MIN_INTERVAL = 0.2
+
+
+class ProgressReporter:
+    # callback is called as callback(done, total, message); total is the number
+    # of units of work (rows x tasks) the run will report
+    def __init__(self, callback, total, min_interval=DEFAULT_MIN_INTERVAL, min_rows=0, clock=time.monotonic):
+        self.callback = callback
+        self.total = max(total, 1)
+        self.min_interval = min_interval
+        self.min_rows = min_rows
+        self.clock = clock
+        self.done = 0
+        self.updates = 0
+        self._last_time = None
+        self._last_done = 0
+
+    # Record rows finished and pass an update on if the cadence allows it
+    def advance(self, rows, message=""):
+        self.done = min(self.done + rows, self.total)
+        if not self.callback:
+            return
+
+        now = self.clock()
+        if self._last_time is not None:
+            if now - self._last_time < self.min_interval:
+                return
+            if self.done - self._last_done < self.min_rows:
+                return
+        self._emit(now, message)
+
+    # Always send the final update, whatever the cadence
+    def finish(self, message="Processing complete!"):
+        self.done = self.total
+        if self.callback:
+            self._emit(self.clock(), message)
+
+    def _emit(self, now, message):
+        self._last_time = now
+        self._last_done = self.done
+        self.updates += 1
+        self.callback(self.done, self.total, message)
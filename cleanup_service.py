@@ -0,0 +1,447 @@
+# Local HTTP service that runs the cleanup on records sent by other systems.
+#
+# Examples:
+#   python cleanup_service.py --port 8765
+#   curl -s localhost:8765/clean -H 'Content-Type: application/json' \
+#        -d '[{"email": "ana", "website": "www.acme.co", "address": "Calle 5 # 10-20, Medellin", "country": "CO"}]'
+#   curl -s localhost:8765/clean?tasks=email,city -H 'Content-Type: application/x-ndjson' --data-binary @contacts.ndjson
+#   curl -s localhost:8765/metrics
+#
+# POST /clean takes a JSON array of records (or {"records": [...]}) or NDJSON,
+# one record per line. Records are objects with any of the fields email,
+# website, address, city, country and logo; every other key is passed through.
+# Each record comes back with the cleaned email, address, city and logo, in the
+# same format and order, streamed as each batch is done. ?tasks= limits the
+# run to some of the tasks.
+#
+# Requests aren't processed one by one: a single batching thread collects the
+# records of all requests that arrive within max_wait of each other, up to
+# max_batch_rows, and runs them through cleanup_engine as one vectorized batch,
+# so many small concurrent requests cost about as much as one larger one.
+# Only batches under row_wise_rows records, a few tens, call the cleanup_core
+# functions record by record instead: that is about what the engine's fixed
+# cost per batch comes to; --cache and --discover-logos only apply to engine
+# batches.
+# GET /metrics reports request latency and record throughput, GET /health
+# whether the service is up. The service binds to localhost unless told
+# otherwise.
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from cleanup_cache import DEFAULT_CACHE_PATH
+from cleanup_core import cleanup_address, extract_city, extract_logo_from_website, validate_and_correct_email
+from cleanup_engine import TASKS, CacheStats, process_dataframe
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Most records run through the engine at once, and how long the first request
+# of a batch waits for others to join it
+DEFAULT_BATCH_ROWS = 5_000
+DEFAULT_MAX_WAIT = 0.005
+
+# Batches smaller than this skip the engine. With 16 clients sending 20
+# records each, batches of a few hundred records go through the engine about
+# as fast as record by record (cleanup_benchmark.py --service)
+DEFAULT_ROW_WISE_ROWS = 32
+
+# Largest request body accepted
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+# Requests kept for the latency figures, and the window throughput is measured over
+LATENCY_WINDOW = 1_000
+THROUGHPUT_SECONDS = 60
+
+# Record fields; each task's output replaces the field of the same name
+FIELDS = ['email', 'website', 'address', 'city', 'country', 'logo']
+MAPPINGS = {field: field for field in FIELDS}
+
+NDJSON_TYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl'}
+
+
+# Raised for requests the service can't take, with the HTTP status to answer with
+# close: the request body was left unread, so the connection can't be reused
+class RequestError(Exception):
+    def __init__(self, message, status=400, close=False):
+        super().__init__(message)
+        self.status = status
+        self.close = close
+
+
+# Request counts, latencies and throughput, shared by all handler threads
+class ServiceMetrics:
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.started = clock()
+        self.requests = 0
+        self.failed = 0
+        self.records = 0
+        self.batches = 0
+        self.batch_records = 0
+        self.batch_seconds = 0.0
+        # (finished at, seconds, records) of the latest requests
+        self._recent = deque(maxlen=LATENCY_WINDOW)
+
+    def request_done(self, seconds, records, failed=False):
+        with self._lock:
+            self.requests += 1
+            self.failed += failed
+            self.records += records
+            self._recent.append((self._clock(), seconds, records))
+
+    def batch_done(self, seconds, records):
+        with self._lock:
+            self.batches += 1
+            self.batch_records += records
+            self.batch_seconds += seconds
+
+    def summary(self, queued=0):
+        with self._lock:
+            now = self._clock()
+            uptime = now - self.started
+            latencies = np.array([seconds for _, seconds, _ in self._recent])
+            window = min(THROUGHPUT_SECONDS, uptime)
+            recent_records = sum(records for finished, _, records in self._recent if now - finished <= window)
+            return {
+                'uptime_seconds': round(uptime, 3),
+                'requests': self.requests,
+                'failed_requests': self.failed,
+                'records': self.records,
+                'queued_requests': queued,
+                'batches': self.batches,
+                'mean_batch_records': round(self.batch_records / self.batches, 1) if self.batches else 0,
+                'batch_seconds': round(self.batch_seconds, 3),
+                'latency_ms': {
+                    name: round(float(np.percentile(latencies, q)) * 1000, 2) if len(latencies) else None
+                    for name, q in [('p50', 50), ('p95', 95), ('p99', 99), ('max', 100)]
+                },
+                'records_per_sec': round(recent_records / window, 1) if window else 0.0,
+                'records_per_sec_overall': round(self.records / uptime, 1) if uptime else 0.0,
+            }
+
+
+# A record value as text, the way the engine reads columns: str(value), or "" when missing
+def _value_text(value):
+    return "" if value is None or value != value else str(value)
+
+
+# One record through the cleanup_core functions, with each task's output
+# written over its field
+def clean_record(record, tasks=TASKS):
+    email, website, address, country = (
+        _value_text(record.get(field)) for field in ('email', 'website', 'address', 'country')
+    )
+    cleaned = {}
+    if 'email' in tasks:
+        cleaned['email'] = validate_and_correct_email(email, country, website)
+    if 'address' in tasks:
+        cleaned['address'] = cleanup_address(address)
+    if 'city' in tasks:
+        cleaned['city'] = extract_city(address, country)
+    if 'logo' in tasks:
+        cleaned['logo'] = extract_logo_from_website(website)
+    return dict(record, **cleaned)
+
+
+class _Pending:
+    def __init__(self, records, tasks):
+        self.records = records
+        self.tasks = tasks
+        self.future = Future()
+
+
+# Collects records from concurrent requests into batches for the engine. One
+# thread does all the processing; submit() returns a Future that resolves to
+# the cleaned records.
+class MicroBatcher:
+    def __init__(self, max_batch_rows=DEFAULT_BATCH_ROWS, max_wait=DEFAULT_MAX_WAIT, metrics=None,
+                 cache_path=None, discover_logos=False, row_wise_rows=DEFAULT_ROW_WISE_ROWS):
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait
+        self.row_wise_rows = row_wise_rows
+        self.metrics = metrics
+        self.cache_path = cache_path
+        self.discover_logos = discover_logos
+        self.stats = CacheStats()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name='cleanup-batcher', daemon=True)
+        self._thread.start()
+
+    @property
+    def queued(self):
+        return self._queue.qsize()
+
+    def submit(self, records, tasks=tuple(TASKS)):
+        pending = _Pending(records, tuple(tasks))
+        self._queue.put(pending)
+        return pending.future
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _loop(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            rows = len(first.records)
+            deadline = time.monotonic() + self.max_wait
+            stopping = False
+            while rows < self.max_batch_rows:
+                try:
+                    pending = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if pending is None:
+                    stopping = True
+                    break
+                batch.append(pending)
+                rows += len(pending.records)
+            self._run(batch)
+            if stopping:
+                return
+
+    def _run(self, batch):
+        by_tasks = {}
+        for pending in batch:
+            by_tasks.setdefault(pending.tasks, []).append(pending)
+        for tasks, group in by_tasks.items():
+            started = time.perf_counter()
+            records = [record for pending in group for record in pending.records]
+            try:
+                cleaned = self._clean(records, tasks)
+            except Exception as error:
+                for pending in group:
+                    pending.future.set_exception(error)
+                continue
+            if self.metrics is not None:
+                self.metrics.batch_done(time.perf_counter() - started, len(records))
+            start = 0
+            for pending in group:
+                stop = start + len(pending.records)
+                pending.future.set_result(cleaned[start:stop])
+                start = stop
+
+    # The records with each task's output written over its field
+    def _clean(self, records, tasks):
+        if len(records) < self.row_wise_rows and not self.discover_logos:
+            return [clean_record(record, tasks) for record in records]
+        data = pd.DataFrame.from_records(records, columns=FIELDS)
+        processed = process_dataframe(data, MAPPINGS, stats=self.stats, cache_path=self.cache_path,
+                                      discover_logos=self.discover_logos, tasks=list(tasks))
+        outputs = [task for task in TASKS if task in tasks]
+        columns = [processed[task].tolist() for task in outputs]
+        return [
+            dict(record, **dict(zip(outputs, values)))
+            for record, values in zip(records, zip(*columns) if columns else [()] * len(records))
+        ]
+
+
+# Records from a request body: a JSON array or {"records": [...]}, or NDJSON
+def parse_records(body, ndjson=False):
+    try:
+        if ndjson:
+            records = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            records = json.loads(body) if body.strip() else []
+            if isinstance(records, dict):
+                records = records.get('records')
+    except ValueError as error:
+        raise RequestError(f"Invalid JSON: {error}")
+    if not isinstance(records, list):
+        raise RequestError('Expected a list of records or {"records": [...]}')
+    for number, record in enumerate(records, 1):
+        if not isinstance(record, dict):
+            raise RequestError(f"Record {number} is not an object")
+    return records
+
+
+# Tasks asked for with ?tasks=email,city (default: all)
+def parse_tasks(query):
+    names = [name.strip() for value in parse_qs(query).get('tasks', []) for name in value.split(',')]
+    tasks = [name for name in names if name]
+    unknown = [task for task in tasks if task not in TASKS]
+    if unknown:
+        raise RequestError(f"Unknown task: {', '.join(unknown)}")
+    return tasks or list(TASKS)
+
+
+class CleanupRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'DataCleanup'
+    # Responses go out in several small writes; don't hold them back for ACKs
+    disable_nagle_algorithm = True
+    # Whether the response headers went out already
+    _started = False
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/metrics':
+            self._send_json(200, self.server.metrics.summary(self.server.batcher.queued))
+        else:
+            self._send_json(404, {'error': 'Not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/clean':
+            self._send_json(404, {'error': 'Not found'})
+            return
+        started = time.perf_counter()
+        records = []
+        try:
+            ndjson = self.headers.get_content_type() in NDJSON_TYPES
+            tasks = parse_tasks(url.query)
+            records = parse_records(self._read_body(), ndjson)
+            self._stream_results(records, tasks, ndjson)
+        except RequestError as error:
+            self._send_json(error.status, {'error': str(error)}, close=error.close)
+            self.server.metrics.request_done(time.perf_counter() - started, 0, failed=True)
+        except Exception as error:
+            self.server.metrics.request_done(time.perf_counter() - started, 0, failed=True)
+            if not self._started:
+                self._send_json(500, {'error': str(error)})
+            else:
+                self.close_connection = True
+        else:
+            self.server.metrics.request_done(time.perf_counter() - started, len(records))
+
+    def _read_body(self):
+        length = self.headers.get('Content-Length')
+        if length is None:
+            raise RequestError('Content-Length required', 411, close=True)
+        try:
+            length = int(length)
+        except ValueError:
+            raise RequestError('Invalid Content-Length', close=True)
+        if length > MAX_BODY_BYTES:
+            raise RequestError(f"Request body over {MAX_BODY_BYTES} bytes", 413, close=True)
+        try:
+            return self.rfile.read(length).decode('utf-8')
+        except UnicodeDecodeError:
+            raise RequestError('Request body is not UTF-8')
+
+    # Hand the records to the batcher in pieces and write each piece back as
+    # soon as it is done, in order, with chunked transfer encoding
+    def _stream_results(self, records, tasks, ndjson):
+        batcher = self.server.batcher
+        size = batcher.max_batch_rows
+        futures = [batcher.submit(records[start:start + size], tasks) for start in range(0, len(records), size)]
+        # Wait for the first piece before answering, so a failure still gets a 500
+        first = futures[0].result() if futures else []
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson' if ndjson else 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        self._started = True
+
+        if not ndjson:
+            self._write_chunk('{"records": [')
+        for number, future in enumerate(futures):
+            cleaned = first if number == 0 else future.result()
+            if ndjson:
+                self._write_chunk(''.join(json.dumps(record) + '\n' for record in cleaned))
+            else:
+                self._write_chunk((',' if number else '') + ','.join(json.dumps(record) for record in cleaned))
+        if not ndjson:
+            self._write_chunk(']}')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, text):
+        data = text.encode('utf-8')
+        if data:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+    # close ends the connection after the response, telling the client so
+    def _send_json(self, status, payload, close=False):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if close:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class CleanupServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher, metrics, verbose=False):
+        super().__init__(address, CleanupRequestHandler)
+        self.batcher = batcher
+        self.metrics = metrics
+        self.verbose = verbose
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+
+# A server ready to serve_forever(); port 0 picks a free port (see server_port)
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, max_batch_rows=DEFAULT_BATCH_ROWS, max_wait=DEFAULT_MAX_WAIT,
+                cache_path=None, discover_logos=False, row_wise_rows=DEFAULT_ROW_WISE_ROWS, verbose=False):
+    metrics = ServiceMetrics()
+    batcher = MicroBatcher(max_batch_rows, max_wait, metrics, cache_path, discover_logos, row_wise_rows)
+    return CleanupServer((host, port), batcher, metrics, verbose)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the cleanup over HTTP for other local systems.")
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--max-batch-rows', type=int, default=DEFAULT_BATCH_ROWS,
+                        help=f"Most records processed in one batch (default: {DEFAULT_BATCH_ROWS})")
+    parser.add_argument('--max-wait-ms', type=float, default=DEFAULT_MAX_WAIT * 1000,
+                        help=f"How long a request waits for others to share its batch "
+                             f"(default: {DEFAULT_MAX_WAIT * 1000:g})")
+    parser.add_argument('--row-wise-rows', type=int, default=DEFAULT_ROW_WISE_ROWS,
+                        help=f"Batches with fewer records skip the engine, 0 to always use it "
+                             f"(default: {DEFAULT_ROW_WISE_ROWS})")
+    parser.add_argument('--cache', nargs='?', const=DEFAULT_CACHE_PATH, metavar='PATH',
+                        help=f"Reuse results stored by earlier runs in an on-disk cache (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument('--discover-logos', action='store_true',
+                        help="Look for logos on the websites themselves instead of using Clearbit")
+    parser.add_argument('-v', '--verbose', action='store_true', help="Log every request")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.max_batch_rows < 1:
+        print("error: --max-batch-rows must be at least 1", file=sys.stderr)
+        return 2
+    server = make_server(args.host, args.port, args.max_batch_rows, args.max_wait_ms / 1000, args.cache,
+                         args.discover_logos, args.row_wise_rows, args.verbose)
+    print(f"Serving on http://{args.host}:{server.server_port} (POST /clean, GET /metrics)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
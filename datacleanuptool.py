@@ -1,435 +1,24 @@
 import streamlit as st
-import pandas as pd
-import re
-import requests
-from io import BytesIO
-import base64
-from urllib.parse import urlparse
+import os
+import shutil
+import tempfile
 import time
-import random
+import json
 
-# Set page config
-st.set_page_config(page_title="Data Cleanup and Enhancement Tool", layout="wide")
+from cleanup_cache import DEFAULT_CACHE_PATH
+from cleanup_formats import BATCH_EXTENSIONS, INPUT_EXTENSIONS, OUTPUT_FORMATS, file_format
+from cleanup_lazy import LazyModule
 
-# Function to validate and correct email addresses
-def validate_and_correct_email(email, country, website):
-    if not email and not website:
-        return ""
-    
-    # Extract username part (before @)
-    username = ""
-    if email:
-        # If email contains @, get the part before it
-        if "@" in email:
-            username = email.split("@")[0].strip().lower()
-        else:
-            # If no @, assume the entire string is the username
-            username = email.strip().lower()
-    
-    # If no username was found, return empty
-    if not username:
-        return ""
-    
-    # Get domain from website
-    domain = ""
-    if website:
-        try:
-            # Clean up the website URL
-            website_url = website.strip()
-            if not re.match(r'^https?://', website_url, re.I):
-                website_url = 'https://' + website_url
-            
-            # Parse the URL and extract domain
-            parsed_url = urlparse(website_url)
-            domain = parsed_url.netloc.lower()
-            
-            # Remove 'www.' prefix if present
-            domain = re.sub(r'^www\.', '', domain)
-        except Exception:
-            # If website parsing fails, try basic extraction
-            domain = website.strip().lower()
-            domain = re.sub(r'^https?://', '', domain, flags=re.I)
-            domain = re.sub(r'^www\.', '', domain, flags=re.I)
-            domain = domain.split('/')[0]
-    
-    # If still no domain, try to extract from email
-    if not domain and email and "@" in email and "." in email:
-        domain = email.split("@")[1].strip().lower()
-    
-    # If still no domain, use country TLD or default
-    if not domain:
-        country_tlds = {
-            'Chile': 'domain.cl',
-            'Brazil': 'domain.br',
-            'Argentina': 'domain.ar',
-            'Colombia': 'domain.co',
-            'Mexico': 'domain.mx',
-            'Peru': 'domain.pe',
-            'Ecuador': 'domain.ec',
-            'Venezuela': 'domain.ve',
-            'Uruguay': 'domain.uy',
-            'Paraguay': 'domain.py',
-            'Bolivia': 'domain.bo',
-            'Costa Rica': 'domain.cr',
-            'Panama': 'domain.pa',
-            'Guatemala': 'domain.gt',
-            'El Salvador': 'domain.sv',
-            'Honduras': 'domain.hn',
-            'Nicaragua': 'domain.ni',
-            'Dominican Republic': 'domain.do',
-            'Jamaica': 'domain.jm',
-            'Trinidad and Tobago': 'domain.tt',
-            'Canada': 'domain.ca',
-            'United Kingdom': 'domain.uk',
-            'Australia': 'domain.au',
-            'New Zealand': 'domain.nz',
-            'Singapore': 'domain.sg',
-            'South Korea': 'domain.kr',
-            'Japan': 'domain.jp',
-            'Israel': 'domain.il',
-            'South Africa': 'domain.za',
-            'Morocco': 'domain.ma',
-            'Egypt': 'domain.eg',
-            'Turkey': 'domain.tr',
-            'United Arab Emirates': 'domain.ae',
-            'Saudi Arabia': 'domain.sa',
-            'Qatar': 'domain.qa',
-            'Kuwait': 'domain.kw',
-            'Bahrain': 'domain.bh',
-            'Oman': 'domain.om',
-            'Jordan': 'domain.jo',
-        }
-        
-        domain = country_tlds.get(country, 'domain.com') if country else 'domain.com'
-    
-    # Construct the email
-    return f"{username}@{domain}"
+# pandas and the processing modules are imported when first used, so the first
+# page shows without waiting for them
+pd = LazyModule('pandas')
+cleanup_batch = LazyModule('cleanup_batch')
+cleanup_engine = LazyModule('cleanup_engine')
+cleanup_io = LazyModule('cleanup_io')
+cleanup_jobs = LazyModule('cleanup_jobs')
 
-# Function to cleanup address
-def cleanup_address(address_text):
-    if not address_text:
-        return ""
-    
-    # Common address patterns for various countries
-    patterns = [
-        # Street number followed by street name
-        r'\b\d+\s+[A-Za-z\s]+\b(?:\s+(?:street|st|avenue|ave|road|rd|boulevard|blvd|lane|ln|drive|dr|way|court|ct|plaza|plz|square|sq|highway|hwy|route|rt))?',
-        
-        # Latin American address format (Calle, Carrera, Avenida, etc.)
-        r'\b(?:Calle|Cl|Carrera|Cr|Cra|Avenida|Av|Autopista|Diagonal|Transversal|Trans)\s+\d+\s*[A-Za-z0-9\s#\-°\.]+',
-        
-        # Building number or unit number
-        r'\b(?:Apt|Apartment|Unit|Suite|Ste|Building|Bldg|Floor|Fl|Room|Rm)\s+\d+[A-Za-z]?\b',
-        
-        # Hispanic style with # (e.g., "Calle 50 # 20-15")
-        r'\b(?:Calle|Cl|Carrera|Cr|Cra|Avenida|Av)\s+\d+\s*#\s*\d+(?:\s*-\s*\d+)?',
-        
-        # Hispanic styles for other countries
-        r'\b(?:Paseo|Rua|Avenida|Av|Calle|Cl|Carrer|Jalan|Jln|Via|Viale|Estrada|Ruta)\s+[A-Za-z0-9\s#\-°\.]+',
-        
-        # Asian address styles
-        r'\b\d+\s+(?:Jalan|Jln|Soi)\s+[A-Za-z0-9\s]+',
-        
-        # Middle Eastern address styles
-        r'\b(?:Al|El)\s+[A-Za-z]+\s+(?:Street|Road|Avenue)',
-        
-        # PO Box
-        r'\bP\.?O\.?\s*Box\s+\d+\b',
-        
-        # Generic number + word pattern (might catch some addresses)
-        r'\b\d+\s+[A-Za-z]{3,}\b'
-    ]
-    
-    # Try to find address patterns in the text
-    for pattern in patterns:
-        match = re.search(pattern, address_text, re.I)
-        if match:
-            # Found a potential address
-            return match.group(0).strip()
-    
-    # If no patterns matched, look for any segment with numbers and letters that might be an address
-    segments = re.split(r'[,;\n]+', address_text)
-    
-    for segment in segments:
-        # Look for segments that have both numbers and letters (typical for addresses)
-        if re.search(r'\d', segment) and re.search(r'[A-Za-z]', segment) and len(segment) > 5:
-            return segment.strip().replace(r'\s+', ' ')
-    
-    # If still nothing found, return the first part of the text (limited to 50 chars)
-    first_part = address_text.strip().split(r'[,;\n]')[0]
-    if len(first_part) > 50:
-        first_part = first_part[:50]
-    return re.sub(r'\s+', ' ', first_part)
-
-# Function to extract city from address
-def extract_city(address_text, country):
-    if not address_text:
-        return ""
-    
-    # Dictionary of major cities by country (expanded for Central/South America and FTA countries)
-    cities_by_country = {
-        'Colombia': ['Bogota', 'Medellin', 'Cali', 'Barranquilla', 'Cartagena', 'Cucuta', 'Bucaramanga', 
-                     'Pereira', 'Santa Marta', 'Manizales', 'Ibague', 'Pasto', 'Neiva', 'Villavicencio', 
-                     'Armenia', 'Valledupar', 'Monteria', 'Sincelejo', 'Popayan', 'Palmira', 'Buenaventura', 
-                     'Floridablanca', 'Barrancabermeja', 'Tunja', 'Tulua'],
-        
-        'Mexico': ['Mexico City', 'Guadalajara', 'Monterrey', 'Puebla', 'Tijuana', 'Leon', 'Juarez', 
-                   'Merida', 'Chihuahua', 'Cancun', 'Queretaro', 'San Luis Potosi', 'Hermosillo', 
-                   'Aguascalientes', 'Morelia', 'Veracruz', 'Mexicali', 'Culiacan', 'Acapulco', 
-                   'Tampico', 'Cuernavaca', 'Toluca', 'Torreon', 'Durango', 'Oaxaca'],
-        
-        'Brazil': ['Sao Paulo', 'Rio de Janeiro', 'Brasilia', 'Salvador', 'Fortaleza', 'Belo Horizonte', 
-                   'Manaus', 'Curitiba', 'Recife', 'Porto Alegre', 'Belem', 'Goiania', 'Guarulhos', 
-                   'Campinas', 'Sao Luis', 'Maceio', 'Duque de Caxias', 'Natal', 'Campo Grande', 
-                   'Teresina', 'Sao Bernardo do Campo', 'Nova Iguacu', 'Joao Pessoa', 'Santo Andre', 
-                   'Osasco', 'Ribeirao Preto', 'Jaboatao dos Guararapes', 'Uberlandia'],
-        
-        'Chile': ['Santiago', 'Valparaiso', 'Concepcion', 'La Serena', 'Antofagasta', 'Temuco', 
-                  'Rancagua', 'Talca', 'Arica', 'Iquique', 'Puerto Montt', 'Coquimbo', 'Osorno', 
-                  'Quillota', 'Calama', 'Chillan', 'Valdivia', 'Punta Arenas', 'Copiapo', 'Curico', 
-                  'Los Angeles', 'Melipilla', 'San Antonio', 'Linares', 'Ovalle'],
-        
-        'Argentina': ['Buenos Aires', 'Cordoba', 'Rosario', 'Mendoza', 'San Miguel de Tucuman', 
-                     'La Plata', 'Mar del Plata', 'Salta', 'Santa Fe', 'San Juan', 'Resistencia', 
-                     'Santiago del Estero', 'Corrientes', 'Posadas', 'San Salvador de Jujuy', 
-                     'Bahia Blanca', 'Parana', 'Neuquen', 'Formosa', 'La Rioja', 'Rio Cuarto', 
-                     'Comodoro Rivadavia', 'San Luis', 'Tandil', 'San Rafael'],
-        
-        'Peru': ['Lima', 'Arequipa', 'Trujillo', 'Chiclayo', 'Piura', 'Iquitos', 'Cusco', 'Huancayo', 
-                 'Tacna', 'Juliaca', 'Ica', 'Pucallpa', 'Chimbote', 'Sullana', 'Ayacucho', 'Chincha Alta', 
-                 'Huanuco', 'Cajamarca', 'Puno', 'Tumbes', 'Tarapoto', 'Huacho', 'Huaraz', 'Pisco', 'Moyobamba'],
-        
-        'Ecuador': ['Quito', 'Guayaquil', 'Cuenca', 'Santo Domingo', 'Machala', 'Duran', 'Manta', 
-                   'Portoviejo', 'Loja', 'Ambato', 'Esmeraldas', 'Quevedo', 'Riobamba', 'Milagro', 
-                   'Ibarra', 'Babahoyo', 'Sangolqui', 'Santa Elena', 'La Libertad', 'Latacunga'],
-        
-        'Venezuela': ['Caracas', 'Maracaibo', 'Valencia', 'Barquisimeto', 'Maracay', 'Ciudad Guayana', 
-                     'Barcelona', 'Maturin', 'Puerto La Cruz', 'Petare', 'Turmero', 'Baruta', 'Barinas', 
-                     'Mérida', 'Cumana', 'Cabimas', 'San Cristobal', 'Ciudad Bolivar', 'Guatire', 
-                     'Punto Fijo', 'Acarigua', 'Carupano', 'Los Teques', 'Coro', 'El Tigre'],
-        
-        'Uruguay': ['Montevideo', 'Salto', 'Ciudad de la Costa', 'Paysandu', 'Las Piedras', 'Rivera', 
-                   'Maldonado', 'Tacuarembo', 'Melo', 'Mercedes', 'Artigas', 'Minas', 'San Jose de Mayo', 
-                   'Durazno', 'Florida', 'Treinta y Tres', 'Rocha', 'Fray Bentos', 'Trinidad', 'Colonia del Sacramento'],
-        
-        'Paraguay': ['Asuncion', 'Ciudad del Este', 'San Lorenzo', 'Luque', 'Capiata', 'Lambare', 
-                    'Fernando de la Mora', 'Limpio', 'Nemby', 'Encarnacion', 'Mariano Roque Alonso', 
-                    'Pedro Juan Caballero', 'Villa Elisa', 'Ita', 'Villarrica', 'Caaguazu', 'Coronel Oviedo', 
-                    'Concepcion', 'Presidente Franco', 'Pilar'],
-        
-        'Bolivia': ['La Paz', 'Santa Cruz de la Sierra', 'Cochabamba', 'El Alto', 'Oruro', 'Sucre', 
-                   'Tarija', 'Potosi', 'Sacaba', 'Montero', 'Trinidad', 'Quillacollo', 'Riberalta', 
-                   'Warnes', 'Yacuiba', 'Camiri', 'Tupiza', 'Villa Montes', 'Villazon', 'Guayaramerin'],
-        
-        'Costa Rica': ['San Jose', 'Alajuela', 'Cartago', 'Heredia', 'Liberia', 'Puntarenas', 'Limon', 
-                      'Perez Zeledon', 'Santa Cruz', 'Nicoya', 'Turrialba', 'Ciudad Quesada', 'Siquirres', 
-                      'Canas', 'Grecia', 'Guapiles', 'San Isidro', 'Atenas', 'Esparza', 'Puriscal'],
-        
-        'Panama': ['Panama City', 'San Miguelito', 'Juan Diaz', 'David', 'Arraijan', 'Colon', 'La Chorrera', 
-                  'Santiago', 'Chitre', 'Penonome', 'Bocas del Toro', 'Aguadulce', 'Changuinola', 'La Concepcion', 
-                  'Las Tablas', 'Puerto Armuelles', 'Boquete', 'El Porvenir', 'Los Santos', 'Rio Abajo'],
-        
-        'Guatemala': ['Guatemala City', 'Mixco', 'Villa Nueva', 'Quetzaltenango', 'Escuintla', 'Chinautla', 
-                     'Villa Canales', 'San Juan Sacatepequez', 'Chimaltenango', 'Coban', 'Huehuetenango', 
-                     'Mazatenango', 'Retalhuleu', 'Totonicapan', 'Jalapa', 'Puerto Barrios', 'Antigua Guatemala', 
-                     'Santa Lucia Cotzumalguapa', 'Solola', 'San Pedro Sacatepequez'],
-        
-        'El Salvador': ['San Salvador', 'Santa Ana', 'Soyapango', 'San Miguel', 'Mejicanos', 'Santa Tecla', 
-                       'Apopa', 'Delgado', 'Ahuachapan', 'Ilopango', 'Zacatecoluca', 'Cojutepeque', 'Usulutan', 
-                       'San Vicente', 'San Marcos', 'Chalatenango', 'La Union', 'Sensuntepeque', 'Metapan', 'Acajutla'],
-        
-        'Honduras': ['Tegucigalpa', 'San Pedro Sula', 'La Ceiba', 'Choloma', 'El Progreso', 'Choluteca', 
-                    'Comayagua', 'Puerto Cortes', 'Danli', 'Juticalpa', 'Siguatepeque', 'Santa Rosa de Copan', 
-                    'Tela', 'Villanueva', 'Potrerillos', 'La Lima', 'La Paz', 'Olanchito', 'Nacaome', 'Santa Barbara'],
-        
-        'Nicaragua': ['Managua', 'Leon', 'Masaya', 'Tipitapa', 'Chinandega', 'Matagalpa', 'Esteli', 'Granada', 
-                     'Ciudad Sandino', 'Juigalpa', 'Jinotega', 'El Viejo', 'Nueva Guinea', 'Diriamba', 'Chichigalpa', 
-                     'Rivas', 'Jalapa', 'Jinotepe', 'Ocotal', 'Somoto'],
-        
-        'Dominican Republic': ['Santo Domingo', 'Santiago de los Caballeros', 'Los Alcarrizos', 'Santo Domingo Este', 
-                             'Santo Domingo Norte', 'Santo Domingo Oeste', 'San Pedro de Macoris', 'La Romana', 
-                             'San Francisco de Macoris', 'San Cristobal', 'Puerto Plata', 'La Vega', 'Moca', 
-                             'Bani', 'Bonao', 'Higuey', 'Barahona', 'Cotui', 'Nagua', 'Azua'],
-        
-        'Jamaica': ['Kingston', 'Montego Bay', 'Portmore', 'Spanish Town', 'Mandeville', 'May Pen', 'Old Harbour', 
-                   'Savanna-la-Mar', 'Port Antonio', 'St. Anns Bay', 'Linstead', 'Black River', 'Ocho Rios', 
-                   'Falmouth', 'Lucea', 'Negril', 'Morant Bay', 'Chapelton', 'Port Maria', 'Yallahs'],
-        
-        'Trinidad and Tobago': ['Port of Spain', 'San Fernando', 'Chaguanas', 'Mon Repos', 'Arima', 'Tunapuna', 
-                               'Sangre Grande', 'Point Fortin', 'Couva', 'Siparia', 'Rio Claro', 'Scarborough', 
-                               'Penal', 'Gasparillo', 'Princess Town', 'San Juan', 'Diego Martin', 'Fyzabad', 
-                               'Arouca', 'Valencia'],
-        
-        'Canada': ['Toronto', 'Montreal', 'Vancouver', 'Calgary', 'Edmonton', 'Ottawa', 'Winnipeg', 
-                  'Quebec City', 'Hamilton', 'Kitchener', 'London', 'Victoria', 'Halifax', 'Oshawa', 
-                  'Windsor', 'Saskatoon', 'Regina', 'St. Catharines', 'Sherbrooke', 'Barrie', 'Kelowna', 
-                  'Kingston', 'Abbotsford', 'Trois-Rivieres', 'Saint John'],
-        
-        'Australia': ['Sydney', 'Melbourne', 'Brisbane', 'Perth', 'Adelaide', 'Gold Coast', 'Canberra', 
-                     'Newcastle', 'Wollongong', 'Logan City', 'Geelong', 'Hobart', 'Townsville', 'Cairns', 
-                     'Darwin', 'Toowoomba', 'Ballarat', 'Bendigo', 'Launceston', 'Mackay', 'Rockhampton', 
-                     'Bundaberg', 'Bunbury', 'Hervey Bay', 'Wagga Wagga'],
-        
-        'New Zealand': ['Auckland', 'Wellington', 'Christchurch', 'Hamilton', 'Tauranga', 'Napier-Hastings', 
-                       'Dunedin', 'Palmerston North', 'Nelson', 'Rotorua', 'New Plymouth', 'Whangarei', 
-                       'Invercargill', 'Whanganui', 'Gisborne', 'Blenheim', 'Pukekohe', 'Timaru', 
-                       'Taupo', 'Masterton'],
-                       
-        'Singapore': ['Singapore'],
-        
-        'South Korea': ['Seoul', 'Busan', 'Incheon', 'Daegu', 'Daejeon', 'Gwangju', 'Suwon', 'Ulsan', 
-                      'Seongnam', 'Goyang', 'Bucheon', 'Ansan', 'Anyang', 'Changwon', 'Jeonju', 
-                      'Cheongju', 'Pohang', 'Uijeongbu', 'Hwaseong', 'Yongin'],
-        
-        'Japan': ['Tokyo', 'Yokohama', 'Osaka', 'Nagoya', 'Sapporo', 'Kobe', 'Kyoto', 'Fukuoka', 
-                 'Kawasaki', 'Saitama', 'Hiroshima', 'Sendai', 'Kitakyushu', 'Chiba', 'Sakai', 
-                 'Kumamoto', 'Niigata', 'Okayama', 'Hamamatsu', 'Sagamihara'],
-        
-        'Israel': ['Jerusalem', 'Tel Aviv', 'Haifa', 'Rishon LeZion', 'Petah Tikva', 'Ashdod', 'Netanya', 
-                  'Beer Sheva', 'Holon', 'Bnei Brak', 'Ramat Gan', 'Rehovot', 'Herzliya', 'Kfar Saba', 
-                  'Modiin', 'Ashkelon', 'Bat Yam', 'Nahariya', 'Lod', 'Nazareth'],
-        
-        'South Africa': ['Johannesburg', 'Cape Town', 'Durban', 'Pretoria', 'Port Elizabeth', 'Bloemfontein', 
-                        'Nelspruit', 'Kimberley', 'Polokwane', 'Pietermaritzburg', 'East London', 'Rustenburg', 
-                        'Vereeniging', 'Potchefstroom', 'Welkom', 'Newcastle', 'Krugersdorp', 'Witbank', 
-                        'Centurion', 'Stellenbosch'],
-        
-        'Morocco': ['Casablanca', 'Rabat', 'Fes', 'Marrakech', 'Agadir', 'Tangier', 'Meknes', 'Oujda', 
-                   'Kenitra', 'Tetouan', 'Safi', 'Mohammedia', 'El Jadida', 'Taza', 'Beni Mellal', 
-                   'Nador', 'Settat', 'Berrechid', 'Khouribga', 'Larache'],
-        
-        'Egypt': ['Cairo', 'Alexandria', 'Giza', 'Shubra El-Kheima', 'Port Said', 'Suez', 'Luxor', 
-                 'Aswan', 'Ismailia', 'Faiyum', 'Zagazig', 'Damietta', 'Asyut', 'Tanta', 'Sohag', 
-                 'Mansoura', 'Hurghada', 'Beni Suef', 'Minya', 'Qena'],
-        
-        'Turkey': ['Istanbul', 'Ankara', 'Izmir', 'Bursa', 'Adana', 'Gaziantep', 'Konya', 'Antalya', 
-                  'Mersin', 'Diyarbakir', 'Kayseri', 'Eskisehir', 'Samsun', 'Denizli', 'Kahramanmaras', 
-                  'Ordu', 'Erzurum', 'Malatya', 'Trabzon', 'Elazig'],
-        
-        'United Arab Emirates': ['Dubai', 'Abu Dhabi', 'Sharjah', 'Al Ain', 'Ajman', 'Ras Al-Khaimah', 
-                               'Fujairah', 'Umm Al-Quwain'],
-        
-        'Saudi Arabia': ['Riyadh', 'Jeddah', 'Mecca', 'Medina', 'Dammam', 'Taif', 'Tabuk', 'Buraidah', 
-                       'Khamis Mushait', 'Abha', 'Najran', 'Yanbu', 'Khobar', 'Sakaka', 'Al Bahah', 
-                       'Jubail', 'Jizan', 'Hafar Al-Batin', 'Dhahran', 'Qatif'],
-        
-        'Qatar': ['Doha', 'Al Rayyan', 'Al Wakrah', 'Al Khor', 'Mesaieed', 'Dukhan', 'Al Shamal', 
-                 'Madinat ash Shamal', 'Umm Salal Muhammad', 'Al Wukair'],
-        
-        'Kuwait': ['Kuwait City', 'Hawalli', 'Salmiya', 'Al Ahmadi', 'Sabah Al-Salem', 'Al Farwaniyah', 
-                  'Al Jahra', 'Mangaf', 'Fahaheel', 'Ar Rumaithiya'],
-        
-        'Bahrain': ['Manama', 'Riffa', 'Muharraq', 'Hamad Town', 'A\'Ali', 'Isa Town', 'Sitra', 
-                   'Budaiya', 'Jidhafs', 'Sanabis'],
-        
-        'Oman': ['Muscat', 'Seeb', 'Salalah', 'Sohar', 'Nizwa', 'Sur', 'Ibri', 'Saham', 'Barka', 'Rustaq'],
-        
-        'Jordan': ['Amman', 'Zarqa', 'Irbid', 'Russeifa', 'Aqaba', 'Madaba', 'Mafraq', 'Jerash', 
-                  'Salt', 'Karak', 'Tafilah', 'Ma\'an', 'Ajloun', 'Ramtha'],
-        
-        'United Kingdom': ['London', 'Birmingham', 'Manchester', 'Glasgow', 'Liverpool', 'Bristol', 'Sheffield', 
-                          'Leeds', 'Edinburgh', 'Leicester', 'Coventry', 'Bradford', 'Belfast', 'Nottingham', 
-                          'Kingston upon Hull', 'Newcastle upon Tyne', 'Southampton', 'Reading', 'Derby', 'Aberdeen']
-    }
-    
-    # Create a regex of cities for the given country (case insensitive)
-    if country and country in cities_by_country:
-        city_list = cities_by_country[country]
-        city_pattern = r'\b(' + '|'.join(city_list) + r')\b'
-        
-        # First look for cities from our dictionary
-        match = re.search(city_pattern, address_text, re.I)
-        if match:
-            return match.group(0).strip()
-    
-    # If no match with known cities, try some heuristics
-    
-    # Look for patterns like "City: X" or "X, City" or "City of X"
-    city_indicator_patterns = [
-        r'\bCity:\s*([A-Z][a-zA-Z\s]+)(?=[\s,;]|$)',
-        r'\b([A-Z][a-zA-Z\s]+),\s*(?:City|Town|Village|Municipality)(?=[\s,;]|$)',
-        r'\b(?:City|Town|Village|Municipality)\s+of\s+([A-Z][a-zA-Z\s]+)(?=[\s,;]|$)',
-        r'\b([A-Z][a-zA-Z\s]+)(?=\s*-\s*(?:Colombia|Mexico|Brazil|Chile|Argentina|Peru|Ecuador|Venezuela|Uruguay|Paraguay|Bolivia|Panama|Guatemala|El Salvador|Honduras|Nicaragua|Dominican Republic|Jamaica|Trinidad|Canada|Australia|New Zealand|Singapore|South Korea|Japan|Israel|South Africa|Morocco|Egypt|Turkey|UAE|Saudi Arabia|Qatar|Kuwait|Bahrain|Oman|Jordan|UK))(?=[\s,;]|$)'
-    ]
-    
-    for pattern in city_indicator_patterns:
-        match = re.search(pattern, address_text, re.I)
-        if match and match.group(1):
-            return match.group(1).strip()
-    
-    # Special case for "Medellin - Colombia" pattern as in the example
-    special_pattern = r'\b([A-Z][a-zA-Z]+)\s*-\s*[A-Za-z]+\b'
-    special_match = re.search(special_pattern, address_text, re.I)
-    if special_match:
-        return special_match.group(1).strip()
-    
-    # Split by common delimiters and look for capitalized words that might be cities
-    parts = re.split(r'[\s,;:\-\/]+', address_text)
-    candidates = []
-    
-    for part in parts:
-        # Skip empty or very short parts
-        if not part or len(part) < 3:
-            continue
-        
-        # Check if it's capitalized and not a street type or direction
-        if (part[0].isupper() and
-            not re.match(r'^(St|Ave|Rd|Blvd|Ln|Dr|Ct|Plz|Sq|Hwy|Rt|North|South|East|West|NE|NW|SE|SW)$', part, re.I) and
-            not re.match(r'^\d+$', part)):  # Not just numbers
-            candidates.append(part)
-    
-    # Return the best candidate (preferring longer words, as they're more likely to be city names)
-    if candidates:
-        candidates.sort(key=len, reverse=True)
-        return candidates[0]
-    
-    return ""
-
-# Function to extract logo from website using Clearbit API
-def extract_logo_from_website(website):
-    if not website:
-        return ""
-    
-    try:
-        # Clean up the website URL to get just the domain
-        domain = website.strip().lower()
-        domain = re.sub(r'^https?://', '', domain, flags=re.I)
-        domain = re.sub(r'^www\.', '', domain, flags=re.I)
-        domain = domain.split('/')[0]
-        
-        # Use Clearbit's logo API - this is a free service with generous limits
-        return f"https://logo.clearbit.com/{domain}"
-        
-        # In a real implementation with web scraping, you would do:
-        """
-        # Make request to the website
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8'
-        }
-        
-        response = requests.get(f"https://{domain}", headers=headers, timeout=10)
-        
-        if response.status_code == 200:
-            # Look for img tags with class="logo"
-            logo_pattern = r'<img[^>]*(?:class=["'][^"']*logo[^"']*["']|alt=["'][^"']*logo[^"']*["'])[^>]*src=["']([^"']+)["'][^>]*>'
-            match = re.search(logo_pattern, response.text, re.I)
-            
-            if match and match.group(1):
-                logo_url = match.group(1)
-                
-                # Handle relative URLs
-                if logo_url.startswith('/'):
-                    logo_url = f"https://{domain}{logo_url}"
-                
-                return logo_url
-        
-        return f"https://logo.clearbit.com/{domain}"  # Fallback to Clearbit
-        """
-    
-    except Exception as e:
-        st.error(f"Error extracting logo: {str(e)}")
-        return f"https://via.placeholder.com/150?text=Error"
+# Set page config
+st.set_page_config(page_title="Data Cleanup and Enhancement Tool", layout="wide")
 
 # Main app layout
 st.title("Data Cleanup and Enhancement Tool")
@@ -439,8 +28,133 @@ if 'step' not in st.session_state:
     st.session_state.step = 1  # Current step in the process
 if 'data' not in st.session_state:
     st.session_state.data = None  # DataFrame to store the data
+if 'original' not in st.session_state:
+    st.session_state.original = None  # Data as read, which processing never modifies
+if 'derived' not in st.session_state:
+    st.session_state.derived = None  # Task outputs computed from the original data (see derived_columns)
 if 'processed' not in st.session_state:
     st.session_state.processed = False  # Flag to indicate if data has been processed
+if 'stream_file' not in st.session_state:
+    st.session_state.stream_file = None  # Uploaded file read when processing (large file and column picking modes)
+if 'load_mode' not in st.session_state:
+    st.session_state.load_mode = 'full'  # 'full', 'stream' (large file mode) or 'columns' (only needed columns)
+if 'output_path' not in st.session_state:
+    st.session_state.output_path = None  # File written by large file mode
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None  # Background job processing the data
+if 'exports' not in st.session_state:
+    st.session_state.exports = {}  # Export files written for the current results, by format
+if 'batch_items' not in st.session_state:
+    st.session_state.batch_items = []  # Files and sheets found in batch mode (see cleanup_batch)
+if 'batch_schemas' not in st.session_state:
+    st.session_state.batch_schemas = []  # Column layouts of the batch, each with its own mappings
+if 'batch_files' not in st.session_state:
+    st.session_state.batch_files = None  # Status of each file and sheet of a processed batch
+
+# Names shown on the export buttons
+EXPORT_LABELS = {'csv': 'CSV', 'xlsx': 'Excel', 'parquet': 'Parquet', 'feather': 'Feather'}
+
+# Delete the export files written for earlier results
+def clear_exports():
+    for export_path in st.session_state.exports.values():
+        if os.path.exists(export_path):
+            os.remove(export_path)
+    st.session_state.exports = {}
+
+# Task outputs computed from the original data, created when first needed
+def derived_columns():
+    if st.session_state.derived is None:
+        st.session_state.derived = cleanup_engine.DerivedColumns()
+    return st.session_state.derived
+
+# Parsed uploads shared by all sessions, so reruns and repeat uploads of the
+# same file skip parsing
+@st.cache_resource
+def parsed_files():
+    return cleanup_io.ParsedFileCache()
+
+# Background jobs run on one bounded pool shared by all sessions (see cleanup_jobs)
+@st.cache_resource
+def job_runner():
+    return cleanup_jobs.JobRunner()
+
+# Seconds between progress checks while a job runs
+POLL_INTERVAL = 0.5
+
+# Mapped fields, in the order they are shown
+MAPPING_FIELDS = ['email', 'website', 'address', 'city', 'country', 'logo']
+
+# Remove the files staged for the previous batch
+def clear_batch():
+    if st.session_state.get('batch_dir'):
+        shutil.rmtree(st.session_state.batch_dir, ignore_errors=True)
+    st.session_state.batch_dir = None
+    st.session_state.batch_items = []
+    st.session_state.batch_schemas = []
+    st.session_state.batch_mappings = []
+
+# Status of each file and sheet of a batch, as a table
+def batch_table(files):
+    table = pd.DataFrame(files)
+    table['schema'] = (pd.to_numeric(table['schema']) + 1).astype('Int64')
+    return table.rename(columns={
+        'name': 'File', 'sheet': 'Sheet', 'schema': 'Layout', 'status': 'Status', 'rows': 'Rows',
+        'seconds': 'Seconds', 'error': 'Error', 'output': 'Output'
+    })
+
+# Show the results a finished job saved to disk in the Results tab
+def load_job_results(job):
+    clear_exports()
+    st.session_state.batch_files = None
+    # Merged view of duplicate clusters, when they were looked for
+    st.session_state.merged_path = job.merged_path
+    st.session_state.duplicates = job.duplicates
+    if job.derived is not None and job.id == st.session_state.job_id:
+        # The job updated a copy of this session's task outputs; it replaces them now
+        st.session_state.derived, job.derived = job.derived, None
+    if job.mode == 'batch':
+        # A combined file, or a zip with a file per input sheet, stays on disk
+        st.session_state.output_path = job.output_path
+        st.session_state.batch_files = job.files
+        if job.output_format == 'zip':
+            st.session_state.data = batch_table(job.files)
+        else:
+            st.session_state.data = cleanup_io.read_preview(job.output_path, job.output_path, rows=10)
+    elif job.mode == 'stream':
+        # Large file mode results stay on disk; only a preview is loaded
+        st.session_state.output_path = job.output_path
+        st.session_state.data = cleanup_io.read_preview(job.output_path, job.output_path, rows=10)
+    elif job.id == st.session_state.job_id and st.session_state.original is not None and not job.merged_path:
+        # This session's own job: lay its outputs over the original data
+        st.session_state.output_path = None
+        st.session_state.data = derived_columns().apply(st.session_state.original, job.column_mappings)
+    else:
+        st.session_state.output_path = None
+        st.session_state.data = cleanup_io.read_file(job.output_path, job.output_path)
+    st.session_state.processed = True
+    st.session_state.cache_summary = job.cache_summary
+    st.session_state.job_id = job.id
+    st.session_state.loaded_job = job.id
+
+# Time, rows and calls per stage of a finished job, with the report to download
+def show_profile(job):
+    if not job.profile.get('stages'):
+        return
+    with st.expander("Performance"):
+        st.write(f"Total time: {job.profile['wall_seconds']:.2f} s")
+        st.table(pd.DataFrame(job.profile['stages']).set_index('stage').rename(columns={
+            'seconds': 'Seconds', 'rows': 'Rows', 'rows_per_sec': 'Rows/sec', 'calls': 'Calls', 'share': 'Share'
+        }))
+        st.download_button(
+            "Download Timing Report (JSON)",
+            json.dumps(dict(job.profile, job_id=job.id, cache=job.cache_summary), indent=2),
+            file_name=f"profile_{job.id}.json",
+            key=f"profile_{job.id}"
+        )
+        if job.cprofile_path and os.path.exists(job.cprofile_path):
+            with open(job.cprofile_path, encoding='utf-8') as cprofile_file:
+                cprofile_text = cprofile_file.read()
+            st.text(cprofile_text)
 
 # Create tabs for the different steps
 tab1, tab2, tab3, tab4 = st.tabs(["1. Upload File", "2. Configure Columns", "3. Process Data", "4. Results & Export"])
@@ -448,23 +162,81 @@ tab1, tab2, tab3, tab4 = st.tabs(["1. Upload File", "2. Configure Columns", "3.
 # File Upload Tab
 with tab1:
     st.header("Upload Your File")
-    st.write("Supported formats: CSV, Excel (.xlsx, .xls)")
+    st.write("Supported formats: CSV, Excel (.xlsx, .xls), Parquet, Feather")
+    
+    # Batch mode takes several files, every sheet of each workbook and zip archives
+    batch_mode = st.checkbox(
+        "Batch mode",
+        help="Upload several files or a zip archive and process every file and sheet in them, streamed like large file mode."
+    )
+    if batch_mode:
+        uploaded_file = None
+        uploaded_files = st.file_uploader("Choose files", type=BATCH_EXTENSIONS, accept_multiple_files=True)
+    else:
+        uploaded_file = st.file_uploader("Choose a file", type=INPUT_EXTENSIONS)
+        uploaded_files = []
+    
+    # In large file mode only the first rows are loaded here; the whole file is
+    # read, cleaned and written a chunk at a time when it is processed
+    stream_mode = st.checkbox(
+        "Large file mode",
+        disabled=batch_mode,
+        help="Process the file in chunks and write the results straight to disk instead of loading it into memory."
+    )
     
-    uploaded_file = st.file_uploader("Choose a file", type=["csv", "xlsx", "xls"])
+    # Otherwise only the mapped columns, and any others picked, are loaded when processing
+    pick_columns = st.checkbox(
+        "Load only the columns I need",
+        disabled=stream_mode or batch_mode,
+        help="Read just the mapped columns and the other columns you choose, to save memory on wide files."
+    )
+    load_mode = 'stream' if stream_mode else 'columns' if pick_columns else 'full'
     
     if uploaded_file is not None:
         try:
-            # Determine file type and read accordingly
-            if uploaded_file.name.endswith('.csv'):
-                data = pd.read_csv(uploaded_file)
-            else:  # Excel file
-                data = pd.read_excel(uploaded_file)
+            # Hash each upload once; its parsed contents come from the cache after that
+            upload_id = (uploaded_file.name, uploaded_file.size, getattr(uploaded_file, 'file_id', None))
+            if st.session_state.get('upload_id') != upload_id:
+                st.session_state.upload_id = upload_id
+                st.session_state.upload_hash = cleanup_io.content_hash(uploaded_file)
+            upload_key = (st.session_state.upload_hash, file_format(uploaded_file.name), load_mode)
             
-            st.session_state.data = data
-            st.session_state.step = 2  # Move to next step
+            # Determine file type and read accordingly, timing the read for the performance report
+            def parse_upload():
+                started = time.perf_counter()
+                if load_mode != 'full':
+                    parsed = cleanup_io.read_preview(uploaded_file, uploaded_file.name)
+                else:
+                    # Text columns with few distinct values (like country) are stored as categories
+                    parsed = cleanup_io.read_file(uploaded_file, uploaded_file.name, compact=True)
+                st.session_state.read_seconds = time.perf_counter() - started
+                return parsed
+            
+            data = parsed_files().get(upload_key, parse_upload)
+            
+            # Only a new file (or switching modes) replaces the data, so reruns
+            # keep processed results
+            if st.session_state.get('upload_key') != upload_key:
+                st.session_state.upload_key = upload_key
+                st.session_state.stream_file = uploaded_file if load_mode != 'full' else None
+                st.session_state.load_mode = load_mode
+                if 'extra_columns' in st.session_state:
+                    del st.session_state.extra_columns
+                st.session_state.data = data
+                st.session_state.original = data if load_mode == 'full' else None
+                st.session_state.derived = None
+                st.session_state.processed = False
+                clear_exports()
+                st.session_state.job_id = None
+                st.session_state.step = 2  # Move to next step
             
             st.success(f"File '{uploaded_file.name}' uploaded successfully!")
-            st.write(f"Found {len(data.columns)} columns and {len(data)} rows.")
+            if load_mode == 'stream':
+                st.write(f"Found {len(data.columns)} columns. Rows will be read in chunks while processing.")
+            elif load_mode == 'columns':
+                st.write(f"Found {len(data.columns)} columns. The columns you need will be loaded when processing.")
+            else:
+                st.write(f"Found {len(data.columns)} columns and {len(data)} rows.")
             
             # Preview the data
             st.subheader("Data Preview")
@@ -473,14 +245,105 @@ with tab1:
             # Button to navigate to next step
             if st.button("Next: Configure Columns"):
                 st.session_state.step = 2
-                st.experimental_rerun()
+                st.rerun()
         
         except Exception as e:
             st.error(f"Error reading file: {str(e)}")
+    
+    if uploaded_files:
+        try:
+            # Stage the uploads on disk and list the files and sheets in them, once per set of uploads
+            upload_key = ('batch',) + tuple(
+                (upload.name, upload.size, getattr(upload, 'file_id', None)) for upload in uploaded_files
+            )
+            if st.session_state.get('upload_key') != upload_key:
+                clear_batch()
+                with st.spinner("Reading files..."):
+                    st.session_state.batch_dir = tempfile.mkdtemp(prefix='datacleanup-batch-')
+                    inputs = []
+                    for index, upload in enumerate(uploaded_files):
+                        upload_path = os.path.join(
+                            st.session_state.batch_dir, f"upload-{index}{os.path.splitext(upload.name)[1]}"
+                        )
+                        with open(upload_path, 'wb') as upload_file:
+                            upload_file.write(upload.getbuffer())
+                        inputs.append((upload_path, upload.name))
+                    items = cleanup_batch.expand_inputs(inputs, st.session_state.batch_dir)
+                    schemas = list(cleanup_batch.group_by_schema(items))
+                
+                st.session_state.upload_key = upload_key
+                st.session_state.batch_items = items
+                st.session_state.batch_schemas = schemas
+                st.session_state.batch_mappings = [{field: '' for field in MAPPING_FIELDS} for _ in schemas]
+                st.session_state.stream_file = None
+                st.session_state.load_mode = 'batch'
+                if 'extra_columns' in st.session_state:
+                    del st.session_state.extra_columns
+                # The first readable sheet stands in for the data in the other tabs
+                first = next((item for item in items if item.status != 'failed'), None)
+                st.session_state.data = (
+                    cleanup_io.read_preview(first.path, first.name, sheet=first.sheet) if first is not None else None
+                )
+                st.session_state.original = None
+                st.session_state.derived = None
+                st.session_state.processed = False
+                clear_exports()
+                st.session_state.job_id = None
+                st.session_state.step = 2
+            
+            items = st.session_state.batch_items
+            readable = [item for item in items if item.status != 'failed']
+            if readable:
+                st.success(
+                    f"Found {len(readable)} files and sheets in {len(st.session_state.batch_schemas)} column layouts."
+                )
+            else:
+                st.error("None of the files could be read.")
+            st.dataframe(batch_table([item.to_dict() for item in items])[['File', 'Sheet', 'Layout', 'Status', 'Error']])
+            
+            if readable and st.button("Next: Configure Columns", key="batch_next"):
+                st.session_state.step = 2
+                st.rerun()
+        
+        except Exception as e:
+            st.error(f"Error reading files: {str(e)}")
 
 # Configure Columns Tab
 with tab2:
-    if st.session_state.data is not None:
+    if st.session_state.data is not None and st.session_state.load_mode == 'batch':
+        st.header("Configure Column Mappings")
+        st.write("Sheets with the same columns share a layout. Select which columns correspond to each field in every layout:")
+        
+        for index, columns in enumerate(st.session_state.batch_schemas):
+            layout_items = [item for item in st.session_state.batch_items if item.schema == index]
+            st.subheader(f"Layout {index + 1}")
+            st.caption(", ".join(item.label for item in layout_items))
+            
+            mapping = st.session_state.batch_mappings[index]
+            options = [''] + list(columns)
+            layout_columns = st.columns(3)
+            for position, field in enumerate(MAPPING_FIELDS):
+                with layout_columns[position % 3]:
+                    mapping[field] = st.selectbox(
+                        f"{field.capitalize()} Column:",
+                        options=options,
+                        index=options.index(mapping[field]) if mapping[field] in options else 0,
+                        key=f"batch_{index}_{field}"
+                    )
+        
+        # Navigation buttons
+        col_back, col_next = st.columns([1, 1])
+        
+        with col_back:
+            if st.button("Back", key="batch_back"):
+                st.session_state.step = 1
+                st.rerun()
+        
+        with col_next:
+            if st.button("Next: Process Data", key="batch_process"):
+                st.session_state.step = 3
+                st.rerun()
+    elif st.session_state.data is not None:
         st.header("Configure Column Mappings")
         st.write("Select which columns in your data correspond to each field:")
         
@@ -543,129 +406,236 @@ with tab2:
                       list([''] + list(st.session_state.data.columns)).index(st.session_state.column_mappings['logo'])
             )
         
+        # Columns that aren't mapped are only read if they are wanted in the results
+        if st.session_state.stream_file is not None:
+            mapped = set(st.session_state.column_mappings.values())
+            other_columns = [column for column in st.session_state.data.columns if column not in mapped]
+            if 'extra_columns' not in st.session_state:
+                # Large file mode keeps every column by default, column picking none
+                st.session_state.extra_columns = other_columns if st.session_state.load_mode == 'stream' else []
+            st.session_state.extra_columns = st.multiselect(
+                "Other columns to include in the results:",
+                options=other_columns,
+                default=[column for column in st.session_state.extra_columns if column in other_columns]
+            )
+        
         # Navigation buttons
         col_back, col_next = st.columns([1, 1])
         
         with col_back:
             if st.button("Back"):
                 st.session_state.step = 1
-                st.experimental_rerun()
+                st.rerun()
         
         with col_next:
             if st.button("Next: Process Data"):
                 st.session_state.step = 3
-                st.experimental_rerun()
+                st.rerun()
     else:
         st.info("Please upload a file in the previous step.")
 
 # Process Data Tab
 with tab3:
-    if st.session_state.data is not None and all(field in st.session_state.column_mappings for field in ['email', 'website', 'address', 'city', 'country', 'logo']):
+    batch = st.session_state.load_mode == 'batch'
+    if st.session_state.data is not None and (batch or all(field in st.session_state.get('column_mappings', {}) for field in ['email', 'website', 'address', 'city', 'country', 'logo'])):
         st.header("Process Data")
         
-        # Show selected configuration
-        st.subheader("Selected Configuration:")
-        config_text = ""
-        for field, column in st.session_state.column_mappings.items():
-            if column:
-                config_text += f"- {field.capitalize()}: {column}\n"
-        
-        if config_text:
-            st.markdown(config_text)
+        if batch:
+            # Configuration and tasks of every layout
+            st.subheader("Selected Configuration:")
+            layouts_text = ""
+            for index, mapping in enumerate(st.session_state.batch_mappings):
+                layout_items = [item for item in st.session_state.batch_items if item.schema == index]
+                layout_tasks = cleanup_engine.active_tasks(mapping)
+                mapped = ", ".join(f"{field.capitalize()}: {column}" for field, column in mapping.items() if column)
+                layouts_text += f"- Layout {index + 1} ({len(layout_items)} files and sheets): "
+                layouts_text += f"{mapped}; tasks: {', '.join(layout_tasks)}\n" if layout_tasks else "skipped, no tasks to perform\n"
+            st.markdown(layouts_text)
+            if not any(cleanup_engine.active_tasks(mapping) for mapping in st.session_state.batch_mappings):
+                st.warning("No tasks to perform based on current configuration.")
         else:
-            st.warning("No columns have been configured.")
-        
-        # Show processing tasks
-        st.subheader("Processing Tasks:")
-        tasks_text = ""
-        if st.session_state.column_mappings['email'] and st.session_state.column_mappings['website']:
-            tasks_text += f"- Validate and correct email addresses in column \"{st.session_state.column_mappings['email']}\"\n"
+            # Show selected configuration
+            st.subheader("Selected Configuration:")
+            config_text = ""
+            for field, column in st.session_state.column_mappings.items():
+                if column:
+                    config_text += f"- {field.capitalize()}: {column}\n"
+            
+            if config_text:
+                st.markdown(config_text)
+            else:
+                st.warning("No columns have been configured.")
+            
+            # Show processing tasks
+            st.subheader("Processing Tasks:")
+            tasks_text = ""
+            if st.session_state.column_mappings['email'] and st.session_state.column_mappings['website']:
+                tasks_text += f"- Validate and correct email addresses in column \"{st.session_state.column_mappings['email']}\"\n"
+            
+            if st.session_state.column_mappings['address']:
+                tasks_text += f"- Clean up addresses in column \"{st.session_state.column_mappings['address']}\"\n"
+            
+            if st.session_state.column_mappings['city'] and st.session_state.column_mappings['address'] and st.session_state.column_mappings['country']:
+                tasks_text += f"- Extract cities from addresses and update column \"{st.session_state.column_mappings['city']}\"\n"
+            
+            if st.session_state.column_mappings['logo'] and st.session_state.column_mappings['website']:
+                tasks_text += f"- Extract company logos from websites and update column \"{st.session_state.column_mappings['logo']}\"\n"
+            
+            if tasks_text:
+                st.markdown(tasks_text)
+            else:
+                st.warning("No tasks to perform based on current configuration.")
+        
+        # Parallel processing option
+        workers = st.number_input(
+            "Worker processes:",
+            min_value=1,
+            max_value=os.cpu_count() or 1,
+            value=1,
+            help="Split the rows into chunks and process them on several CPU cores. Worth it for large files."
+        )
+        
+        use_cache = st.checkbox(
+            "Reuse results from earlier runs",
+            help=f"Keep cleaned addresses, cities and domains in an on-disk cache ({DEFAULT_CACHE_PATH}) shared by all sessions."
+        )
+        cache_path = DEFAULT_CACHE_PATH if use_cache else None
+        
+        discover_logos = False
+        if any(mapping['logo'] and mapping['website'] for mapping in (
+            st.session_state.batch_mappings if batch else [st.session_state.column_mappings]
+        )):
+            discover_logos = st.checkbox(
+                "Find logos on the websites",
+                help="Fetch each company's home page and use the logo found there instead of a Clearbit logo URL. Needs internet access and is slower."
+            )
         
-        if st.session_state.column_mappings['address']:
-            tasks_text += f"- Clean up addresses in column \"{st.session_state.column_mappings['address']}\"\n"
+        # Outputs of an earlier run that still match the mappings are reused
+        if st.session_state.load_mode not in ('stream', 'batch'):
+            stale = derived_columns().stale_tasks(st.session_state.column_mappings, discover_logos)
+            up_to_date = [task for task in cleanup_engine.active_tasks(st.session_state.column_mappings) if task not in stale]
+            if up_to_date and stale:
+                st.caption(f"Up to date from the last run: {', '.join(up_to_date)}. Only {', '.join(stale)} will be computed.")
+            elif up_to_date:
+                st.caption("Every task is up to date from the last run; nothing needs to be computed.")
+        
+        dedupe = False
+        if not batch:
+            dedupe = st.checkbox(
+                "Find duplicate companies",
+                help="Group rows of the same company by website or email domain and by (nearly) the same address in the same city, add a cluster ID to every row and build a merged view with one row per company."
+            )
         
-        if st.session_state.column_mappings['city'] and st.session_state.column_mappings['address'] and st.session_state.column_mappings['country']:
-            tasks_text += f"- Extract cities from addresses and update column \"{st.session_state.column_mappings['city']}\"\n"
+        capture_profile = st.checkbox(
+            "Record a detailed profile",
+            help="Run the job under cProfile and list the functions that took the most time. Slows processing down a little."
+        )
         
-        if st.session_state.column_mappings['logo'] and st.session_state.column_mappings['website']:
-            tasks_text += f"- Extract company logos from websites and update column \"{st.session_state.column_mappings['logo']}\"\n"
+        if st.session_state.load_mode in ('stream', 'batch'):
+            output_format = st.selectbox("Output format:", OUTPUT_FORMATS, format_func=str.upper)
         
-        if tasks_text:
-            st.markdown(tasks_text)
-        else:
-            st.warning("No tasks to perform based on current configuration.")
+        if batch:
+            combine = st.checkbox(
+                "Combine into one file",
+                help="Write every file and sheet into one output file, with the file and sheet each row came from. Otherwise each gets its own file, downloaded together as a zip."
+            )
+            file_workers = st.number_input(
+                "Files processed at the same time:",
+                min_value=1,
+                max_value=os.cpu_count() or 1,
+                value=min(cleanup_batch.DEFAULT_FILE_WORKERS, os.cpu_count() or 1),
+                help="Process several files and sheets at once, each in its own process."
+            )
         
         # Process data button
         if st.button("Process Data Now"):
-            if not any(st.session_state.column_mappings.values()):
+            if batch and not any(cleanup_engine.active_tasks(mapping) for mapping in st.session_state.batch_mappings):
+                st.error("Please configure the columns of at least one layout before processing.")
+            elif batch:
+                mappings = dict(zip(st.session_state.batch_schemas, st.session_state.batch_mappings))
+                job = job_runner().submit_batch(
+                    st.session_state.batch_items, mappings, output_format, combine=combine,
+                    file_workers=int(file_workers), cprofile=capture_profile,
+                    workers=int(workers), cache_path=cache_path, discover_logos=discover_logos
+                )
+                st.session_state.job_id = job.id
+                st.rerun()
+            elif not any(st.session_state.column_mappings.values()):
                 st.error("Please configure at least one column mapping before processing.")
             else:
-                # Create a copy of the data for processing
-                processed_data = st.session_state.data.copy()
-                
-                # Set up progress tracking
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                # Process the data
-                total_rows = len(processed_data)
-                
-                for i, (idx, row) in enumerate(processed_data.iterrows()):
-                    # Update progress
-                    progress = (i + 1) / total_rows
-                    progress_bar.progress(progress)
-                    status_text.text(f"Processing row {i+1} of {total_rows}...")
-                    
-                    # Process email if column selected
-                    email_col = st.session_state.column_mappings['email']
-                    website_col = st.session_state.column_mappings['website']
-                    country_col = st.session_state.column_mappings['country']
-                    
-                    if email_col and website_col:
-                        email_value = str(row[email_col]) if pd.notna(row[email_col]) else ""
-                        website_value = str(row[website_col]) if pd.notna(row[website_col]) else ""
-                        country_value = str(row[country_col]) if country_col and pd.notna(row[country_col]) else ""
-                        
-                        processed_data.at[idx, email_col] = validate_and_correct_email(
-                            email_value, country_value, website_value
-                        )
-                    
-                    # Clean up address if column selected
-                    address_col = st.session_state.column_mappings['address']
-                    if address_col:
-                        address_value = str(row[address_col]) if pd.notna(row[address_col]) else ""
-                        processed_data.at[idx, address_col] = cleanup_address(address_value)
-                    
-                    # Extract city if columns selected
-                    city_col = st.session_state.column_mappings['city']
-                    if city_col and address_col and country_col:
-                        address_value = str(row[address_col]) if pd.notna(row[address_col]) else ""
-                        country_value = str(row[country_col]) if pd.notna(row[country_col]) else ""
-                        processed_data.at[idx, city_col] = extract_city(address_value, country_value)
-                    
-                    # Extract logo if columns selected
-                    logo_col = st.session_state.column_mappings['logo']
-                    if logo_col and website_col:
-                        website_value = str(row[website_col]) if pd.notna(row[website_col]) else ""
-                        processed_data.at[idx, logo_col] = extract_logo_from_website(website_value)
-                    
-                    # Add a small delay to make progress visible
-                    time.sleep(0.01)
-                
-                # Update session state with processed data
-                st.session_state.data = processed_data
-                st.session_state.processed = True
+                # Only read the mapped columns and the other columns asked for
+                usecols = None
+                if st.session_state.stream_file is not None:
+                    wanted = set(st.session_state.column_mappings.values()) | set(st.session_state.get('extra_columns', []))
+                    usecols = [column for column in st.session_state.data.columns if column in wanted]
                 
-                # Complete progress bar
-                progress_bar.progress(1.0)
-                status_text.text("Processing complete!")
-                
-                # Success message
-                st.success("Data processing completed successfully!")
+                # Hand the work to the shared background runner, so it keeps
+                # going if this page is rerun or closed
+                if st.session_state.load_mode == 'stream':
+                    job = job_runner().submit_file(
+                        st.session_state.stream_file, st.session_state.stream_file.name,
+                        st.session_state.column_mappings, output_format, cprofile=capture_profile, dedupe=dedupe,
+                        usecols=usecols, workers=int(workers), cache_path=cache_path, discover_logos=discover_logos
+                    )
+                else:
+                    # Always process the original data, not the results of an earlier run
+                    data = st.session_state.original
+                    read_seconds = st.session_state.get('read_seconds')
+                    if data is None and st.session_state.load_mode == 'full':
+                        # Results loaded by job ID are all there is to start from
+                        data = st.session_state.original = st.session_state.data
+                    if st.session_state.load_mode == 'columns':
+                        with st.spinner("Loading columns..."):
+                            started = time.perf_counter()
+                            data = parsed_files().get(
+                                st.session_state.upload_key + (tuple(usecols),),
+                                lambda: cleanup_io.read_file(
+                                    st.session_state.stream_file, st.session_state.stream_file.name, usecols=usecols,
+                                    compact=True, category_columns=[st.session_state.column_mappings['country']]
+                                )
+                            )
+                            read_seconds = time.perf_counter() - started
+                        st.session_state.original = data
+                    job = job_runner().submit_dataframe(
+                        data, st.session_state.column_mappings, cprofile=capture_profile, read_seconds=read_seconds,
+                        derived=derived_columns(), dedupe=dedupe,
+                        workers=int(workers), cache_path=cache_path, discover_logos=discover_logos
+                    )
+                st.session_state.job_id = job.id
+                st.rerun()
+        
+        # Poll the job until it finishes
+        job = job_runner().get(st.session_state.job_id) if st.session_state.job_id else None
+        if job is not None and not job.is_finished:
+            st.info(f"Processing in the background as job {job.id}. You can leave this page and load the results later from the Results tab with this ID.")
+            fraction = job.fraction()
+            st.progress(fraction if fraction is not None else 0.0)
+            st.text(job.message)
+            if job.files:
+                st.dataframe(batch_table(job.files))
+            
+            if st.button("Cancel Processing"):
+                job.cancel()
+            
+            time.sleep(POLL_INTERVAL)
+            st.rerun()
+        elif job is not None and job.status == 'done':
+            if st.session_state.get('loaded_job') != job.id:
+                load_job_results(job)
                 
                 # Move to results tab
                 st.session_state.step = 4
-                st.experimental_rerun()
+                st.rerun()
+            st.success("Data processing completed successfully!")
+            if job.error:
+                # Batches finish even when some files or sheets fail
+                st.warning(job.error)
+            show_profile(job)
+        elif job is not None and job.status == 'failed':
+            st.error(f"Processing failed: {job.error}")
+            show_profile(job)
+        elif job is not None and job.status == 'cancelled':
+            st.warning("Processing was cancelled.")
         
         # Navigation buttons
         col_back, _ = st.columns([1, 1])
@@ -673,7 +643,7 @@ with tab3:
         with col_back:
             if st.button("Back to Configure"):
                 st.session_state.step = 2
-                st.experimental_rerun()
+                st.rerun()
     
     else:
         st.info("Please upload a file and configure columns in the previous steps.")
@@ -683,49 +653,136 @@ with tab4:
     if st.session_state.processed and st.session_state.data is not None:
         st.header("Results & Export")
         
-        # Display the processed data
-        st.subheader("Processed Data Preview")
-        st.dataframe(st.session_state.data.head(10))
-        
-        if len(st.session_state.data) > 10:
+        if st.session_state.job_id:
+            st.caption(f"Job ID: {st.session_state.job_id}")
+        
+        # Status of every file and sheet of a batch
+        if st.session_state.batch_files is not None:
+            st.subheader("Files")
+            st.dataframe(batch_table(st.session_state.batch_files))
+            failed = [entry for entry in st.session_state.batch_files if entry['status'] == 'failed']
+            if failed:
+                st.warning(f"{len(failed)} files or sheets could not be processed; see the Error column.")
+        
+        # Display the processed data (a zipped batch has no single table to preview)
+        zipped = st.session_state.batch_files is not None and st.session_state.output_path.endswith('.zip')
+        if not zipped:
+            st.subheader("Processed Data Preview")
+            st.dataframe(st.session_state.data.head(10))
+        
+        if zipped:
+            st.info("Each file and sheet was written to its own file. Download the zip archive to get them all.")
+        elif st.session_state.output_path is not None:
+            st.info("Showing the first 10 rows. Download the file to view all data.")
+        elif len(st.session_state.data) > 10:
             st.info(f"Showing 10 of {len(st.session_state.data)} rows. Export to view all data.")
         
+        # Clusters of duplicate rows and their merged view
+        if st.session_state.get('merged_path') and os.path.exists(st.session_state.merged_path):
+            duplicates = st.session_state.duplicates
+            st.subheader("Duplicates")
+            st.write(
+                f"{duplicates['rows']} rows belong to {duplicates['clusters']} companies; "
+                f"{duplicates['duplicate_clusters']} of them have more than one row "
+                f"({duplicates['duplicate_rows']} duplicate rows)."
+            )
+            merged_extension = os.path.splitext(st.session_state.merged_path)[1]
+            merged = cleanup_io.read_preview(st.session_state.merged_path, st.session_state.merged_path, rows=1000)
+            st.dataframe(merged[pd.to_numeric(merged['Rows']) > 1].head(10))
+            with open(st.session_state.merged_path, 'rb') as merged_file:
+                st.download_button(
+                    f"Download Merged View ({merged_extension.lstrip('.').upper()})",
+                    merged_file,
+                    file_name=f"merged_data{merged_extension}"
+                )
+        
+        # How much work repeated values saved
+        if st.session_state.get('cache_summary'):
+            with st.expander("Repeated values"):
+                st.table(pd.DataFrame(st.session_state.cache_summary).T.rename(columns={
+                    'rows': 'Values', 'computed': 'Computed', 'hit_ratio': 'Reused'
+                }))
+        
         # Export options
         st.subheader("Export Options")
         
-        col_csv, col_excel = st.columns(2)
-        
-        with col_csv:
-            # Create a download button for CSV
-            csv = st.session_state.data.to_csv(index=False)
-            b64_csv = base64.b64encode(csv.encode()).decode()
-            href_csv = f'<a href="data:file/csv;base64,{b64_csv}" download="processed_data.csv" class="btn">Download CSV File</a>'
-            st.markdown(href_csv, unsafe_allow_html=True)
-        
-        with col_excel:
-            # Create a download button for Excel
-            buffer = BytesIO()
-            with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                st.session_state.data.to_excel(writer, index=False, sheet_name='Processed Data')
-            
-            buffer.seek(0)
-            b64_excel = base64.b64encode(buffer.read()).decode()
-            href_excel = f'<a href="data:application/vnd.openxmlformats-officedocument.spreadsheetml.sheet;base64,{b64_excel}" download="processed_data.xlsx" class="btn">Download Excel File</a>'
-            st.markdown(href_excel, unsafe_allow_html=True)
+        if st.session_state.output_path is not None:
+            # Large file mode already wrote the results to disk
+            output_extension = os.path.splitext(st.session_state.output_path)[1]
+            with open(st.session_state.output_path, 'rb') as output_file:
+                st.download_button(
+                    f"Download {output_extension.lstrip('.').upper()} File",
+                    output_file,
+                    file_name=f"processed_data{output_extension}"
+                )
+        else:
+            # Each export file is only written when it is asked for, then served
+            # from disk until the data is processed again
+            export_columns = st.columns(len(OUTPUT_FORMATS))
+            for export_format, export_column in zip(OUTPUT_FORMATS, export_columns):
+                label = EXPORT_LABELS[export_format]
+                with export_column:
+                    export_path = st.session_state.exports.get(export_format)
+                    if export_path is None and st.button(f"Prepare {label} File", key=f"prepare_{export_format}"):
+                        with st.spinner(f"Writing {label} file..."):
+                            export_fd, export_path = tempfile.mkstemp(suffix=f".{export_format}")
+                            os.close(export_fd)
+                            cleanup_io.export_dataframe(st.session_state.data, export_path, export_format)
+                        st.session_state.exports[export_format] = export_path
+                    
+                    if export_path is not None:
+                        with open(export_path, 'rb') as export_file:
+                            st.download_button(
+                                f"Download {label} File",
+                                export_file,
+                                file_name=f"processed_data.{export_format}",
+                                key=f"download_{export_format}"
+                            )
         
         # Navigation button
         if st.button("Process Another File"):
             # Reset session state
             st.session_state.data = None
+            st.session_state.original = None
+            st.session_state.derived = None
             st.session_state.processed = False
+            st.session_state.stream_file = None
+            st.session_state.load_mode = 'full'
+            if 'extra_columns' in st.session_state:
+                del st.session_state.extra_columns
+            clear_exports()
+            clear_batch()
+            st.session_state.batch_files = None
+            st.session_state.merged_path = None
+            # The job's results stay on disk and can be loaded again by job ID
+            st.session_state.output_path = None
+            st.session_state.job_id = None
+            st.session_state.loaded_job = None
             st.session_state.step = 1
             if 'column_mappings' in st.session_state:
                 del st.session_state.column_mappings
+            if 'upload_key' in st.session_state:
+                del st.session_state.upload_key
             
-            st.experimental_rerun()
+            st.rerun()
     
     else:
         st.info("Please process data in the previous step.")
+        
+        # Results of a job started earlier, e.g. before the page was closed
+        job_id = st.text_input("Or load the results of an earlier job by its ID:")
+        if job_id:
+            job = job_runner().get(job_id)
+            if job is None:
+                st.error("No job found with that ID.")
+            elif not job.is_finished:
+                st.info(f"Job {job.id} is still running: {job.message}")
+            elif job.status != 'done' or not os.path.exists(job.output_path):
+                st.error(f"The results of job {job.id} are not available ({job.error or job.status}).")
+            elif st.button("Load Results"):
+                load_job_results(job)
+                st.session_state.step = 4
+                st.rerun()
 
 # Highlight the current step
 if st.session_state.step == 1:
@@ -736,24 +793,3 @@ elif st.session_state.step == 3:
     tab3.title("3. Process Data")
 elif st.session_state.step == 4:
     tab4.title("4. Results & Export")
-
-# Add CSS for better styling
-st.markdown("""
-<style>
-    .btn {
-        display: inline-block;
-        padding: 0.5em 1em;
-        background-color: #4CAF50;
-        color: white;
-        text-align: center;
-        text-decoration: none;
-        font-size: 16px;
-        border-radius: 4px;
-        cursor: pointer;
-        margin: 4px 2px;
-    }
-    .btn:hover {
-        background-color: #45a049;
-    }
-</style>
-""", unsafe_allow_html=True)
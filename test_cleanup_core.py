@@ -0,0 +1,108 @@
+# Fixed cases for the cleanup_core functions, with the results the original
+# row-by-row functions of the app gave, so a change to the core shows up here
+# even where the engine still agrees with it.
+#
+#   python -m pytest -q
+import re
+import time
+
+import pytest
+
+from cleanup_benchmark import ADVERSARIAL_INPUTS, CELL_TIME_BUDGET, make_dataset
+from cleanup_core import city_dash_pattern, city_indicator_patterns, extract_city
+from cleanup_gazetteer import Gazetteer
+
+_COUNTRIES = (
+    'Colombia|Mexico|Brazil|Chile|Argentina|Peru|Ecuador|Venezuela|Uruguay|Paraguay|Bolivia|Panama|Guatemala|'
+    'El Salvador|Honduras|Nicaragua|Dominican Republic|Jamaica|Trinidad|Canada|Australia|New Zealand|Singapore|'
+    'South Korea|Japan|Israel|South Africa|Morocco|Egypt|Turkey|UAE|Saudi Arabia|Qatar|Kuwait|Bahrain|Oman|Jordan|UK'
+)
+
+# The city patterns as the app first had them, slow on long text but the
+# reference for what the rewritten ones find; group 1 holds the city
+ORIGINAL_CITY_PATTERNS = [re.compile(pattern, re.I) for pattern in [
+    r'\bCity:\s*([A-Z][a-zA-Z\s]+)(?=[\s,;]|$)',
+    r'\b([A-Z][a-zA-Z\s]+),\s*(?:City|Town|Village|Municipality)(?=[\s,;]|$)',
+    r'\b(?:City|Town|Village|Municipality)\s+of\s+([A-Z][a-zA-Z\s]+)(?=[\s,;]|$)',
+    r'\b([A-Z][a-zA-Z\s]+)(?=\s*-\s*(?:' + _COUNTRIES + r'))(?=[\s,;]|$)',
+    r'\b([A-Z][a-zA-Z]+)\s*-\s*[A-Za-z]+\b',
+]]
+
+PATTERN_CASES = [
+    "City: Springfield", "City:Springfield, IL", "Springfield, City", "Old Town Springfield, Town; x",
+    "12 Main St, Bath, Village", "Town of Bath", "The City of London Corporation", "Municipality of  San Juan, x",
+    "Medellin - Colombia", "Calle 50 # 20-15, Medellin - Colombia", "Cra 3 No 41-94 Bocas del Toro - Panama",
+    "Santo  Domingo -Dominican Republic", "abc - UK", "x-y", "Foo bar baz-qux 12", "City", "- Colombia", "",
+    "calle 3 bogota - colombia", "12 ab - cd - Peru", "Av 1: Lima - Peru, Lima",
+]
+
+# (address, country, city). Words of a known city only match when joined by
+# whitespace or the city's own punctuation; commas, bars and spaced dashes
+# between them leave the later heuristics to find what they find.
+CITY_CASES = [
+    ("Los, Angeles", "Chile", "Angeles"),
+    ("Av 1, Los Angeles", "Chile", "Los Angeles"),
+    ("Santo - Domingo", "Ecuador", "Santo"),
+    ("Buenos - Aires", "Argentina", "Buenos"),
+    ("Calle 3, Santo Domingo", "Ecuador", "Santo Domingo"),
+    ("Calle 8 | Santa Marta", "Colombia", "Santa Marta"),
+    ("Calle 8; Santa; Marta", "Colombia", "Calle"),
+    ("Savanna-la-Mar", "Jamaica", "Savanna-la-Mar"),
+    ("12 Main St, St. Anns Bay", "Jamaica", "St. Anns Bay"),
+    ("A'Ali, Block 3", "Bahrain", "A'Ali"),
+    ("Ras Al-Khaimah", "United Arab Emirates", "Ras Al-Khaimah"),
+    ("Medellin-Colombia", "Colombia", "Medellin"),
+    ("Calle 50 # 20-15, Medellin - Colombia", "Colombia", "Medellin"),
+    # Of the names starting at the same word, the one listed first
+    ("Santo Domingo Este", "Dominican Republic", "Santo Domingo"),
+]
+
+
+@pytest.mark.parametrize('address, country, city', CITY_CASES)
+def test_extract_city(address, country, city):
+    assert extract_city(address, country) == city
+
+
+def test_known_cities_come_back_as_stored():
+    assert extract_city("calle 5, bogota", "Colombia") == "Bogota"
+    assert extract_city("Av. Bolivar, Merida", "Venezuela") == "Mérida"
+
+
+def test_gazetteer_runs_end_at_separators():
+    gazetteer = Gazetteer.from_mapping({'X': ['Los Angeles', 'Angeles', 'Port-of-Spain']})
+    assert gazetteer.find("Los, Angeles", 'X') == "Angeles"
+    assert gazetteer.find("los  angeles", 'X') == "Los Angeles"
+    assert gazetteer.find("Port-of-Spain", 'X') == "Port-of-Spain"
+    assert gazetteer.find("Port of Spain | Los Angeles", 'X') == "Los Angeles"
+    assert gazetteer.find("Los - Angeles", 'X') == "Angeles"
+    assert gazetteer.find("Los; Angeles", 'X') == "Angeles"
+
+
+def _original_city(pattern, text):
+    match = pattern.search(text)
+    return match.group(1).strip() if match else None
+
+
+def _city(pattern, text):
+    match = pattern.search(text)
+    return match.group('city').strip() if match else None
+
+
+# The rewritten patterns find what the original ones found
+def test_city_patterns_match_the_original_ones():
+    texts = PATTERN_CASES + list(make_dataset(2000, seed=5)['Address'])
+    patterns = city_indicator_patterns() + (city_dash_pattern(),)
+    for original, pattern in zip(ORIGINAL_CITY_PATTERNS, patterns):
+        for text in texts:
+            assert _city(pattern, text) == _original_city(original, text), (pattern.pattern[:40], text)
+
+
+# ...and take time linear in the length of the text on the inputs that made
+# the original ones backtrack, even past the length extract_city cuts text to
+@pytest.mark.parametrize('name', ADVERSARIAL_INPUTS)
+def test_city_patterns_stay_fast(name):
+    text = ADVERSARIAL_INPUTS[name](100_000)
+    for pattern in city_indicator_patterns() + (city_dash_pattern(),):
+        started = time.perf_counter()
+        pattern.search(text)
+        assert time.perf_counter() - started < CELL_TIME_BUDGET, pattern.pattern[:40]
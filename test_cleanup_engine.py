@@ -0,0 +1,242 @@
+# Differential tests: the engine has to give exactly what the row-wise
+# cleanup_core functions give, called row by row like the original processing
+# loop (cleanup_benchmark.process_rows), on generated contact lists and on odd
+# cells, in one process or several, with and without the on-disk cache, on
+# compacted frames and through DerivedColumns. Both sides share cleanup_core,
+# so golden cases with the results of the app's original functions pin the
+# behaviour itself. Every test runs twice: with the pandas stages, and with
+# the row functions the engine calls for stages with few values to work out.
+#
+#   python -m pytest -q
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import cleanup_engine
+from cleanup_benchmark import make_dataset, process_rows
+from cleanup_engine import CacheStats, DerivedColumns, active_tasks, process_dataframe
+from cleanup_io import compact_frame
+
+MAPPINGS = {'email': 'Email', 'website': 'Website', 'address': 'Address', 'city': 'City',
+            'country': 'Country', 'logo': 'Logo'}
+
+# (email, website, country, address) and the email, address and city the
+# original validate_and_correct_email, cleanup_address and extract_city gave
+GOLDEN_ROWS = [
+    ("John.Doe@gmail.com", "www.acme.com", "Colombia", "Calle 50 # 20-15, Medellin - Colombia",
+     "john.doe@acme.com", "Calle 50 # 20-15", "Medellin"),
+    ("maria", "https://Shop.Example.co/path", "Chile", "Av Providencia 1234, Santiago",
+     "maria@shop.example.co", "Av Providencia 1234", "Santiago"),
+    ("sales@empresa.com.mx", "", "Mexico", "Paseo de la Reforma 222, Mexico City",
+     "sales@empresa.com.mx", "Paseo de la Reforma 222", "Mexico City"),
+    ("", "http://www.tienda.pe", "Peru", "Jr. de la Union 100, Lima", "", "Jr. de la Union 100", "Lima"),
+    ("info", "", "Brazil", "Rua Augusta 1500, Sao Paulo", "info@domain.br", "Rua Augusta 1500", "Sao Paulo"),
+    ("contact", "", "", "12 Main Street, Suite 4, Springfield", "contact@domain.com", "12 Main Street",
+     "Springfield"),
+    ("ventas@", "", "Argentina", "Av Corrientes 800, Buenos Aires", "ventas@domain.ar", "Av Corrientes 800",
+     "Corrientes"),
+    ("  Ana.Perez@Correo.COM ", "", "Unknownland", "P.O. Box 19, Fujairah", "ana.perez@correo.com", "P.O. Box 19",
+     "Fujairah"),
+    ("x@y", "", "Japan", "1-2-3 Shibuya, Tokyo", "x@domain.jp", "3 Shibuya", "Tokyo"),
+    ("", "", "Colombia", "Cra 7 No 32-16, Bogota", "", "7 No", "Bogota"),
+    ("ops@firm.co.uk", "firm.co.uk/about", "United Kingdom", "221B Baker Street, London", "ops@firm.co.uk",
+     "221B Baker Street", "London"),
+    ("hello", "WWW.Example.ORG", "Canada", "City: Toronto", "hello@example.org", "City: Toronto", "Toronto"),
+    ("a@b.c", "", "Ecuador", "Avenida Amazonas N34, Quito", "a@b.c", "Avenida Amazonas N34", "Quito"),
+    ("team", "", "United Arab Emirates", "Al Wasl Road, Dubai", "team@domain.ae", "Al Wasl Road", "Dubai"),
+    ("", "", "Costa Rica", "Town of Escazu", "", "Town of Escazu", "Escazu"),
+    ("boss", "", "Jamaica", "Springfield, City", "boss@domain.jm", "Springfield, City", "Springfield"),
+    ("desk", "", "Panama", "Edificio Torre, Piso 3", "desk@domain.pa", "Piso 3", "Edificio"),
+    ("admin", "", "Singapore", "Jalan Besar 5, Singapore", "admin@domain.sg", "Jalan Besar 5", "Singapore"),
+    ("help", "", "Israel", "Dizengoff 50 Tel Aviv", "help@domain.il", "50 Tel Aviv", "Tel Aviv"),
+    ("", "", "Turkey", "Istiklal Cd. No 10, Istanbul", "", "Istiklal Cd. No 10", "Istanbul"),
+    ("ops", "", "Chile", "Calle 5, Los, Angeles", "ops@domain.cl", "Calle 5", "Angeles"),
+    ("ops", "", "Ecuador", "Av 9 Santo - Domingo", "ops@domain.ec", "9 Santo", "Santo"),
+]
+
+# Websites and the logo URL the original extract_logo_from_website gave
+GOLDEN_LOGOS = {
+    "www.acme.com": "https://logo.clearbit.com/acme.com",
+    "https://Shop.Example.co/path": "https://logo.clearbit.com/shop.example.co",
+    "http://www.tienda.pe": "https://logo.clearbit.com/tienda.pe",
+    "firm.co.uk/about": "https://logo.clearbit.com/firm.co.uk",
+    "WWW.Example.ORG": "https://logo.clearbit.com/example.org",
+    "": "",
+}
+
+# Cells that are easy to get wrong: missing values, numbers, whitespace,
+# accents, broken emails and URLs, country codes, address shapes the patterns
+# single out, and a long free-text dump
+ODD_VALUES = [
+    None, np.nan, "", " ", "\t\n", 0, 42, 3.5, -1, True,
+    "Bogotá", "  medellín ", "MEDELLIN", "São Paulo", "Zürich", "東京", "😀 emoji",
+    "a@b@c", "@", "@domain.com", "user@", "no-at-sign", "Name.Surname@Example.COM ",
+    "HTTP://WWW.Example.COM/path?q=1", "www.x.co", "ftp://files.example.org", "https://", "example",
+    "CO", "col", " colombia ", "U.K.", "uk", "Perú", "Unknownland",
+    "Calle 50 # 20-15, Medellin - Colombia", "City: Springfield", "Springfield, City", "Town of Bath",
+    "12 Main Street, Suite 4", "P.O. Box 19, Fujairah", "Jalan Ampang 5", "Al Noor Street",
+    "1" + " " * 300 + "x", "Foo bar " * 400 + "- Colombia",
+]
+
+
+# A generated contact list with some cells of every column swapped for odd values
+def _odd_dataset(rows, seed):
+    data = make_dataset(rows, seed=seed).astype(object)
+    rng = random.Random(seed)
+    for column in data.columns:
+        for index in rng.sample(range(rows), rows // 5):
+            data.at[index, column] = rng.choice(ODD_VALUES)
+    return data
+
+
+def _assert_same(processed, expected, column_mappings):
+    for task in active_tasks(column_mappings):
+        column = column_mappings[task]
+        assert list(processed[column]) == list(expected[column]), f"{task} differs"
+
+
+# Worker processes are spawned and keep the default threshold
+@pytest.fixture(autouse=True, params=['vectorized', 'row functions'])
+def stage_functions(request, monkeypatch):
+    if request.param == 'vectorized':
+        monkeypatch.setattr(cleanup_engine, 'ROW_FUNCTION_VALUES', 0)
+    else:
+        monkeypatch.setattr(cleanup_engine, 'ROW_FUNCTION_VALUES', 1_000_000)
+
+
+@pytest.fixture(scope='module')
+def odd_data():
+    return _odd_dataset(1500, seed=7)
+
+
+@pytest.fixture(scope='module')
+def odd_expected(odd_data):
+    return process_rows(odd_data, MAPPINGS)
+
+
+def _golden_data():
+    data = pd.DataFrame([row[:4] for row in GOLDEN_ROWS], columns=['Email', 'Website', 'Country', 'Address'])
+    return data.assign(City=data['Address'], Logo=data['Website'])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_golden_rows(workers):
+    processed = process_dataframe(_golden_data(), MAPPINGS, workers=workers, chunk_size=7)
+    assert list(processed['Email']) == [row[4] for row in GOLDEN_ROWS]
+    assert list(processed['Address']) == [row[5] for row in GOLDEN_ROWS]
+    assert list(processed['City']) == [row[6] for row in GOLDEN_ROWS]
+    assert [GOLDEN_LOGOS[website] for website in _golden_data()['Website']] == list(processed['Logo'])
+
+
+def test_golden_rows_row_wise():
+    processed = process_rows(_golden_data(), MAPPINGS)
+    assert list(zip(processed['Email'], processed['Address'], processed['City'])) == [
+        row[4:] for row in GOLDEN_ROWS
+    ]
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_generated_lists_match_row_wise(seed):
+    data = make_dataset(1000, seed=seed)
+    _assert_same(process_dataframe(data, MAPPINGS), process_rows(data, MAPPINGS), MAPPINGS)
+
+
+def test_odd_cells_match_row_wise(odd_data, odd_expected):
+    _assert_same(process_dataframe(odd_data, MAPPINGS), odd_expected, MAPPINGS)
+
+
+# Every cell alone, so no value is hidden behind an earlier one in its column
+@pytest.mark.parametrize('value', ODD_VALUES, ids=lambda value: repr(value)[:20])
+def test_single_odd_cell_matches_row_wise(value):
+    data = pd.DataFrame({column: [value] for column in MAPPINGS.values()}, dtype=object)
+    _assert_same(process_dataframe(data, MAPPINGS), process_rows(data, MAPPINGS), MAPPINGS)
+
+
+@pytest.mark.parametrize('column_mappings', [
+    {'email': 'Email', 'website': 'Website'},
+    {'address': 'Address'},
+    {'address': 'Address', 'city': 'City', 'country': 'Country'},
+    {'website': 'Website', 'logo': 'Logo'},
+    {'email': 'Email', 'website': 'Website', 'country': 'Country', 'address': 'Address', 'city': 'Address'},
+])
+def test_partial_mappings_match_row_wise(odd_data, column_mappings):
+    _assert_same(process_dataframe(odd_data, column_mappings), process_rows(odd_data, column_mappings),
+                 column_mappings)
+
+
+def test_chunks_and_workers_match_one_pass(odd_data, odd_expected):
+    _assert_same(process_dataframe(odd_data, MAPPINGS, chunk_size=97), odd_expected, MAPPINGS)
+    _assert_same(process_dataframe(odd_data, MAPPINGS, workers=2, chunk_size=200), odd_expected, MAPPINGS)
+
+
+def test_cached_runs_match_uncached(odd_data, odd_expected, tmp_path):
+    cache_path = str(tmp_path / 'cache.sqlite3')
+    first, second = CacheStats(), CacheStats()
+    _assert_same(process_dataframe(odd_data, MAPPINGS, cache_path=cache_path, stats=first), odd_expected, MAPPINGS)
+    _assert_same(process_dataframe(odd_data, MAPPINGS, cache_path=cache_path, stats=second), odd_expected, MAPPINGS)
+    # The second run finds every address and city in the cache
+    assert first.counts['address'][1] > 0
+    assert second.counts['address'][1] == 0 and second.counts['city'][1] == 0
+    _assert_same(process_dataframe(odd_data, MAPPINGS, cache_path=cache_path, workers=2, chunk_size=300),
+                 odd_expected, MAPPINGS)
+
+
+def test_compact_frames_match(odd_data, odd_expected):
+    # compact_frame leaves columns with numbers mixed in alone, so compact the text-only list too
+    _assert_same(process_dataframe(compact_frame(odd_data), MAPPINGS), odd_expected, MAPPINGS)
+    data = make_dataset(1000, seed=3)
+    compact = compact_frame(data, category_columns=['Country'])
+    assert isinstance(compact['Country'].dtype, pd.CategoricalDtype)
+    _assert_same(process_dataframe(compact, MAPPINGS), process_rows(data, MAPPINGS), MAPPINGS)
+
+
+def test_derived_columns_recompute_only_stale_tasks(odd_data):
+    derived = DerivedColumns()
+    data = odd_data.assign(Other=odd_data['Address'].iloc[::-1].to_numpy())
+    _assert_same(derived.update(data, MAPPINGS), process_rows(data, MAPPINGS), MAPPINGS)
+    assert derived.stale_tasks(MAPPINGS) == []
+
+    # Mapping the address to another column makes only the tasks that read it stale
+    remapped = dict(MAPPINGS, address='Other')
+    assert derived.stale_tasks(remapped) == ['address', 'city']
+    _assert_same(derived.update(data, remapped), process_rows(data, remapped), remapped)
+
+
+def test_derived_columns_recompute_only_dirty_rows(odd_data):
+    derived = DerivedColumns()
+    derived.update(odd_data, MAPPINGS)
+    edited = odd_data.copy()
+    rows = [0, 5, 731, 1499]
+    edited.iloc[rows, edited.columns.get_loc('Address')] = ["Calle 1, Medellin", None, "P.O. Box 3, Fujairah", 7]
+    edited.iloc[[5, 6], edited.columns.get_loc('Email')] = ["New@Example.org", "broken@"]
+
+    derived.mark_dirty(rows, ['Address'])
+    derived.mark_dirty([5, 6], ['Email'])
+    assert sorted(derived.dirty) == ['address', 'city', 'email']
+    assert list(derived.dirty['address']) == rows
+    calls = []
+    result = derived.update(edited, MAPPINGS, progress_callback=lambda done, total, message: calls.append(total))
+    _assert_same(result, process_rows(edited, MAPPINGS), MAPPINGS)
+    # One run over the five edited rows, for the three tasks that read them
+    assert calls[-1] == 5 * 3
+    assert derived.dirty == {}
+
+
+# A job updates a copy while the app keeps reading the original
+def test_derived_columns_copies_are_updated_alone(odd_data):
+    derived = DerivedColumns()
+    derived.update(odd_data, {**MAPPINGS, 'logo': None})
+    derived.mark_dirty([3], ['Address'])
+    outputs = {task: values.copy() for task, (_, values) in derived.outputs.items()}
+    edited = odd_data.copy()
+    edited.iloc[3, edited.columns.get_loc('Address')] = "Calle 1, Medellin"
+
+    copy = derived.copy()
+    copy.update(edited, MAPPINGS)
+    assert derived.stale_tasks(MAPPINGS) == ['logo'] and copy.stale_tasks(MAPPINGS) == []
+    assert sorted(derived.dirty) == ['address', 'city'] and copy.dirty == {}
+    for task, values in outputs.items():
+        assert list(derived.outputs[task][1]) == list(values)
+    assert copy.outputs['city'][1][3] == "Medellin"
@@ -0,0 +1,37 @@
+# Background jobs with several workers share one process pool per number of
+# workers, kept up between jobs and shut down with the runner.
+#
+#   python -m pytest -q test_cleanup_jobs.py
+import cleanup_engine
+from cleanup_benchmark import make_dataset, process_rows
+from cleanup_jobs import JobRunner
+from cleanup_io import read_file
+
+MAPPINGS = {'email': 'Email', 'website': 'Website', 'address': 'Address', 'city': 'City',
+            'country': 'Country', 'logo': 'Logo'}
+
+
+def test_jobs_share_one_process_pool(tmp_path, monkeypatch):
+    pools = []
+    make_executor = cleanup_engine.make_executor
+
+    def counting(workers):
+        pools.append(make_executor(workers))
+        return pools[-1]
+
+    monkeypatch.setattr(cleanup_engine, 'make_executor', counting)
+    monkeypatch.setattr('cleanup_jobs.make_executor', counting)
+    data = make_dataset(400, seed=4)
+    data = data.assign(City=data['Address'], Logo=data['Website'])
+    runner = JobRunner(jobs_dir=str(tmp_path))
+    try:
+        jobs = [runner.submit_dataframe(data, MAPPINGS, workers=2, chunk_size=50) for _ in range(3)]
+        for job in jobs:
+            job.future.result()
+            assert job.status == 'done', job.error
+            processed = read_file(job.output_path, job.output_path)
+            assert list(processed['City']) == list(process_rows(data, MAPPINGS)['City'])
+        assert len(pools) == 1
+    finally:
+        runner.shutdown()
+    assert pools[0]._shutdown_thread
@@ -0,0 +1,143 @@
+# Logo discovery against stub websites on 127.0.0.1: logos found through
+# redirects, pages without a logo, servers that send their page too slowly and
+# pages far bigger than the part that is read.
+#
+#   python -m pytest -q test_cleanup_logos.py
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from cleanup_logos import MAX_PAGE_BYTES, LogoFinder, clearbit_url
+
+LOGO_PAGE = b'<html><head><link rel="icon" href="/favicon.ico"></head><body><img class="site-logo" src="/img/logo.png"></body></html>'
+
+
+# Stub website: pages maps a path to (status, headers, body), or to a
+# function that writes the whole response itself
+def _handler(pages):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            page = pages.get(self.path)
+            if page is None:
+                page = (404, {}, b'not found')
+            if callable(page):
+                page(self)
+                return
+            status, headers, body = page
+            self.send_response(status)
+            for name, value in {'Content-Type': 'text/html', **headers}.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def website():
+    servers = []
+
+    # Start a stub website and return its domain ("127.0.0.1:port")
+    def start(pages):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _handler(pages))
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _finder(**options):
+    return LogoFinder(workers=4, timeout=(2, 2), host_interval=0, schemes=('http',), **options)
+
+
+def test_logo_found_after_redirects(website):
+    # A relative redirect, then an absolute one to another site
+    target = website({'/en/': (200, {}, LOGO_PAGE)})
+    domain = website({'/': (301, {'Location': '/home'}, b''),
+                      '/home': (302, {'Location': f'http://{target}/en/'}, b'')})
+    assert _finder().find(domain) == f"http://{target}/img/logo.png"
+
+
+def test_redirect_loops_give_up(website):
+    domain = website({'/': (302, {'Location': '/'}, b'')})
+    assert _finder().find(domain) == clearbit_url(domain)
+
+
+def test_page_without_logo_falls_back_to_clearbit(website):
+    plain = website({'/': (200, {}, b'<html><body><p>Hello</p></body></html>')})
+    missing = website({})
+    not_html = website({'/': (200, {'Content-Type': 'application/json'}, b'{"logo": "x"}')})
+    logos = _finder().find_many([plain, missing, not_html, plain, ""])
+    assert logos == {plain: clearbit_url(plain), missing: clearbit_url(missing),
+                     not_html: clearbit_url(not_html), "": ""}
+
+
+def test_slow_server_is_cut_off_by_the_domain_budget(website):
+    # Headers at once, then a byte every 0.1 s: each read is well within the
+    # read timeout, so only the budget for the whole domain stops it
+    def drip(handler):
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/html')
+        handler.send_header('Content-Length', '100000')
+        handler.end_headers()
+        try:
+            for _ in range(100000):
+                handler.wfile.write(b' ')
+                handler.wfile.flush()
+                time.sleep(0.1)
+        except OSError:
+            pass
+
+    domain = website({'/': drip})
+    started = time.monotonic()
+    assert _finder(domain_budget=1.0).find(domain) == clearbit_url(domain)
+    assert time.monotonic() - started < 2.5
+
+
+def test_only_the_start_of_big_pages_is_read(website):
+    padding = b'<p>' + b'x' * (4 * MAX_PAGE_BYTES) + b'</p>'
+    top = website({'/': (200, {}, LOGO_PAGE + padding)})
+    bottom = website({'/': (200, {}, b'<html><body>' + padding + b'<img class="logo" src="/late.png"></body></html>')})
+    finder = _finder()
+    assert finder.find(top) == f"http://{top}/img/logo.png"
+    assert finder.find(bottom) == clearbit_url(bottom)
+
+
+def test_results_are_capped_least_recently_used_first(website):
+    domains = [website({'/': (200, {}, LOGO_PAGE)}) for _ in range(3)]
+    finder = _finder(max_results=2)
+    finder.find(domains[0])
+    finder.find(domains[1])
+    finder.find(domains[0])
+    finder.find(domains[2])
+    assert list(finder._results) == [domains[0], domains[2]]
+    # Every domain asked for is answered, even when more than the cap
+    assert finder.find_many(domains) == {domain: f"http://{domain}/img/logo.png" for domain in domains}
+
+
+def test_unexpected_errors_only_lose_that_domain(website, monkeypatch):
+    good = website({'/': (200, {}, LOGO_PAGE)})
+    bad = website({'/': (200, {}, LOGO_PAGE)})
+    finder = _finder()
+    fetch_page = finder.fetch_page
+
+    def failing(url, deadline=None):
+        if bad in url:
+            raise AttributeError("read1")
+        return fetch_page(url, deadline)
+
+    monkeypatch.setattr(finder, 'fetch_page', failing)
+    assert finder.find_many([good, bad]) == {good: f"http://{good}/img/logo.png", bad: clearbit_url(bad)}
@@ -0,0 +1,39 @@
+# The service's micro-batching: small concurrent requests are run through the
+# engine together and each gets back its own records, cleaned like
+# clean_record cleans them one by one.
+#
+#   python -m pytest -q test_cleanup_service.py
+import cleanup_service
+from cleanup_benchmark import make_dataset
+from cleanup_engine import TASKS
+from cleanup_service import MicroBatcher, clean_record
+
+
+def _records(rows, seed):
+    data = make_dataset(rows, seed=seed)
+    return [
+        {'email': row['Email'], 'website': row['Website'], 'address': row['Address'], 'country': row['Country']}
+        for row in data.to_dict('records')
+    ]
+
+
+def test_small_requests_are_coalesced_into_one_engine_batch(monkeypatch):
+    batches = []
+    process_dataframe = cleanup_service.process_dataframe
+
+    def counting(data, *args, **kwargs):
+        batches.append(len(data))
+        return process_dataframe(data, *args, **kwargs)
+
+    monkeypatch.setattr(cleanup_service, 'process_dataframe', counting)
+    requests = [_records(10, seed) for seed in range(5)]
+    # Each request is under the row-wise threshold, the batch they make is not
+    batcher = MicroBatcher(max_batch_rows=50, max_wait=5.0)
+    try:
+        futures = [batcher.submit(records) for records in requests]
+        results = [future.result(timeout=30) for future in futures]
+    finally:
+        batcher.close()
+
+    assert batches == [50]
+    assert results == [[clean_record(record, TASKS) for record in records] for records in requests]